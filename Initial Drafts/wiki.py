@@ -13,16 +13,19 @@ Tech Stack:
 Install:
     pip install streamlit folium streamlit-folium requests
 
-Run:
-    streamlit run wandermind.py
+Run (geocoding is the Streamlit app's itinerary_engine, shared with the other apps):
+    PYTHONPATH=../Streamlit streamlit run wiki.py
 """
 
-import json, time, re, math
+import json, re, math
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import folium
 from folium.plugins import AntPath, MeasureControl
 import streamlit as st
 from streamlit_folium import st_folium
+from itinerary_engine import geocode_query, get_cache_metrics, get_geocode_store, metered_lru_cache
 
 # ─────────────────────────────────────────────────────────────
 # PAGE CONFIG
@@ -251,28 +254,60 @@ PLACE_EMOJIS = {
     "neighborhood": "🏘️", "default": "📍",
 }
 
+# Pooled keep-alive HTTP for the LLM providers (geocoding uses the engine's pool)
+HTTP_POOL_SIZE = 16
+HTTP_KEEP_ALIVE = True
+HTTP_MAX_RETRIES = 3
+HTTP_RETRY_BACKOFF_SEC = 0.5
+
+# In-process geocode cache, reported to the engine's cache metrics as
+# GEOCODE_LAYER. Behind it sits the persistent store shared with the other
+# apps, with its own per-entry TTLs.
+GEOCODE_LAYER = "geocode"
+GEOCODE_CACHE_SIZE = 4096
+
 
 # ─────────────────────────────────────────────────────────────
-# GEOCODING (Nominatim / OpenStreetMap)
+# HTTP SESSION POOL
 # ─────────────────────────────────────────────────────────────
-@st.cache_data(ttl=3600, show_spinner=False)
+@st.cache_resource(show_spinner=False)
+def get_http_session() -> requests.Session:
+    """Process-wide pooled session; retries only connection errors and GETs."""
+    retry = Retry(total=HTTP_MAX_RETRIES, backoff_factor=HTTP_RETRY_BACKOFF_SEC,
+                  status_forcelist=(429, 500, 502, 503, 504), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE,
+                          max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["Connection"] = "keep-alive" if HTTP_KEEP_ALIVE else "close"
+    return session
+
+
+# ─────────────────────────────────────────────────────────────
+# GEOCODING (gazetteer / shared store / Nominatim)
+# ─────────────────────────────────────────────────────────────
+@st.cache_resource(show_spinner=False)
+def get_geocode_lookup():
+    """Metered LRU built once per process; the script body re-runs on every interaction."""
+
+    @metered_lru_cache(GEOCODE_LAYER, maxsize=GEOCODE_CACHE_SIZE)
+    def lookup(place: str, city: str):
+        for query in [f"{place}, {city}", f"{place}"]:
+            try:
+                coords = geocode_query(query)
+            except Exception:
+                coords = None
+            if coords:
+                return coords
+        return None
+
+    return lookup
+
+
 def geocode(place: str, city: str):
-    """Geocode a place using Nominatim. Returns (lat, lon) or None."""
-    for query in [f"{place}, {city}", f"{place}"]:
-        try:
-            r = requests.get(
-                "https://nominatim.openstreetmap.org/search",
-                params={"q": query, "format": "json", "limit": 1},
-                headers={"User-Agent": "WanderMind-App/1.0", "Accept-Language": "en"},
-                timeout=8,
-            )
-            data = r.json()
-            if data:
-                return float(data[0]["lat"]), float(data[0]["lon"])
-        except Exception:
-            pass
-        time.sleep(0.3)
-    return None
+    """Geocode a place (gazetteer, shared store, then Nominatim). Returns (lat, lon) or None."""
+    return get_geocode_lookup()(place, city)
 
 
 def haversine(lat1, lon1, lat2, lon2):
@@ -296,7 +331,7 @@ def walk_time_min(meters: float) -> int:
 def call_llm(prompt: str, provider: str, config: dict) -> str:
     """Route to the correct LLM provider."""
     if provider == "ollama":
-        r = requests.post(
+        r = get_http_session().post(
             config["url"].rstrip("/") + "/api/chat",
             json={"model": config["model"],
                   "messages": [{"role": "user", "content": prompt}],
@@ -308,7 +343,7 @@ def call_llm(prompt: str, provider: str, config: dict) -> str:
         return d.get("message", {}).get("content") or d.get("response", "")
 
     elif provider == "openrouter":
-        r = requests.post(
+        r = get_http_session().post(
             "https://openrouter.ai/api/v1/chat/completions",
             headers={"Authorization": f"Bearer {config['key']}",
                      "Content-Type": "application/json"},
@@ -320,7 +355,7 @@ def call_llm(prompt: str, provider: str, config: dict) -> str:
         return r.json()["choices"][0]["message"]["content"]
 
     elif provider == "lmstudio":
-        r = requests.post(
+        r = get_http_session().post(
             config["url"].rstrip("/") + "/v1/chat/completions",
             json={"messages": [{"role": "user", "content": prompt}], "temperature": 0.7},
             timeout=180,
@@ -332,7 +367,7 @@ def call_llm(prompt: str, provider: str, config: dict) -> str:
         hdrs = {"Content-Type": "application/json"}
         if config.get("key"):
             hdrs["Authorization"] = f"Bearer {config['key']}"
-        r = requests.post(
+        r = get_http_session().post(
             config["url"].rstrip("/") + "/chat/completions",
             headers=hdrs,
             json={"model": config.get("model", ""),
@@ -453,7 +488,6 @@ def build_folium_map(itinerary: dict, dest: str) -> tuple:
             done += 1
             progress.progress(done / total_stops,
                               text=f"📍 Geocoding: {stop['name']}…")
-            time.sleep(0.35)  # Nominatim rate limit
 
             if coords:
                 day_coords.append(coords)
@@ -599,6 +633,15 @@ with st.sidebar:
             llm_config["key"]   = st.text_input("API Key", type="password")
             llm_config["model"] = st.text_input("Model Name")
 
+    with st.expander("📊 Cache metrics", expanded=False):
+        metrics_report = get_cache_metrics().snapshot()
+        metrics_report["geocode_store"] = get_geocode_store().stats()
+        st.json(metrics_report["layers"])
+        st.caption("Persistent geocode store (all apps)")
+        st.json(metrics_report["geocode_store"])
+        st.download_button("⬇ Download metrics (JSON)", json.dumps(metrics_report, indent=2),
+                           file_name="cache_metrics.json", mime="application/json")
+
     st.markdown("---")
     generate = st.button("✈ Plan My Trip")
 
@@ -4,27 +4,101 @@ from streamlit_folium import st_folium
 from streamlit.components.v1 import html
 from datetime import datetime, timedelta
 from dataclasses import dataclass, field
-from typing import List, Dict, Optional
-from functools import lru_cache
-from pathlib import Path
+from typing import List, Dict, Optional, Iterator, Callable, Tuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import hashlib
 import json
 import math
 import re
-import requests
+import threading
+import time
+
+from itinerary_engine import (
+    DEFAULT_MODEL,
+    DEFAULT_SLOT_WINDOWS,
+    FlightCancelled,
+    GEOCODE_STORE_LAYER,
+    ITINERARY_CACHE,
+    ITINERARY_SCHEMA_EXAMPLE,
+    ITINERARY_TOKENS_BASE,
+    OLLAMA_TIMEOUT_SEC,
+    OLLAMA_URL,
+    REPLAN_CACHE,
+    REPLAN_GEO_LAYER,
+    SLOT_ORDER,
+    _extract_json_block,
+    _normalize_interests,
+    build_itinerary_prompt,
+    build_ollama_payload,
+    call_ollama,
+    cache_metrics_report,
+    generate_itinerary_record,
+    geocode_destination,
+    geocode_itinerary_stops,
+    geocode_place,
+    get_cache_metrics,
+    get_cache_store,
+    get_geocode_store,
+    get_http_session,
+    get_llm_router,
+    get_single_flight,
+    itinerary_output_format,
+    itinerary_token_budget,
+    load_cached_record,
+    load_itinerary_geocodes,
+    lookup_itinerary_record,
+    make_cache_key,
+    ollama_generate,
+    parse_and_validate_json_from_llm,
+    repair_itinerary_json_with_ollama,
+    replan_token_budget,
+    safe_hhmm,
+    save_itinerary_geocodes,
+    save_itinerary_to_cache,
+    stream_ollama,
+    summarize_json_modes,
+    validate_and_normalize_itinerary_json,
+)
 
 # ============================================================
 # CONFIG
 # ============================================================
-OLLAMA_URL = "http://localhost:11434/api/generate"
+# Ollama, LLM routing, token budgets, cache locations and the HTTP pool are
+# configured in itinerary_engine.py; the settings below only affect the app.
 OLLAMA_TAGS_URL = "http://localhost:11434/api/tags"
-DEFAULT_MODEL = "llama3:latest"
-OLLAMA_TIMEOUT_SEC = 600
-
-CACHE_DIR = Path("itinerary_cache")
-CACHE_DIR.mkdir(exist_ok=True)
-CACHE_JSONL = CACHE_DIR / "ollama_itineraries.jsonl"
-REPLAN_CACHE_JSONL = CACHE_DIR / "replanned_itineraries.jsonl"
+OLLAMA_STREAM_ITINERARY = True
+# Trips at least this long are generated one day per request, concurrently
+OLLAMA_PARALLEL_DAYS_MIN = 7
+OLLAMA_PARALLEL_MAX_WORKERS = 4
+# Background refresher that re-pings the model during business hours
+# (local time, [start, end) hour) so OLLAMA_KEEP_ALIVE never runs out
+OLLAMA_KEEP_WARM_HOURS = (8, 22)
+OLLAMA_KEEP_WARM_INTERVAL_SEC = 600
+# A model no session has selected for this long stops being refreshed
+OLLAMA_KEEP_WARM_IDLE_SEC = 3600
+# Background /api/tags poller; the sidebar only reads its cached snapshot
+OLLAMA_HEALTH_POLL_SEC = 15
+OLLAMA_HEALTH_TTL_SEC = 60
+OLLAMA_HEALTH_TIMEOUT_SEC = 3
+# Output-token ceilings (Ollama num_predict) for the app-only call sites
+AREA_PLAN_TOKENS_PER_DAY = 90
+REVIEW_REPLACE_TOKENS = 600
+TRIP_CONTEXT_PRIME_TOKENS = 8
+
+# Per-cache bounds enforced by the background compactor (None = unbounded):
+# records older than ttl_days go first, then least-recently-used ones
+CACHE_LIMITS = {
+    ITINERARY_CACHE: {"max_entries": 5000, "max_bytes": 256 * 1024 * 1024, "ttl_days": 180},
+    REPLAN_CACHE: {"max_entries": 20000, "max_bytes": 64 * 1024 * 1024, "ttl_days": 30},
+}
+CACHE_COMPACT_INTERVAL_SEC = 900
+# Replans are also filed under the anchor's geohash cell + detected intent; a
+# miss reuses suggestions cached around anchors in the same or a neighbouring
+# cell within the distance cap, nearest anchor first. Precision 6 cells are
+# ~1.2 x 0.6 km, so the 3x3 block covers the cap anywhere below 60° latitude
+REPLAN_GEO_PRECISION = 6
+REPLAN_GEO_MAX_DISTANCE_M = 600
+REPLAN_GEO_MIN_SUGGESTIONS = 3
 
 # ============================================================
 # PAGE CONFIG
@@ -328,8 +402,11 @@ def initialize_session_state():
         "ollama_model": DEFAULT_MODEL,
         "llama_raw_output": "",
         "llama_pretty_text": "",
+        "llama_plan": None,
         "llama_cache_hit": False,
+        "llama_near_hit": False,
         "llama_saved_ok": False,
+        "llama_repair_used": False,
         "base_location": None,
         "sim_speed_mps": 35.0,
 
@@ -342,7 +419,10 @@ def initialize_session_state():
         "replan_selected_suggestions": [],
         "replan_checkbox_states": {},
         "replan_cache_hit": False,
+        "replan_geo_hit": False,
         "replan_saved_ok": False,
+        "replan_trip_contexts": {},
+        "replan_prompt_eval": None,
         # review edit state
         "review_edit_open_loc_id": None,
         "review_replace_mode_by_loc": {},
@@ -384,15 +464,7 @@ PACE_SETTINGS = {
     "Fast-paced": {"duration_multiplier": 0.85},
 }
 
-SLOT_ORDER = ["Morning", "Lunch", "Afternoon", "Evening", "Dinner"]
 
-DEFAULT_SLOT_WINDOWS = {
-    "Morning": ("08:30", "12:00"),
-    "Lunch": ("12:30", "13:30"),
-    "Afternoon": ("13:45", "17:30"),
-    "Evening": ("18:00", "20:00"),
-    "Dinner": ("20:00", "21:30"),
-}
 
 
 # ============================================================
@@ -406,12 +478,6 @@ def fmt_hhmm(dt: datetime) -> str:
     return dt.strftime("%H:%M")
 
 
-def safe_hhmm(s: str, fallback: str) -> str:
-    if isinstance(s, str) and re.match(r"^\d{2}:\d{2}$", s):
-        return s
-    return fallback
-
-
 def calculate_distance(lat1, lon1, lat2, lon2):
     R = 6371000
     phi1 = math.radians(lat1)
@@ -434,6 +500,61 @@ def estimate_travel_buffer_minutes(lat1, lon1, lat2, lon2):
     return 30
 
 
+GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(lat: float, lon: float, precision: int) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    cell, bits, bit_count, use_lon = [], 0, 0, True
+    while len(cell) < precision:
+        rng, value = (lon_range, lon) if use_lon else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        use_lon = not use_lon
+        bit_count += 1
+        if bit_count == 5:
+            cell.append(GEOHASH_BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(cell)
+
+
+def geohash_bounds(cell: str) -> Tuple[float, float, float, float]:
+    """(lat_min, lat_max, lon_min, lon_max) of a geohash cell."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    use_lon = True
+    for ch in cell:
+        bits = GEOHASH_BASE32.index(ch)
+        for shift in range(4, -1, -1):
+            rng = lon_range if use_lon else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if bits >> shift & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            use_lon = not use_lon
+    return lat_range[0], lat_range[1], lon_range[0], lon_range[1]
+
+
+def geohash_neighbors(cell: str) -> List[str]:
+    """The cell itself plus the (up to) 8 cells around it."""
+    lat_min, lat_max, lon_min, lon_max = geohash_bounds(cell)
+    lat, lon = (lat_min + lat_max) / 2, (lon_min + lon_max) / 2
+    dlat, dlon = lat_max - lat_min, lon_max - lon_min
+    cells = {cell}
+    for i in (-1, 0, 1):
+        for j in (-1, 0, 1):
+            nlat = lat + i * dlat
+            if -90 <= nlat <= 90:
+                nlon = (lon + j * dlon + 180) % 360 - 180
+                cells.add(geohash_encode(nlat, nlon, len(cell)))
+    return sorted(cells)
+
+
 def get_total_locations() -> int:
     return sum(len(d.locations) for d in st.session_state.itinerary.values()) if st.session_state.itinerary else 0
 
@@ -584,52 +705,80 @@ def filter_replan_suggestions_by_intent(suggestions: list, intent: str) -> list:
 # ============================================================
 # CACHE HELPERS
 # ============================================================
-def _normalize_interests(interests: List[str]) -> List[str]:
-    return sorted([i.strip() for i in interests if i and i.strip()])
-
-
-def _normalize_locations(locations: List[str]) -> List[str]:
-    return sorted([x.strip().lower() for x in locations if x and x.strip()])
-
-
-def make_cache_key(destination: str, days: int, interests: List[str], model: str, pace: str,
-                   must_visit_locations: List[str]) -> str:
-    base = {
-        "destination": destination.strip().lower(),
-        "days": int(days),
-        "interests": _normalize_interests(interests),
-        "model": model.strip().lower(),
-        "pace": pace.strip().lower(),
-        "must_visit_locations": _normalize_locations(must_visit_locations),
-        "schema_version": 4
-    }
-    s = json.dumps(base, sort_keys=True)
-    return hashlib.md5(s.encode("utf-8")).hexdigest()
-
-
-def load_cached_record(cache_key: str) -> Optional[dict]:
-    if not CACHE_JSONL.exists():
-        return None
+def compact_caches() -> Dict[str, dict]:
+    store = get_cache_store()
+    results = {}
+    for cache, limits in CACHE_LIMITS.items():
+        results[cache] = store.compact(
+            cache,
+            max_entries=limits.get("max_entries"),
+            max_bytes=limits.get("max_bytes"),
+            ttl_sec=limits["ttl_days"] * 86400 if limits.get("ttl_days") else None
+        )
+        get_cache_metrics().record_evictions(cache, results[cache]["expired"] + results[cache]["evicted"])
+    results["geocode"] = {"expired": get_geocode_store().purge_expired(), "evicted": 0}
+    get_cache_metrics().record_evictions(GEOCODE_STORE_LAYER, results["geocode"]["expired"])
+    return results
+
+
+@st.cache_resource(show_spinner=False)
+def start_cache_compactor() -> dict:
+    """
+    Started once per server process. Applies CACHE_LIMITS every
+    CACHE_COMPACT_INTERVAL_SEC on a daemon thread; lookups keep running meanwhile.
+    Returns the shared stats dict the sidebar reads.
+    """
+    stats = {"runs": 0, "last_run": None, "expired": 0, "evicted": 0, "error": ""}
+
+    def loop():
+        while True:
+            try:
+                for result in compact_caches().values():
+                    stats["expired"] += result["expired"]
+                    stats["evicted"] += result["evicted"]
+                stats["runs"] += 1
+                stats["last_run"] = datetime.now().isoformat(timespec="seconds")
+                stats["error"] = ""
+            except Exception as e:
+                stats["error"] = str(e)
+            time.sleep(CACHE_COMPACT_INTERVAL_SEC)
+
+    threading.Thread(target=loop, name="cache-compactor", daemon=True).start()
+    return stats
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def summarize_repair_rate() -> Dict[str, dict]:
+    """
+    Generations, repairs and parse failures per JSON mode, from the counters
+    kept as records are written. Records written before repair tracking
+    existed are grouped as "untracked".
+    """
     try:
-        with open(CACHE_JSONL, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                rec = json.loads(line)
-                if rec.get("cache_key") == cache_key:
-                    return rec
+        return summarize_json_modes()
     except Exception:
-        return None
-    return None
+        return {}
+
+
+@st.cache_data(ttl=15, show_spinner=False)
+def summarize_cache_stores() -> dict:
+    """
+    Sizes, reuse counters and the geocode hit rate shown in the sidebar. Cached
+    briefly so a rerun does not query both SQLite stores (geocode stats() also
+    flushes its pending counters, a write).
+    """
+    store = get_cache_store()
+    return {
+        "caches": {cache: store.stats(cache) for cache in CACHE_LIMITS},
+        "counters": store.counters(),
+        "geocode": get_geocode_store().stats()["all_time"],
+    }
 
 
-def append_cache_record(record: dict) -> None:
-    try:
-        with open(CACHE_JSONL, "a", encoding="utf-8") as f:
-            f.write(json.dumps(record, ensure_ascii=False) + "\n")
-    except Exception:
-        pass
+@st.cache_data(ttl=15, show_spinner=False)
+def cached_cache_metrics_report() -> dict:
+    """cache_metrics_report() for the sidebar expander, which would otherwise rebuild it (SQLite included) on every rerun."""
+    return cache_metrics_report()
 
 
 def make_replan_cache_key(
@@ -659,206 +808,272 @@ def make_replan_cache_key(
 
 
 def load_replan_cached_record(cache_key: str) -> Optional[dict]:
-    if not REPLAN_CACHE_JSONL.exists():
-        return None
     try:
-        with open(REPLAN_CACHE_JSONL, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                rec = json.loads(line)
-                if rec.get("cache_key") == cache_key:
-                    return rec
+        return get_cache_store().get(REPLAN_CACHE, cache_key)
     except Exception:
         return None
-    return None
 
 
-def append_replan_cache_record(record: dict) -> None:
+def append_replan_cache_record(record: dict, group_key: Optional[str] = None) -> None:
     try:
-        with open(REPLAN_CACHE_JSONL, "a", encoding="utf-8") as f:
-            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        get_cache_store().put(REPLAN_CACHE, record["cache_key"], record, group_key)
     except Exception:
         pass
 
 
-# ============================================================
-# GEOCODING / OLLAMA
-# ============================================================
-@lru_cache(maxsize=256)
-def geocode_destination(destination: str):
-    url = "https://nominatim.openstreetmap.org/search"
-    params = {"q": destination, "format": "json", "limit": 1}
-    headers = {"User-Agent": "ai-travel-planner-streamlit/6.0"}
-    r = requests.get(url, params=params, headers=headers, timeout=30)
-    r.raise_for_status()
-    data = r.json()
-    if not data:
-        return None
-    return float(data[0]["lat"]), float(data[0]["lon"])
-
-
-@lru_cache(maxsize=4096)
-def geocode_place(place_query: str):
-    url = "https://nominatim.openstreetmap.org/search"
-    params = {"q": place_query, "format": "json", "limit": 1}
-    headers = {"User-Agent": "ai-travel-planner-streamlit/6.0"}
-    r = requests.get(url, params=params, headers=headers, timeout=30)
-    r.raise_for_status()
-    data = r.json()
-    if not data:
-        return None
-    return float(data[0]["lat"]), float(data[0]["lon"])
-
-
-def ollama_available(model_name: str) -> bool:
-    try:
-        r = requests.get(OLLAMA_TAGS_URL, timeout=10)
-        if r.status_code != 200:
-            return False
-        models = [m.get("name") for m in r.json().get("models", [])]
-        return model_name in models
-    except Exception:
-        return False
-
-
-def call_ollama(prompt: str, model_name: str) -> str:
-    r = requests.post(
-        OLLAMA_URL,
-        json={"model": model_name, "prompt": prompt, "stream": False},
-        timeout=OLLAMA_TIMEOUT_SEC
-    )
-    if r.status_code != 200:
-        raise RuntimeError(f"Ollama error: {r.status_code} - {r.text}")
-    return r.json().get("response", "")
-
+def replan_geo_group_key(cell: str, intent: str, model_name: str) -> str:
+    base = {"geohash": cell, "intent": intent, "model": normalize_replan_text(model_name)}
+    return hashlib.md5(json.dumps(base, sort_keys=True).encode("utf-8")).hexdigest()
 
-def _extract_json_block(text: str) -> Optional[str]:
-    if not text:
-        return None
-
-    m = re.search(r"```json\s*(\{.*?\}|\[.*?\])\s*```", text, flags=re.S)
-    if m:
-        return m.group(1)
-
-    first_brace = text.find("{")
-    first_bracket = text.find("[")
-    if first_brace == -1 and first_bracket == -1:
-        return None
 
-    start = first_brace if first_bracket == -1 else (
-        first_bracket if first_brace == -1 else min(first_brace, first_bracket)
-    )
-    candidate = text[start:].strip()
-    last_curly = candidate.rfind("}")
-    last_square = candidate.rfind("]")
-    cut = max(last_curly, last_square)
-    if cut != -1:
-        candidate = candidate[:cut + 1]
-    return candidate.strip()
+def find_geo_replan_suggestions(
+        anchor_lat: float,
+        anchor_lon: float,
+        intent: str,
+        model_name: str,
+        exclude_names: List[str],
+        n: int
+) -> List[dict]:
+    """
+    Suggestions cached for the same intent around anchors in this geohash cell
+    or a neighbouring one, at most REPLAN_GEO_MAX_DISTANCE_M away. Ranked by
+    the distance of the anchor they were generated for (newest first on ties);
+    duplicates and names in exclude_names are dropped.
+    """
+    store = get_cache_store()
+    sources = []
+    for cell in geohash_neighbors(geohash_encode(anchor_lat, anchor_lon, REPLAN_GEO_PRECISION)):
+        for rec in store.find_group(REPLAN_CACHE, replan_geo_group_key(cell, intent, model_name)):
+            dist = calculate_distance(anchor_lat, anchor_lon, rec["anchor_lat"], rec["anchor_lon"])
+            if dist <= REPLAN_GEO_MAX_DISTANCE_M:
+                sources.append((dist, rec.get("created_at", ""), rec))
+
+    sources.sort(key=lambda s: s[1], reverse=True)
+    sources.sort(key=lambda s: s[0])
+
+    seen = {normalize_replan_text(name) for name in exclude_names}
+    picked = []
+    for _, _, rec in sources:
+        for suggestion in rec["replan_result"].get("suggestions", []):
+            name = normalize_replan_text(suggestion.get("name", ""))
+            if name and name not in seen:
+                seen.add(name)
+                picked.append(suggestion)
+    return picked[:n]
 
 
 # ============================================================
-# VALIDATION
+# OLLAMA
 # ============================================================
-def validate_and_normalize_itinerary_json(plan: dict, requested_days: int) -> dict:
-    normalized = {"overview": "", "days": []}
-    if not isinstance(plan, dict):
-        raise ValueError("Plan is not a dictionary.")
-
-    overview = plan.get("overview", "")
-    normalized["overview"] = overview if isinstance(overview, str) else ""
-
-    days_list = plan.get("days", [])
-    if not isinstance(days_list, list):
-        raise ValueError("Plan 'days' must be a list.")
-
-    day_map = {}
-    for day_obj in days_list:
-        if not isinstance(day_obj, dict):
-            continue
-
+class OllamaHealthMonitor:
+    """
+    Polls /api/tags on a background thread and caches readiness plus the
+    pulled model list. Readers never block on the network; a snapshot older
+    than OLLAMA_HEALTH_TTL_SEC is reported as unknown rather than trusted.
+    """
+
+    def __init__(self, tags_url: str, interval_sec: float, ttl_sec: float):
+        self.tags_url = tags_url
+        self.interval_sec = interval_sec
+        self.ttl_sec = ttl_sec
+        self._lock = threading.Lock()
+        self._state = {"reachable": None, "models": [], "checked_at": 0.0, "error": ""}
+        self._thread = threading.Thread(target=self._run, name="ollama-health", daemon=True)
+
+    def start(self) -> "OllamaHealthMonitor":
+        self._thread.start()
+        return self
+
+    def poll_once(self) -> None:
         try:
-            day_num = int(day_obj.get("day"))
-        except Exception:
-            continue
+            r = get_http_session().get(self.tags_url, timeout=OLLAMA_HEALTH_TIMEOUT_SEC)
+            reachable = r.status_code == 200
+            models = [m.get("name") for m in r.json().get("models", [])] if reachable else []
+            error = "" if reachable else f"HTTP {r.status_code}"
+        except Exception as e:
+            reachable, models, error = False, [], str(e)
 
-        if day_num < 1 or day_num > requested_days:
-            continue
+        with self._lock:
+            self._state = {"reachable": reachable, "models": models, "checked_at": time.time(), "error": error}
 
-        slots = day_obj.get("slots", [])
-        if not isinstance(slots, list):
-            slots = []
+    def _run(self) -> None:
+        while True:
+            self.poll_once()
+            time.sleep(self.interval_sec)
 
-        normalized_slots = []
-        seen_names = set()
+    def snapshot(self) -> dict:
+        with self._lock:
+            state = dict(self._state)
+        state["fresh"] = state["checked_at"] > 0 and time.time() - state["checked_at"] <= self.ttl_sec
+        return state
 
-        for slot in slots:
-            if not isinstance(slot, dict):
-                continue
 
-            slot_name = slot.get("slot", "Morning")
-            if slot_name not in SLOT_ORDER:
-                slot_name = "Morning"
+@st.cache_resource(show_spinner=False)
+def get_ollama_health_monitor() -> OllamaHealthMonitor:
+    return OllamaHealthMonitor(OLLAMA_TAGS_URL, OLLAMA_HEALTH_POLL_SEC, OLLAMA_HEALTH_TTL_SEC).start()
 
-            default_start, default_end = DEFAULT_SLOT_WINDOWS[slot_name]
-            start = safe_hhmm(slot.get("start"), default_start)
-            end = safe_hhmm(slot.get("end"), default_end)
 
-            stops = slot.get("stops", [])
-            if not isinstance(stops, list):
-                stops = []
+def ollama_available(model_name: str) -> Optional[bool]:
+    """Non-blocking readiness from the health monitor; None while unknown or stale."""
+    state = get_ollama_health_monitor().snapshot()
+    if not state["fresh"]:
+        return None
+    return bool(state["reachable"]) and model_name in state["models"]
+
+
+class StreamingDayParser:
+    """
+    Scans streamed LLM text and returns each day object of the top-level
+    "days" array as soon as its closing brace arrives.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text: str) -> List[dict]:
+        self.buffer += text
+        buf = self.buffer
+        completed = []
+
+        for i in range(self._pos, len(buf)):
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
 
-            cleaned_stops = []
-            for s in stops:
-                if not isinstance(s, dict):
+            if ch == '"':
+                self._in_string = bool(self._stack)
+            elif ch in "{[":
+                self._stack.append((ch, i))
+            elif ch in "}]" and self._stack:
+                opener, start = self._stack.pop()
+                if ch != "}" or opener != "{":
                     continue
-
-                name = str(s.get("name", "")).strip()
-                if not name or name.lower() in seen_names:
+                if [c for c, _ in self._stack] != ["{", "["]:
                     continue
-                seen_names.add(name.lower())
-
-                category = str(s.get("category", "City Highlights")).strip() or "City Highlights"
-                description = str(s.get("description", "")).strip()
-                dur = s.get("duration_min", 60)
                 try:
-                    dur = int(dur)
-                except Exception:
-                    dur = 60
-                dur = max(15, min(dur, 240))
-
-                cleaned_stops.append({
-                    "name": name,
-                    "category": category,
-                    "duration_min": dur,
-                    "description": description
-                })
+                    obj = json.loads(buf[start:i + 1])
+                except ValueError:
+                    continue
+                if isinstance(obj, dict) and "slots" in obj:
+                    completed.append(obj)
 
-            normalized_slots.append({
-                "slot": slot_name,
-                "start": start,
-                "end": end,
-                "stops": cleaned_stops
-            })
+        self._pos = len(buf)
+        return completed
 
-        slot_map = {s["slot"]: s for s in normalized_slots}
-        ordered_slots = [slot_map[s] for s in SLOT_ORDER if s in slot_map]
-        day_map[day_num] = {"day": day_num, "slots": ordered_slots}
 
-    for d in range(1, requested_days + 1):
-        normalized["days"].append(day_map.get(d, {"day": d, "slots": []}))
+def warm_up_ollama(model_name: str) -> dict:
+    """
+    Empty generate: makes Ollama load the model (or refresh its keep_alive)
+    without producing tokens. load_sec is ~0 when the model was already resident.
+    """
+    started = time.perf_counter()
+    r = get_http_session().post(
+        OLLAMA_URL,
+        json=build_ollama_payload("", model_name, False),
+        timeout=OLLAMA_TIMEOUT_SEC
+    )
+    if r.status_code != 200:
+        raise RuntimeError(f"Ollama error: {r.status_code} - {r.text}")
+    return {
+        "at": datetime.now().isoformat(timespec="seconds"),
+        "latency_sec": round(time.perf_counter() - started, 3),
+        "load_sec": round(r.json().get("load_duration", 0) / 1e9, 3),
+    }
 
-    return normalized
 
+def _within_keep_warm_hours(now: datetime) -> bool:
+    start_hour, end_hour = OLLAMA_KEEP_WARM_HOURS
+    return start_hour <= now.hour < end_hour
+
+
+@st.cache_resource(show_spinner=False)
+def get_ollama_keep_warm() -> dict:
+    """
+    The single keep-warm thread of this server process and its targets: one
+    entry per model a session selected within OLLAMA_KEEP_WARM_IDLE_SEC, each
+    with its own stats and refresh time, so sessions on different models do
+    not reset each other's cold start.
+    """
+    state = {"targets": {}, "lock": threading.Lock(), "changed": threading.Event()}
+    targets: Dict[str, dict] = state["targets"]
+
+    def loop():
+        while True:
+            state["changed"].clear()
+            now = time.time()
+            with state["lock"]:
+                idle = [m for m, t in targets.items() if now - t["requested_at"] > OLLAMA_KEEP_WARM_IDLE_SEC]
+                for model_name in idle:
+                    del targets[model_name]
+                due = [(m, t) for m, t in targets.items() if t["next_at"] <= now]
+            for model_name, target in due:
+                stats = target["stats"]
+                if stats["cold"] is None or _within_keep_warm_hours(datetime.now()):
+                    try:
+                        result = warm_up_ollama(model_name)
+                        if stats["cold"] is None:
+                            stats["cold"] = result
+                        else:
+                            stats["warm"] = (stats["warm"] + [result])[-20:]
+                        stats["error"] = ""
+                    except Exception as e:
+                        stats["error"] = str(e)
+                target["next_at"] = time.time() + (OLLAMA_KEEP_WARM_INTERVAL_SEC if stats["cold"] else 30)
+            with state["lock"]:
+                next_at = min((t["next_at"] for t in targets.values()), default=now + OLLAMA_KEEP_WARM_INTERVAL_SEC)
+            state["changed"].wait(max(0.0, next_at - time.time()))
+
+    state["thread"] = threading.Thread(target=loop, name="ollama-keep-warm", daemon=True)
+    return state
+
+
+def start_ollama_keep_warm(model_name: str) -> dict:
+    """
+    Adds model_name to the keep-warm targets (starting the thread on first
+    use) or marks it as still wanted. Its first warm-up is the cold start;
+    later refreshes during OLLAMA_KEEP_WARM_HOURS measure warm latency.
+    Returns the model's shared stats dict the sidebar reads.
+    """
+    state = get_ollama_keep_warm()
+    with state["lock"]:
+        target = state["targets"].get(model_name)
+        if target is None:
+            target = state["targets"][model_name] = {
+                "stats": {"model": model_name, "cold": None, "warm": [], "error": ""},
+                "next_at": 0.0,
+                "requested_at": time.time(),
+            }
+            state["changed"].set()
+        target["requested_at"] = time.time()
+        if not state["thread"].is_alive():
+            state["thread"].start()
+    return target["stats"]
 
-def parse_and_validate_json_from_llm(raw_text: str, requested_days: int) -> dict:
-    json_text = _extract_json_block(raw_text)
-    if not json_text:
-        raise ValueError("LLM did not return JSON.")
-    plan = json.loads(json_text)
-    return validate_and_normalize_itinerary_json(plan, requested_days)
+
+# ============================================================
+# VALIDATION
+# ============================================================
+
+
+def normalize_streamed_day(day_obj: dict, requested_days: int) -> Optional[dict]:
+    try:
+        day_num = int(day_obj.get("day"))
+    except Exception:
+        return None
+    if day_num < 1 or day_num > requested_days:
+        return None
+    normalized = validate_and_normalize_itinerary_json({"days": [day_obj]}, requested_days)
+    return normalized["days"][day_num - 1]
 
 
 # ============================================================
@@ -911,6 +1126,95 @@ def pretty_itinerary_markdown_from_plan(plan: dict) -> str:
 # ============================================================
 # ITINERARY GENERATION
 # ============================================================
+
+
+def apply_itinerary_record(record: dict, cache_hit: bool) -> None:
+    st.session_state.llama_raw_output = record.get("llama_raw_output", "")
+    # Records no longer store the markdown view; get_llama_pretty_text() renders it on demand.
+    st.session_state.llama_pretty_text = record.get("llama_pretty_text", "")
+    st.session_state.llama_plan = record.get("itinerary_json")
+    st.session_state.llama_repair_used = bool(record.get("repair_used", False))
+    st.session_state.llama_cache_hit = cache_hit
+    st.session_state.llama_near_hit = bool(record.get("near_hit_of"))
+    st.session_state.llama_saved_ok = True
+
+
+def get_llama_pretty_text() -> str:
+    if not st.session_state.llama_pretty_text and st.session_state.llama_plan:
+        st.session_state.llama_pretty_text = pretty_itinerary_markdown_from_plan(st.session_state.llama_plan)
+    return st.session_state.llama_pretty_text
+
+
+def load_itinerary_from_cache(
+        cache_key: str,
+        destination: str,
+        days: int,
+        interests: List[str],
+        model_name: str,
+        pace: str,
+        must_visit_locations: List[str]
+) -> Optional[dict]:
+    cached = lookup_itinerary_record(
+        cache_key, destination, days, interests, model_name, pace, must_visit_locations
+    )
+    if not cached:
+        st.session_state.llama_cache_hit = False
+        st.session_state.llama_saved_ok = False
+        st.session_state.llama_repair_used = False
+        st.session_state.llama_near_hit = False
+        return None
+
+    apply_itinerary_record(cached, cache_hit=True)
+    return cached["itinerary_json"]
+
+
+def coalesce_day_stream(cache_key: str, produce: Callable[[], Iterator[dict]]) -> Iterator[dict]:
+    """
+    Single-flight wrapper for the day-streaming generators. The leader streams
+    the days from produce(), whose return value is the saved cache record.
+    Concurrent callers with the same key wait for that record and replay it;
+    if the leader's session goes away mid-stream, a waiting caller takes over.
+    """
+    flight = get_single_flight()
+    key = f"itinerary:{cache_key}"
+    while True:
+        call, is_leader = flight.begin(key)
+        if is_leader:
+            break
+        try:
+            record = flight.wait(call, timeout=OLLAMA_TIMEOUT_SEC * 2)
+        except FlightCancelled:
+            continue
+        apply_itinerary_record(record, cache_hit=True)
+        yield from record["itinerary_json"]["days"]
+        return
+
+    streamed = set()
+    produced = produce()
+    try:
+        while True:
+            try:
+                day = next(produced)
+            except StopIteration as stop:
+                record = stop.value
+                break
+            streamed.add(day["day"])
+            yield day
+    except Exception as e:
+        flight.finish(key, call, error=e)
+        raise
+    except BaseException:
+        # Abandoned stream (GeneratorExit) or a Streamlit rerun/stop: a follower leads instead.
+        flight.finish(key, call, error=FlightCancelled("The shared itinerary generation was cancelled."))
+        raise
+
+    flight.finish(key, call, result=record)
+    apply_itinerary_record(record, cache_hit=False)
+    for day in record["itinerary_json"]["days"]:
+        if day["day"] not in streamed:
+            yield day
+
+
 def generate_itinerary_json_with_ollama(
         destination: str,
         days: int,
@@ -919,70 +1223,168 @@ def generate_itinerary_json_with_ollama(
         pace: str,
         must_visit_locations: List[str]
 ) -> dict:
+    record, from_cache = generate_itinerary_record(
+        destination, days, interests, model_name, pace, must_visit_locations
+    )
+    apply_itinerary_record(record, cache_hit=from_cache)
+    return record["itinerary_json"]
+
+
+def stream_itinerary_json_with_ollama(
+        destination: str,
+        days: int,
+        interests: List[str],
+        model_name: str,
+        pace: str,
+        must_visit_locations: List[str]
+) -> Iterator[dict]:
+    """
+    Streaming counterpart of generate_itinerary_json_with_ollama.
+    Yields each normalized day object as soon as the model finishes writing it,
+    then validates and caches the full plan exactly like the blocking path.
+    """
     cache_key = make_cache_key(destination, days, interests, model_name, pace, must_visit_locations)
-    cached = load_cached_record(cache_key)
+    cached = load_itinerary_from_cache(
+        cache_key, destination, days, interests, model_name, pace, must_visit_locations
+    )
     if cached:
-        st.session_state.llama_raw_output = cached.get("llama_raw_output", "")
-        st.session_state.llama_pretty_text = cached.get("llama_pretty_text", "")
-        st.session_state.llama_cache_hit = True
-        st.session_state.llama_saved_ok = True
-        return cached["itinerary_json"]
+        yield from cached.get("days", [])
+        return
+
+    def produce() -> Iterator[dict]:
+        existing = load_cached_record(cache_key)
+        if existing:
+            return existing
+
+        started = time.perf_counter()
+        prompt = build_itinerary_prompt(destination, days, interests, pace, must_visit_locations)
+        parser = StreamingDayParser()
+        streamed_days: Dict[int, dict] = {}
+
+        for piece in stream_ollama(
+                prompt, model_name, itinerary_output_format(), itinerary_token_budget(days, pace)
+        ):
+            for day_obj in parser.feed(piece):
+                day = normalize_streamed_day(day_obj, days)
+                if day and day["day"] not in streamed_days:
+                    streamed_days[day["day"]] = day
+                    yield day
+
+        raw = parser.buffer
+        repair_used = parse_failed = False
 
-    st.session_state.llama_cache_hit = False
-    st.session_state.llama_saved_ok = False
+        try:
+            itinerary_json = parse_and_validate_json_from_llm(raw, days)
+        except Exception:
+            parse_failed = True
+            if streamed_days:
+                itinerary_json = validate_and_normalize_itinerary_json(
+                    {"overview": "", "days": list(streamed_days.values())}, days
+                )
+            else:
+                itinerary_json, raw = repair_itinerary_json_with_ollama(raw, days, model_name)
+                repair_used = True
+
+        return save_itinerary_to_cache(
+            cache_key, destination, days, interests, model_name, pace, must_visit_locations,
+            itinerary_json, raw, repair_used, generation_sec=time.perf_counter() - started,
+            parse_failed=parse_failed
+        )
+
+    yield from coalesce_day_stream(cache_key, produce)
+
+
+AREA_PLAN_SCHEMA_EXAMPLE = {
+    "overview": "1-2 sentences about how the days are split across the city",
+    "days": [
+        {
+            "day": 1,
+            "area": "Neighborhood or district covered this day",
+            "focus": "Theme of the day",
+            "anchors": ["Main attraction for this day"]
+        }
+    ]
+}
 
+
+def _normalize_place_name(name: str) -> str:
+    name = (name or "").lower().strip()
+    name = re.sub(r"^the\s+", "", name)
+    name = re.sub(r"[^a-z0-9 ]+", " ", name)
+    return re.sub(r"\s+", " ", name).strip()
+
+
+def build_area_plan_prompt(
+        destination: str,
+        days: int,
+        interests: List[str],
+        pace: str,
+        must_visit_locations: List[str]
+) -> str:
     interest_text = ", ".join(interests) if interests else "General sightseeing"
     must_visit_text = ", ".join(must_visit_locations) if must_visit_locations else "None"
 
-    schema_example = {
-        "overview": "1-2 sentences about geographic clustering, pacing, and priorities",
-        "days": [
-            {
-                "day": 1,
-                "slots": [
-                    {
-                        "slot": "Morning",
-                        "start": "08:30",
-                        "end": "12:00",
-                        "stops": [
-                            {
-                                "name": "Place name",
-                                "category": "City Highlights",
-                                "duration_min": 90,
-                                "description": "Why this stop fits the traveler"
-                            }
-                        ]
-                    }
-                ]
-            }
-        ]
-    }
-
-    prompt = f"""
+    return f"""
 You are an expert local travel planner for {destination}.
 
-Create a realistic, high-quality itinerary.
+Split a {days}-day trip into {days} distinct areas so that no two days overlap.
 
 USER PROFILE
 - Destination: {destination}
-- Days: {days}
 - Interests: {interest_text}
 - Pace: {pace}
 - Specific locations the user wants included: {must_visit_text}
 
-MANDATORY RULES
-1) Generate EXACTLY {days} days.
-2) Use real places likely to exist in {destination}.
-3) Do NOT repeat attractions.
-4) Group nearby places together to reduce travel time.
-5) Respect the pace:
+RULES
+1) Exactly {days} days, each in a different neighborhood or district.
+2) List 2-4 anchor attractions per day; never repeat an anchor on another day.
+3) Assign every user-requested location to the day whose area contains it.
+4) Put the most iconic areas first.
+
+OUTPUT
+- Return ONLY valid JSON
+- Follow this schema exactly:
+{json.dumps(AREA_PLAN_SCHEMA_EXAMPLE, indent=2)}
+""".strip()
+
+
+def build_single_day_prompt(
+        destination: str,
+        day_plan: dict,
+        other_days: List[dict],
+        interests: List[str],
+        pace: str
+) -> str:
+    day_num = day_plan["day"]
+    interest_text = ", ".join(interests) if interests else "General sightseeing"
+    anchors_text = ", ".join(day_plan.get("anchors", [])) or "Best-known places in this area"
+    avoid_lines = "\n".join(
+        f"- Day {d['day']}: {d.get('area', '')} ({', '.join(d.get('anchors', []))})" for d in other_days
+    ) or "- None"
+
+    return f"""
+You are an expert local travel planner for {destination}.
+
+Plan ONLY day {day_num} of a multi-day trip.
+
+DAY {day_num}
+- Area: {day_plan.get("area", destination)}
+- Focus: {day_plan.get("focus", "")}
+- Anchor attractions to include: {anchors_text}
+- Interests: {interest_text}
+- Pace: {pace}
+
+OTHER DAYS (do NOT use places from these areas or anchors):
+{avoid_lines}
+
+RULES
+1) Use real places likely to exist in {destination}, close to the day's area.
+2) Do NOT repeat attractions.
+3) Respect the pace:
    - Relaxed = fewer stops, longer visits
    - Balanced = moderate number of stops
    - Fast-paced = more stops, shorter visits
-6) Include iconic landmarks early unless clearly irrelevant.
-7) Strongly prioritize all user-requested specific locations if provided.
-8) If a user-requested location seems valid, include it whenever geographically and logically feasible.
-9) Lunch and dinner should be realistic food areas or restaurants.
+4) Lunch and dinner should be realistic food areas or restaurants.
 
 TIME STRUCTURE
 - Morning: 08:30–12:00
@@ -992,192 +1394,431 @@ TIME STRUCTURE
 - Dinner: 20:00–21:30
 
 OUTPUT
-- Return ONLY valid JSON
-- No markdown
-- No explanation
+- Return ONLY valid JSON for this single day with "day": {day_num}
 - Follow this schema exactly:
-{json.dumps(schema_example, indent=2)}
+{json.dumps(ITINERARY_SCHEMA_EXAMPLE["days"][0], indent=2)}
 """.strip()
 
-    raw = call_ollama(prompt, model_name)
-    st.session_state.llama_raw_output = raw
 
+def parse_area_plan(raw: str, days: int) -> dict:
+    json_text = _extract_json_block(raw)
     try:
-        itinerary_json = parse_and_validate_json_from_llm(raw, days)
-    except Exception:
-        repair_prompt = f"""
-Return ONLY valid JSON.
-No markdown.
-No explanation.
+        plan = json.loads(json_text) if json_text else {}
+    except ValueError:
+        plan = {}
+    if not isinstance(plan, dict):
+        plan = {}
 
-Fix this travel itinerary into exactly {days} days and this schema:
-{json.dumps(schema_example, indent=2)}
+    by_day = {}
+    for day_obj in plan.get("days", []) if isinstance(plan.get("days"), list) else []:
+        if not isinstance(day_obj, dict):
+            continue
+        try:
+            d = int(day_obj.get("day"))
+        except Exception:
+            continue
+        anchors = day_obj.get("anchors", [])
+        by_day[d] = {
+            "day": d,
+            "area": str(day_obj.get("area", "")).strip(),
+            "focus": str(day_obj.get("focus", "")).strip(),
+            "anchors": [str(a).strip() for a in anchors if str(a).strip()] if isinstance(anchors, list) else []
+        }
 
-Input:
-{raw}
-""".strip()
-        repaired_raw = call_ollama(repair_prompt, model_name)
-        st.session_state.llama_raw_output = repaired_raw
-        itinerary_json = parse_and_validate_json_from_llm(repaired_raw, days)
-
-    pretty_text = pretty_itinerary_markdown_from_plan(itinerary_json)
-    st.session_state.llama_pretty_text = pretty_text
-
-    record = {
-        "cache_key": cache_key,
-        "created_at": datetime.now().isoformat(timespec="seconds"),
-        "destination": destination,
-        "days": int(days),
-        "interests": _normalize_interests(interests),
-        "pace": pace,
-        "must_visit_locations": must_visit_locations,
-        "model": model_name,
-        "llama_raw_output": st.session_state.llama_raw_output,
-        "llama_pretty_text": pretty_text,
-        "itinerary_json": itinerary_json,
+    overview = plan.get("overview", "")
+    return {
+        "overview": overview if isinstance(overview, str) else "",
+        "days": [by_day.get(d, {"day": d, "area": "", "focus": "", "anchors": []}) for d in range(1, days + 1)]
     }
-    append_cache_record(record)
-    st.session_state.llama_saved_ok = True
-    return itinerary_json
 
 
-def build_itinerary_from_ollama(
+def generate_single_day_with_ollama(
+        destination: str,
+        day_plan: dict,
+        other_days: List[dict],
+        interests: List[str],
+        pace: str,
+        model_name: str
+) -> Tuple[dict, str]:
+    """
+    Worker for the per-day fan-out. Runs off the script thread, so it must not
+    touch st.session_state. A reply without a parseable day or without any stop
+    raises, so the caller's retry handles it instead of caching a blank day.
+    """
+    day_num = day_plan["day"]
+    day_example = ITINERARY_SCHEMA_EXAMPLE["days"][0]
+    prompt = build_single_day_prompt(destination, day_plan, other_days, interests, pace)
+    raw = call_ollama(prompt, model_name, itinerary_output_format(day_example), itinerary_token_budget(1, pace))
+
+    json_text = _extract_json_block(raw)
+    try:
+        day_obj = json.loads(json_text) if json_text else None
+    except ValueError:
+        day_obj = None
+    if isinstance(day_obj, dict) and isinstance(day_obj.get("days"), list) and day_obj["days"]:
+        day_obj = day_obj["days"][0]
+    if not isinstance(day_obj, dict):
+        raise ValueError(f"Day {day_num}: the model's reply is not a day object.")
+    slots = day_obj.get("slots")
+    if not isinstance(slots, list) or not any(
+            isinstance(slot, dict) and isinstance(slot.get("stops"), list) and slot["stops"] for slot in slots
+    ):
+        raise ValueError(f"Day {day_num}: the model's reply has no stops.")
+
+    # The model occasionally renumbers; the fan-out slot is authoritative.
+    day_obj["day"] = day_num
+    return day_obj, raw
+
+
+def dedupe_attractions_across_days(day_objs: List[dict]) -> List[dict]:
+    """Keep the first occurrence (by day order) of each attraction across the whole trip."""
+    seen = set()
+    deduped = []
+    for day_obj in sorted(day_objs, key=lambda d: int(d.get("day", 0))):
+        slots = []
+        for slot in day_obj.get("slots", []):
+            if not isinstance(slot, dict):
+                continue
+            stops = []
+            for stop in slot.get("stops", []) if isinstance(slot.get("stops"), list) else []:
+                key = _normalize_place_name(stop.get("name", "")) if isinstance(stop, dict) else ""
+                if not key or key in seen:
+                    continue
+                seen.add(key)
+                stops.append(stop)
+            slots.append({**slot, "stops": stops})
+        deduped.append({**day_obj, "slots": slots})
+    return deduped
+
+
+def generate_itinerary_days_in_parallel(
         destination: str,
         days: int,
         interests: List[str],
+        model_name: str,
         pace: str,
         must_visit_locations: List[str]
-) -> Dict[int, DayItinerary]:
-    model_name = st.session_state.get("ollama_model", DEFAULT_MODEL)
+) -> Iterator[dict]:
+    """
+    Fan-out/fan-in generation for long trips: one small area-plan request,
+    then one request per day run concurrently, so wall-clock time follows the
+    slowest day rather than the sum of all days. Each day is yielded once every
+    earlier day has arrived, de-duplicated in day order exactly like the merged
+    plan that is cached (the single-prompt path's cache format).
+    A day whose request fails is retried once; a second failure fails the whole
+    plan, so a trip with blank days is never cached.
+    """
+    cache_key = make_cache_key(destination, days, interests, model_name, pace, must_visit_locations)
+    cached = load_itinerary_from_cache(
+        cache_key, destination, days, interests, model_name, pace, must_visit_locations
+    )
+    if cached:
+        yield from cached.get("days", [])
+        return
 
-    center = geocode_destination(destination)
-    if not center:
-        raise ValueError("Could not find that destination. Try a more specific name.")
+    def produce() -> Iterator[dict]:
+        existing = load_cached_record(cache_key)
+        if existing:
+            return existing
+
+        started = time.perf_counter()
+        area_raw = call_ollama(
+            build_area_plan_prompt(destination, days, interests, pace, must_visit_locations),
+            model_name,
+            itinerary_output_format(AREA_PLAN_SCHEMA_EXAMPLE),
+            ITINERARY_TOKENS_BASE + AREA_PLAN_TOKENS_PER_DAY * days
+        )
+        area_plan = parse_area_plan(area_raw, days)
 
-    dest_lat, dest_lon = center
-    pace_cfg = PACE_SETTINGS.get(pace, PACE_SETTINGS["Balanced"])
-    duration_multiplier = pace_cfg["duration_multiplier"]
+        day_objs: Dict[int, dict] = {}
+        day_raws: Dict[int, str] = {}
+        next_day = 1
 
-    plan = generate_itinerary_json_with_ollama(
-        destination,
-        days,
-        interests,
-        model_name,
-        pace,
-        must_visit_locations
-    )
+        others = {
+            day_plan["day"]: [d for d in area_plan["days"] if d["day"] != day_plan["day"]]
+            for day_plan in area_plan["days"]
+        }
+        plans = {day_plan["day"]: day_plan for day_plan in area_plan["days"]}
 
-    itinerary: Dict[int, DayItinerary] = {}
-    loc_id = 1
-    days_list = sorted(plan.get("days", []), key=lambda d: int(d.get("day", 0)))
+        def submit(d: int):
+            return pool.submit(
+                generate_single_day_with_ollama, destination, plans[d], others[d], interests, pace, model_name
+            )
 
-    for d in range(1, days + 1):
-        day_obj = next((x for x in days_list if int(x.get("day", -1)) == d), None)
-        if not day_obj:
-            itinerary[d] = DayItinerary(day_number=d, locations=[], status="pending")
-            continue
+        pool = ThreadPoolExecutor(max_workers=OLLAMA_PARALLEL_MAX_WORKERS)
+        try:
+            futures = {submit(d): d for d in plans}
+            retried = set()
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    d = futures.pop(future)
+                    try:
+                        day_obj, raw = future.result()
+                    except Exception as e:
+                        # A blank day must never reach the cache: retry once, then fail the whole plan.
+                        if d in retried:
+                            raise RuntimeError(f"Day {d} failed to generate twice: {e}") from e
+                        retried.add(d)
+                        futures[submit(d)] = d
+                        continue
+                    day_objs[d] = day_obj
+                    day_raws[d] = raw
+
+                    # Hold a day until the earlier ones are in, so the streamed days carry
+                    # the same day-order de-duplication as the cached plan.
+                    while next_day in day_objs:
+                        merged = dedupe_attractions_across_days([day_objs[n] for n in range(1, next_day + 1)])
+                        day = normalize_streamed_day(merged[-1], days)
+                        next_day += 1
+                        if day:
+                            yield day
+        finally:
+            # An abandoned stream (rerun) or a failed day must not wait for the remaining days.
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        raw_output = json.dumps(
+            {"area_plan": area_raw, "days": {str(d): day_raws[d] for d in sorted(day_raws)}},
+            ensure_ascii=False
+        )
+        itinerary_json = validate_and_normalize_itinerary_json(
+            {"overview": area_plan["overview"], "days": dedupe_attractions_across_days(list(day_objs.values()))},
+            days
+        )
+        return save_itinerary_to_cache(
+            cache_key, destination, days, interests, model_name, pace, must_visit_locations,
+            itinerary_json, raw_output, False, generation_sec=time.perf_counter() - started
+        )
 
-        slots = day_obj.get("slots", [])
-        slot_map = {s.get("slot"): s for s in slots if isinstance(s, dict) and s.get("slot")}
-        day_locs: List[Location] = []
-        visit_order = 1
-        prev_lat, prev_lon = dest_lat, dest_lon
+    yield from coalesce_day_stream(cache_key, produce)
 
-        for slot_name in SLOT_ORDER:
-            slot = slot_map.get(slot_name, {})
-            if not slot:
-                continue
 
-            start_s = safe_hhmm(slot.get("start"), DEFAULT_SLOT_WINDOWS[slot_name][0])
-            end_s = safe_hhmm(slot.get("end"), DEFAULT_SLOT_WINDOWS[slot_name][1])
-            t = parse_hhmm(start_s)
-            window_end = parse_hhmm(end_s)
+def build_day_itinerary(
+        day_obj: dict,
+        day_num: int,
+        destination: str,
+        center: Tuple[float, float],
+        duration_multiplier: float,
+        interests: List[str],
+        first_loc_id: int,
+        stop_coords: Optional[Dict[str, Optional[list]]] = None
+) -> Tuple[DayItinerary, int]:
+    """
+    stop_coords maps stop names to known coordinates (None = not found). Names
+    it already holds are placed without a network call; new lookups are added.
+    """
+    dest_lat, dest_lon = center
+    if stop_coords is None:
+        stop_coords = {}
+    loc_id = first_loc_id
+
+    slots = day_obj.get("slots", [])
+    slot_map = {s.get("slot"): s for s in slots if isinstance(s, dict) and s.get("slot")}
+    day_locs: List[Location] = []
+    visit_order = 1
+    prev_lat, prev_lon = dest_lat, dest_lon
+
+    for slot_name in SLOT_ORDER:
+        slot = slot_map.get(slot_name, {})
+        if not slot:
+            continue
+
+        start_s = safe_hhmm(slot.get("start"), DEFAULT_SLOT_WINDOWS[slot_name][0])
+        end_s = safe_hhmm(slot.get("end"), DEFAULT_SLOT_WINDOWS[slot_name][1])
+        t = parse_hhmm(start_s)
+        window_end = parse_hhmm(end_s)
 
-            stops = slot.get("stops", [])
-            if not isinstance(stops, list):
-                stops = []
+        stops = slot.get("stops", [])
+        if not isinstance(stops, list):
+            stops = []
 
-            for stop in stops:
-                name = (stop.get("name") or "").strip()
-                if not name:
-                    continue
+        for stop in stops:
+            name = (stop.get("name") or "").strip()
+            if not name:
+                continue
 
-                category = (stop.get("category") or "City Highlights").strip()
-                desc = (stop.get("description") or "").strip()
-                dur = stop.get("duration_min", 60)
+            category = (stop.get("category") or "City Highlights").strip()
+            desc = (stop.get("description") or "").strip()
+            dur = stop.get("duration_min", 60)
 
-                try:
-                    dur = int(dur)
-                except Exception:
-                    dur = 60
+            try:
+                dur = int(dur)
+            except Exception:
+                dur = 60
 
-                dur = max(15, int(round(dur * duration_multiplier)))
+            dur = max(15, int(round(dur * duration_multiplier)))
 
-                coords = None
-                approximate = False
+            coords = None
+            approximate = False
+            if name in stop_coords:
+                coords = stop_coords[name]
+            else:
                 try:
                     coords = geocode_place(f"{name}, {destination}")
+                    stop_coords[name] = list(coords) if coords else None
                 except Exception:
                     coords = None
 
-                if not coords:
-                    plat, plon = dest_lat, dest_lon
-                    approximate = True
-                else:
-                    plat, plon = coords
+            if not coords:
+                plat, plon = dest_lat, dest_lon
+                approximate = True
+            else:
+                plat, plon = coords
+
+            if day_locs:
+                travel_buffer = estimate_travel_buffer_minutes(prev_lat, prev_lon, plat, plon)
+                t = t + timedelta(minutes=travel_buffer)
 
-                if day_locs:
-                    travel_buffer = estimate_travel_buffer_minutes(prev_lat, prev_lon, plat, plon)
-                    t = t + timedelta(minutes=travel_buffer)
+            planned_start = fmt_hhmm(t)
+            planned_end_dt = t + timedelta(minutes=dur)
 
-                planned_start = fmt_hhmm(t)
+            if planned_end_dt > window_end:
+                remaining = int((window_end - t).total_seconds() // 60)
+                if remaining < 15:
+                    break
+                dur = max(15, remaining)
                 planned_end_dt = t + timedelta(minutes=dur)
 
-                if planned_end_dt > window_end:
-                    remaining = int((window_end - t).total_seconds() // 60)
-                    if remaining < 15:
-                        break
-                    dur = max(15, remaining)
-                    planned_end_dt = t + timedelta(minutes=dur)
-
-                planned_end = fmt_hhmm(planned_end_dt)
-
-                priority = 5 if slot_name in ["Morning", "Afternoon"] else 4
-                if slot_name in ["Lunch", "Dinner"]:
-                    priority = 3
-
-                rating = 4.7 if slot_name not in ["Lunch", "Dinner"] else 4.6
-
-                day_locs.append(Location(
-                    id=loc_id,
-                    name=name,
-                    lat=float(plat),
-                    lon=float(plon),
-                    category=category,
-                    planned_duration=dur,
-                    planned_start=planned_start,
-                    planned_end=planned_end,
-                    priority=priority,
-                    description=desc if desc else f"Planned for your interests: {', '.join(interests)}",
-                    rating=rating,
-                    day=d,
-                    visit_order=visit_order,
-                    approximate_location=approximate
-                ))
-                loc_id += 1
-                visit_order += 1
-                t = planned_end_dt
-                prev_lat, prev_lon = plat, plon
-
-        total_time = sum(x.planned_duration for x in day_locs)
-        itinerary[d] = DayItinerary(
-            day_number=d,
-            locations=day_locs,
-            total_planned_time=total_time,
-            status="pending"
+            planned_end = fmt_hhmm(planned_end_dt)
+
+            priority = 5 if slot_name in ["Morning", "Afternoon"] else 4
+            if slot_name in ["Lunch", "Dinner"]:
+                priority = 3
+
+            rating = 4.7 if slot_name not in ["Lunch", "Dinner"] else 4.6
+
+            day_locs.append(Location(
+                id=loc_id,
+                name=name,
+                lat=float(plat),
+                lon=float(plon),
+                category=category,
+                planned_duration=dur,
+                planned_start=planned_start,
+                planned_end=planned_end,
+                priority=priority,
+                description=desc if desc else f"Planned for your interests: {', '.join(interests)}",
+                rating=rating,
+                day=day_num,
+                visit_order=visit_order,
+                approximate_location=approximate
+            ))
+            loc_id += 1
+            visit_order += 1
+            t = planned_end_dt
+            prev_lat, prev_lon = plat, plon
+
+    total_time = sum(x.planned_duration for x in day_locs)
+    day_itinerary = DayItinerary(
+        day_number=day_num,
+        locations=day_locs,
+        total_planned_time=total_time,
+        status="pending"
+    )
+    return day_itinerary, loc_id
+
+
+def build_itinerary_from_ollama(
+        destination: str,
+        days: int,
+        interests: List[str],
+        pace: str,
+        must_visit_locations: List[str],
+        on_day_ready: Optional[Callable[[DayItinerary], None]] = None
+) -> Dict[int, DayItinerary]:
+    """
+    Geocodes and schedules each day as soon as it is available. In streaming
+    mode day 1 is ready (and on_day_ready fires) while later days are still
+    being generated. A day's stops (the whole plan's when it arrives at once)
+    are geocoded as one concurrent batch behind the Nominatim rate limit, then
+    scheduled. Coordinates are saved with the cached plan, so rebuilding a
+    cached itinerary makes no geocoding requests.
+    """
+    model_name = st.session_state.get("ollama_model", DEFAULT_MODEL)
+    cache_key = make_cache_key(destination, days, interests, model_name, pace, must_visit_locations)
+    geocoded = load_itinerary_geocodes(cache_key)
+
+    known_center = geocoded.get("center")
+    center = tuple(known_center) if known_center else geocode_destination(destination)
+    if not center:
+        raise ValueError("Could not find that destination. Try a more specific name.")
+
+    pace_cfg = PACE_SETTINGS.get(pace, PACE_SETTINGS["Balanced"])
+    duration_multiplier = pace_cfg["duration_multiplier"]
+
+    if days >= OLLAMA_PARALLEL_DAYS_MIN:
+        day_source = generate_itinerary_days_in_parallel(
+            destination,
+            days,
+            interests,
+            model_name,
+            pace,
+            must_visit_locations
+        )
+    elif OLLAMA_STREAM_ITINERARY:
+        day_source = stream_itinerary_json_with_ollama(
+            destination,
+            days,
+            interests,
+            model_name,
+            pace,
+            must_visit_locations
+        )
+    else:
+        plan = generate_itinerary_json_with_ollama(
+            destination,
+            days,
+            interests,
+            model_name,
+            pace,
+            must_visit_locations
+        )
+        day_source = sorted(plan.get("days", []), key=lambda d: int(d.get("day", 0)))
+
+    itinerary: Dict[int, DayItinerary] = {}
+    loc_id = 1
+    stop_coords = dict(geocoded.get("stops") or {})
+    known_names = set(stop_coords)
+    whole_plan = isinstance(day_source, list)
+
+    def prefetch_stops(day_objs: List[dict]) -> None:
+        # Unknown names go out as one concurrent, rate-limited batch before scheduling.
+        batch = geocode_itinerary_stops(destination, {"days": day_objs}, {"center": list(center), "stops": stop_coords})
+        stop_coords.update(batch["stops"])
+
+    for day_obj in day_source:
+        try:
+            d = int(day_obj.get("day", -1))
+        except Exception:
+            continue
+        if d < 1 or d > days or d in itinerary:
+            continue
+
+        if not itinerary:
+            if not stop_coords:
+                # A near hit is only saved once the day source has started; it carries its source's coordinates.
+                stop_coords.update(load_itinerary_geocodes(cache_key).get("stops") or {})
+                known_names = set(stop_coords)
+            if whole_plan:
+                prefetch_stops(day_source)
+        if not whole_plan:
+            prefetch_stops([day_obj])
+
+        itinerary[d], loc_id = build_day_itinerary(
+            day_obj, d, destination, center, duration_multiplier, interests, loc_id, stop_coords
         )
+        if on_day_ready:
+            on_day_ready(itinerary[d])
 
-    return itinerary
+    new_coords = {name: coords for name, coords in stop_coords.items() if name not in known_names}
+    if new_coords or not known_center:
+        save_itinerary_geocodes(cache_key, {"center": list(center), "stops": new_coords})
+
+    for d in range(1, days + 1):
+        if d not in itinerary:
+            itinerary[d] = DayItinerary(day_number=d, locations=[], status="pending")
+
+    return dict(sorted(itinerary.items()))
 
 
 # ============================================================
@@ -1231,6 +1872,67 @@ def normalize_replan_text(text: str) -> str:
     return text
 
 
+def build_trip_replan_prefix(destination: str, interests: List[str], pace: str) -> str:
+    return f"""
+You are a smart travel replanning assistant for {destination}.
+
+Trip context (applies to every request that follows):
+- Destination: {destination}
+- Traveler interests: {", ".join(interests) if interests else "General sightseeing"}
+- Pace: {pace}
+
+For every request in this trip:
+1) Suggest real places likely to exist in or near {destination}
+2) Keep options realistic for the same day and same trip style
+3) Return ONLY valid JSON using the schema given in the request
+
+Reply with OK.
+""".strip()
+
+
+def call_ollama_in_trip_context(
+        prompt: str,
+        destination: str,
+        interests: List[str],
+        pace: str,
+        model_name: str,
+        num_predict: int
+) -> str:
+    """
+    Replan calls continue a per-trip Ollama context that is primed once with the
+    trip-level prefix, so each call only evaluates its own short request.
+    """
+    trip_key = hashlib.sha256(json.dumps({
+        "destination": destination.strip().lower(),
+        "interests": _normalize_interests(interests),
+        "pace": pace,
+        "model": model_name,
+    }, sort_keys=True).encode("utf-8")).hexdigest()
+
+    contexts = st.session_state.replan_trip_contexts
+    context = contexts.get(trip_key)
+    if context is None:
+        primed = ollama_generate(
+            build_trip_replan_prefix(destination, interests, pace),
+            model_name,
+            num_predict=TRIP_CONTEXT_PRIME_TOKENS
+        )
+        context = primed.get("context") or []
+        contexts[trip_key] = context
+
+    if not context:
+        # Servers that return no context get the prefix inline instead.
+        prompt = build_trip_replan_prefix(destination, interests, pace) + "\n\n" + prompt
+
+    result = ollama_generate(prompt, model_name, context=context, num_predict=num_predict)
+    st.session_state.replan_prompt_eval = {
+        "tokens": int(result.get("prompt_eval_count", 0) or 0),
+        "sec": round((result.get("prompt_eval_duration", 0) or 0) / 1e9, 3),
+        "reused_context": bool(context),
+    }
+    return result.get("response", "")
+
+
 def ollama_midtrip_replan_options(
         destination: str,
         day_num: int,
@@ -1240,7 +1942,8 @@ def ollama_midtrip_replan_options(
         remaining_stops: List[Location],
         user_request: str,
         model_name: str,
-        n: int = 5
+        n: int = 5,
+        anchor_coords: Optional[Tuple[float, float]] = None
 ) -> dict:
     schema = {
         "anchor": anchor_name,
@@ -1272,15 +1975,67 @@ def ollama_midtrip_replan_options(
         n=n
     )
 
+    metrics = get_cache_metrics()
+    started = time.perf_counter()
     cached = load_replan_cached_record(replan_cache_key)
     if cached:
+        metrics.record_hit(REPLAN_CACHE, time.perf_counter() - started, cached.get("generation_sec"))
         st.session_state.replan_cache_hit = True
+        st.session_state.replan_geo_hit = bool(cached.get("geo_hit"))
         st.session_state.replan_saved_ok = True
         return cached["replan_result"]
 
+    metrics.record_miss(REPLAN_CACHE, time.perf_counter() - started)
     st.session_state.replan_cache_hit = False
+    st.session_state.replan_geo_hit = False
     st.session_state.replan_saved_ok = False
 
+    def replan_record(data: dict) -> dict:
+        return {
+            "cache_key": replan_cache_key,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "destination": destination,
+            "day_num": int(day_num),
+            "anchor_name": anchor_name,
+            "interests": _normalize_interests(interests),
+            "pace": pace,
+            "remaining_stops": remaining_names,
+            "user_request": user_request,
+            "model": model_name,
+            "n": int(n),
+            "replan_result": data
+        }
+
+    # "general" requests are too open-ended to answer with another anchor's results.
+    if anchor_coords and intent != "general":
+        started = time.perf_counter()
+        try:
+            nearby = find_geo_replan_suggestions(
+                anchor_coords[0], anchor_coords[1], intent, model_name, [anchor_name] + remaining_names, n
+            )
+        except Exception:
+            nearby = []
+
+        if len(nearby) < min(n, REPLAN_GEO_MIN_SUGGESTIONS):
+            metrics.record_miss(REPLAN_GEO_LAYER, time.perf_counter() - started)
+        else:
+            metrics.record_hit(REPLAN_GEO_LAYER, time.perf_counter() - started)
+            data = {
+                "anchor": anchor_name,
+                "request_summary": f"Detected request type: {intent} (reusing suggestions cached near this stop)",
+                "suggestions": nearby
+            }
+            # Saved under the exact key only, so reused results never seed further geo hits.
+            append_replan_cache_record({**replan_record(data), "geo_hit": True})
+            try:
+                get_cache_store().incr_counter("replan_geo_hits")
+            except Exception:
+                pass
+            st.session_state.replan_cache_hit = True
+            st.session_state.replan_geo_hit = True
+            st.session_state.replan_saved_ok = True
+            return data
+
     strict_rules = {
         "shopping": """
 - If the user asks for shopping, return ONLY shopping-related places.
@@ -1303,12 +2058,10 @@ def ollama_midtrip_replan_options(
     }[intent]
 
     prompt = f"""
-You are a smart travel replanning assistant for {destination}.
+New replanning request.
 
 Current context:
 - Day: {day_num}
-- Traveler interests: {", ".join(interests) if interests else "General sightseeing"}
-- Pace: {pace}
 - Current / anchor stop: {anchor_name}
 - Remaining planned stops today: {remaining_text}
 - User request: {user_request}
@@ -1317,48 +2070,52 @@ Task:
 Suggest {n} strong options for the rest of today.
 
 STRICT RULES:
-1) Suggest real places likely to exist in or near {destination}
-2) Suggestions should fit naturally with today's remaining plan
-3) Avoid repeating the current anchor stop
-4) Favor literal relevance to the user request
-5) Keep options realistic for the same day
-6) {strict_rules}
-7) Return ONLY valid JSON with this schema:
+1) Suggestions should fit naturally with today's remaining plan
+2) Avoid repeating the current anchor stop
+3) Favor literal relevance to the user request
+4) {strict_rules}
+5) Return ONLY valid JSON with this schema:
 {json.dumps(schema, indent=2)}
 """.strip()
 
-    raw = call_ollama(prompt, model_name)
-    json_text = _extract_json_block(raw)
-    if not json_text:
-        raise ValueError("No valid JSON from mid-trip replanning step.")
-
-    data = json.loads(json_text)
-    suggestions = data.get("suggestions", [])
-    filtered = filter_replan_suggestions_by_intent(suggestions, intent)
-    data["suggestions"] = filtered
-
-    if not data.get("request_summary"):
-        data["request_summary"] = f"Detected request type: {intent}"
-
-    if intent != "general" and not filtered:
-        data["request_summary"] = f"No strong {intent}-only suggestions found. Try a slightly broader request."
-
-    record = {
-        "cache_key": replan_cache_key,
-        "created_at": datetime.now().isoformat(timespec="seconds"),
-        "destination": destination,
-        "day_num": int(day_num),
-        "anchor_name": anchor_name,
-        "interests": _normalize_interests(interests),
-        "pace": pace,
-        "remaining_stops": remaining_names,
-        "user_request": user_request,
-        "model": model_name,
-        "n": int(n),
-        "replan_result": data
-    }
+    def generate() -> dict:
+        existing = load_replan_cached_record(replan_cache_key)
+        if existing:
+            return existing["replan_result"]
 
-    append_replan_cache_record(record)
+        generation_started = time.perf_counter()
+        raw = call_ollama_in_trip_context(
+            prompt, destination, interests, pace, model_name, replan_token_budget(n)
+        )
+        json_text = _extract_json_block(raw)
+        if not json_text:
+            raise ValueError("No valid JSON from mid-trip replanning step.")
+
+        data = json.loads(json_text)
+        suggestions = data.get("suggestions", [])
+        filtered = filter_replan_suggestions_by_intent(suggestions, intent)
+        data["suggestions"] = filtered
+
+        if not data.get("request_summary"):
+            data["request_summary"] = f"Detected request type: {intent}"
+
+        if intent != "general" and not filtered:
+            data["request_summary"] = f"No strong {intent}-only suggestions found. Try a slightly broader request."
+
+        record = replan_record(data)
+        record["generation_sec"] = round(time.perf_counter() - generation_started, 3)
+        metrics.record_cost(REPLAN_CACHE, record["generation_sec"])
+        group_key = None
+        if anchor_coords:
+            cell = geohash_encode(anchor_coords[0], anchor_coords[1], REPLAN_GEO_PRECISION)
+            record.update({"anchor_lat": anchor_coords[0], "anchor_lon": anchor_coords[1], "intent": intent})
+            group_key = replan_geo_group_key(cell, intent, model_name)
+
+        append_replan_cache_record(record, group_key)
+        return data
+
+    data, shared = get_single_flight().do(f"replan:{replan_cache_key}", generate)
+    st.session_state.replan_cache_hit = shared
     st.session_state.replan_saved_ok = True
     return data
 
@@ -1581,30 +2338,25 @@ def ollama_review_replace_options(
     user_request = (user_request or "").strip()
 
     prompt = f"""
-You are helping replace one travel stop in an itinerary.
+New request: replace one travel stop in the itinerary.
 
 Context:
-- Destination: {destination}
 - Day: {day_num}
 - Current stop to replace: {current_stop.name}
 - Current stop category: {current_stop.category}
-- Traveler interests: {", ".join(interests) if interests else "General sightseeing"}
-- Pace: {pace}
 - What the user wants instead: {user_request if user_request else "A suitable alternative"}
 
 Task:
 Suggest {n} strong replacement options for this stop.
 
 Rules:
-1) Suggest real places likely to exist in or near {destination}
-2) Suggestions must match what the user wants instead
-3) Do not repeat the same place as the current stop
-4) Keep the options realistic for the same day and same trip style
-5) Return ONLY valid JSON using this schema:
+1) Suggestions must match what the user wants instead
+2) Do not repeat the same place as the current stop
+3) Return ONLY valid JSON using this schema:
 {json.dumps(schema, indent=2)}
 """.strip()
 
-    raw = call_ollama(prompt, model_name)
+    raw = call_ollama_in_trip_context(prompt, destination, interests, pace, model_name, REVIEW_REPLACE_TOKENS)
     json_text = _extract_json_block(raw)
     if not json_text:
         raise ValueError("No valid JSON returned for replacement suggestions.")
@@ -2735,6 +3487,10 @@ if (restoreState.targetStopId !== undefined && restoreState.targetStopId !== nul
     html(html_content, height=780, scrolling=False)
 
 
+# Keep this session's model loaded (on reruns this only marks it as still in use)
+start_ollama_keep_warm(st.session_state.ollama_model)
+start_cache_compactor()
+
 # ============================================================
 # SIDEBAR
 # ============================================================
@@ -2758,8 +3514,19 @@ with st.sidebar:
     st.markdown("### 🧠 Model")
     st.session_state.ollama_model = st.text_input("Ollama model name", value=st.session_state.ollama_model)
 
-    if ollama_available(st.session_state.ollama_model):
+    model_ready = ollama_available(st.session_state.ollama_model)
+    if model_ready is None:
+        st.info("⏳ Checking Ollama status...")
+    elif model_ready:
         st.success(f"✅ Ollama ready: {st.session_state.ollama_model}")
+        warm_stats = start_ollama_keep_warm(st.session_state.ollama_model)
+        if warm_stats["cold"]:
+            warm_runs = warm_stats["warm"]
+            warm_avg = sum(x["latency_sec"] for x in warm_runs) / len(warm_runs) if warm_runs else None
+            st.caption(
+                f"Model load — cold start: {warm_stats['cold']['latency_sec']:.1f}s"
+                + (f" · warm ping: {warm_avg:.2f}s" if warm_avg is not None else " · warm ping: pending")
+            )
     else:
         st.warning(
             f"⚠️ Ollama not ready or model not pulled: **{st.session_state.ollama_model}**\n\n"
@@ -2768,6 +3535,69 @@ with st.sidebar:
             f"`ollama pull {st.session_state.ollama_model.split(':')[0]}`"
         )
 
+    for name, stats in get_llm_router().stats().items():
+        if stats["calls"]:
+            st.caption(
+                f"LLM `{name}`: p50 {stats['p50'] or 0:.1f}s · p95 {stats['p95'] or 0:.1f}s · "
+                f"errors {stats['error_rate']:.0%} ({stats['calls']} calls)"
+            )
+
+    for mode, stats in summarize_repair_rate().items():
+        st.caption(
+            f"JSON mode `{mode}`: {stats['parse_failures']} parse failure(s), {stats['repairs']} repair(s) "
+            f"in {stats['generations']} generation(s)"
+        )
+
+    store_summary = summarize_cache_stores()
+    for cache, cache_stats in store_summary["caches"].items():
+        st.caption(
+            f"{cache.capitalize()} cache: {cache_stats['entries']} entries · "
+            f"{cache_stats['bytes'] / (1024 * 1024):.1f} MB"
+        )
+    counters = store_summary["counters"]
+    near_hits = counters.get("itinerary_near_hits", 0)
+    if near_hits:
+        st.caption(f"Near-hit cache reuse avoided {near_hits} generation(s)")
+    geo_hits = counters.get("replan_geo_hits", 0)
+    if geo_hits:
+        st.caption(f"Nearby replan reuse avoided {geo_hits} Ollama call(s)")
+    fuzzy_avoided = counters.get("geocode_fuzzy_avoided", 0)
+    fuzzy_rescued = counters.get("geocode_fuzzy_rescued", 0)
+    if fuzzy_avoided or fuzzy_rescued:
+        st.caption(
+            f"Fuzzy place-name reuse avoided {fuzzy_avoided} network geocode(s) "
+            f"and placed {fuzzy_rescued} otherwise not-found stop(s)"
+        )
+    geocode_stats = store_summary["geocode"]
+    if geocode_stats["hit_ratio"] is not None:
+        st.caption(
+            f"Geocode store hit rate {geocode_stats['hit_ratio']:.0%} "
+            f"({geocode_stats['negative_hits']} known not-found skipped)"
+        )
+    compactor = start_cache_compactor()
+    if compactor["last_run"]:
+        st.caption(
+            f"Last compaction {compactor['last_run']}: "
+            f"{compactor['expired']} expired · {compactor['evicted']} evicted so far"
+        )
+
+    with st.expander("📊 Cache metrics", expanded=False):
+        report = cached_cache_metrics_report()
+        rows = [{"layer": name, **stats} for name, stats in report["layers"].items()]
+        if rows:
+            st.dataframe(rows, hide_index=True, use_container_width=True)
+            saved_min = sum(row["seconds_saved"] for row in rows) / 60
+            st.caption(f"≈ {saved_min:.1f} min of LLM/network time saved since {report['since']}")
+        else:
+            st.caption("No cache lookups in this server process yet.")
+        st.download_button(
+            "⬇️ Download metrics (JSON)",
+            json.dumps(report, indent=2),
+            file_name="cache_metrics.json",
+            mime="application/json",
+            use_container_width=True
+        )
+
     st.markdown("---")
 
     if st.button("🏠 Start Over", use_container_width=True):
@@ -2777,14 +3607,15 @@ with st.sidebar:
         st.rerun()
 
     if st.button("🧹 Clear itinerary cache", use_container_width=True):
-        if CACHE_JSONL.exists():
-            CACHE_JSONL.unlink()
+        get_cache_store().clear(ITINERARY_CACHE)
+        summarize_repair_rate.clear()
+        summarize_cache_stores.clear()
         st.success("Cache cleared.")
         st.rerun()
 
     if st.button("🧹 Clear replan cache", use_container_width=True):
-        if REPLAN_CACHE_JSONL.exists():
-            REPLAN_CACHE_JSONL.unlink()
+        get_cache_store().clear(REPLAN_CACHE)
+        summarize_cache_stores.clear()
         st.success("Replan cache cleared.")
         st.rerun()
 
@@ -2866,6 +3697,14 @@ if st.session_state.stage == "input":
             "base_location_text": base_location_text
         }
 
+        progress_box = st.empty()
+
+        def show_day_ready(day_itin: DayItinerary):
+            progress_box.info(
+                f"✅ Day {day_itin.day_number} of {int(days)} ready — "
+                f"{len(day_itin.locations)} stops geocoded and scheduled."
+            )
+
         try:
             with st.spinner("Generating itinerary and geocoding locations..."):
                 st.session_state.itinerary = build_itinerary_from_ollama(
@@ -2873,7 +3712,8 @@ if st.session_state.stage == "input":
                     int(days),
                     interests,
                     pace,
-                    must_visit_locations
+                    must_visit_locations,
+                    on_day_ready=show_day_ready
                 )
                 st.session_state.base_location = resolve_base_location(base_location_text, destination)
 
@@ -2920,7 +3760,7 @@ elif st.session_state.stage == "review":
     # Combined Trip Summary
     # ---------------------------
     overview_text = ""
-    raw_pretty = st.session_state.get("llama_pretty_text", "").strip()
+    raw_pretty = get_llama_pretty_text().strip()
 
     if raw_pretty:
         first_line = raw_pretty.split("\n")[0].strip()
@@ -3238,7 +4078,9 @@ elif st.session_state.stage == "review":
     # Cache message
     # ---------------------------
     if st.session_state.llama_saved_ok:
-        if st.session_state.llama_cache_hit:
+        if st.session_state.llama_near_hit:
+            st.success("✅ Itinerary adapted from a compatible cached plan.")
+        elif st.session_state.llama_cache_hit:
             st.success("✅ Itinerary loaded from cache.")
         else:
             st.success("✅ Itinerary saved in background for reuse.")
@@ -3499,7 +4341,10 @@ elif st.session_state.stage == "live_trip":
                             remaining_stops=remaining,
                             user_request=st.session_state.replan_request_text,
                             model_name=st.session_state.ollama_model,
-                            n=5
+                            n=5,
+                            # Approximate stops sit on the city centre, which says nothing about the neighbourhood.
+                            anchor_coords=(anchor_loc.lat, anchor_loc.lon)
+                            if anchor_loc and not anchor_loc.approximate_location else None
                         )
 
                     st.session_state.replan_results = {
@@ -3522,10 +4367,18 @@ elif st.session_state.stage == "live_trip":
             suggestions = results_pack["data"].get("suggestions", [])
             summary = results_pack["data"].get("request_summary", "")
 
-            if st.session_state.replan_cache_hit:
+            if st.session_state.replan_cache_hit and st.session_state.replan_geo_hit:
+                st.success("✅ Replan suggestions reused from nearby stops in the replan cache.")
+            elif st.session_state.replan_cache_hit:
                 st.success("✅ Replan suggestions loaded from replan cache.")
             elif st.session_state.replan_saved_ok:
                 st.success("✅ Replan suggestions generated and saved for reuse.")
+                prompt_eval = st.session_state.replan_prompt_eval
+                if prompt_eval:
+                    st.caption(
+                        f"Prompt eval: {prompt_eval['tokens']} tokens in {prompt_eval['sec']}s"
+                        + (" (trip context reused)" if prompt_eval["reused_context"] else "")
+                    )
 
             if summary:
                 st.markdown(f'<div class="info-box"><b>AI understanding:</b> {summary}</div>', unsafe_allow_html=True)
@@ -0,0 +1,177 @@
+"""
+Cache store benchmarks.
+
+    python bench_cache_store.py lookup --records 10000 100000
+        legacy JSONL linear scan vs. the indexed CacheStore
+    python bench_cache_store.py format --records 5000
+        plain JSON records vs. compressed, content-addressed records
+"""
+import argparse
+import hashlib
+import json
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from cache_store import CacheStore
+
+PLACES = ["Museum", "Market", "Park", "Cathedral", "Gallery", "Harbor", "Old Town", "Tower", "Garden", "Bridge"]
+SLOTS = [("Morning", "08:30", "12:00"), ("Lunch", "12:30", "13:30"), ("Afternoon", "13:45", "17:30"),
+         ("Evening", "18:00", "20:00"), ("Dinner", "20:00", "21:30")]
+
+
+def make_record(i: int) -> dict:
+    stops = [
+        {"name": f"Stop {i}-{j}", "category": "Landmark", "duration_min": 60, "description": "x" * 120}
+        for j in range(12)
+    ]
+    return {
+        "cache_key": hashlib.md5(str(i).encode("utf-8")).hexdigest(),
+        "created_at": "2026-01-01T00:00:00",
+        "destination": f"City {i % 500}",
+        "days": 3,
+        "itinerary_json": {"overview": "", "days": [{"day": 1, "slots": [{"slot": "Morning", "stops": stops}]}]},
+    }
+
+
+def make_realistic_record(i: int, rng: random.Random) -> dict:
+    """Shaped like save_itinerary_to_cache output: raw LLM text, parsed plan and markdown view."""
+    days = rng.randint(1, 6)
+    city = f"City {i % 300}"
+    plan = {"overview": f"A {days}-day trip through {city} balancing sights, food and downtime.", "days": []}
+    for d in range(1, days + 1):
+        slots = []
+        for slot, start, end in SLOTS:
+            stops = [{
+                "name": f"{city} {rng.choice(PLACES)} {rng.randint(1, 40)}",
+                "category": rng.choice(["Culture", "Food", "Outdoor", "Shopping"]),
+                "duration_min": rng.choice([30, 45, 60, 90, 120]),
+                "description": "A well-loved local spot with history, views and plenty to see nearby. " * 2,
+            } for _ in range(rng.randint(1, 3))]
+            slots.append({"slot": slot, "start": start, "end": end, "stops": stops})
+        plan["days"].append({"day": d, "slots": slots})
+
+    pretty = "\n".join(
+        f"## Day {day['day']}\n" + "\n".join(
+            f"{n}. **{stop['name']}** ({stop['duration_min']} min) — {stop['description']}"
+            for slot in day["slots"] for n, stop in enumerate(slot["stops"], start=1)
+        )
+        for day in plan["days"]
+    )
+    return {
+        "cache_key": hashlib.md5(f"real-{i}".encode("utf-8")).hexdigest(),
+        "created_at": "2026-01-01T00:00:00",
+        "destination": city,
+        "days": days,
+        "interests": ["Culture", "Food"],
+        "pace": "Balanced",
+        "model": "llama3:latest",
+        "llama_raw_output": json.dumps(plan, indent=2),
+        "llama_pretty_text": pretty,
+        "itinerary_json": plan,
+    }
+
+
+def linear_scan(path: Path, cache_key: str):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            rec = json.loads(line)
+            if rec.get("cache_key") == cache_key:
+                return rec
+    return None
+
+
+def timed(fn, keys) -> float:
+    started = time.perf_counter()
+    for key in keys:
+        fn(key)
+    return (time.perf_counter() - started) / len(keys) * 1000
+
+
+def db_size(path: Path) -> int:
+    conn = sqlite3.connect(str(path))
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    return path.stat().st_size
+
+
+def run_lookup(n: int, lookups: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        jsonl = Path(tmp) / "cache.jsonl"
+        keys = []
+        with open(jsonl, "w", encoding="utf-8") as f:
+            for i in range(n):
+                rec = make_record(i)
+                keys.append(rec["cache_key"])
+                f.write(json.dumps(rec) + "\n")
+
+        store = CacheStore(Path(tmp) / "cache.sqlite3")
+        started = time.perf_counter()
+        store.migrate_jsonl("itinerary", jsonl)
+        migrate_sec = time.perf_counter() - started
+
+        hit_keys = random.sample(keys, lookups)
+        miss_keys = [hashlib.md5(f"miss-{i}".encode("utf-8")).hexdigest() for i in range(lookups)]
+        scan_lookups = max(1, lookups // 20)
+
+        print(f"\n{n:,} records ({jsonl.stat().st_size / 1e6:.0f} MB JSONL), migration {migrate_sec:.1f}s")
+        print(f"  JSONL scan  hit {timed(lambda k: linear_scan(jsonl, k), hit_keys[:scan_lookups]):10.3f} ms"
+              f"   miss {timed(lambda k: linear_scan(jsonl, k), miss_keys[:scan_lookups]):10.3f} ms")
+        print(f"  CacheStore  hit {timed(lambda k: store.get('itinerary', k), hit_keys):10.3f} ms"
+              f"   miss {timed(lambda k: store.get('itinerary', k), miss_keys):10.3f} ms")
+
+
+def run_format(n: int, near_hit_share: float) -> None:
+    rng = random.Random(7)
+    records = [make_realistic_record(i, rng) for i in range(n)]
+    # Near hits are saved under their own key but reuse the source's raw output.
+    for i in range(int(n * near_hit_share)):
+        records.append({**rng.choice(records[:n]), "cache_key": hashlib.md5(f"near-{i}".encode()).hexdigest()})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for label, kwargs, strip_pretty in (
+                ("plain JSON", {"compress": False}, False),
+                ("compressed + CAS", {"blob_fields": {"itinerary": ("llama_raw_output",)}}, True),
+        ):
+            path = Path(tmp) / f"{label.split()[0]}.sqlite3"
+            store = CacheStore(path, **kwargs)
+            for rec in records:
+                if strip_pretty:
+                    rec = {k: v for k, v in rec.items() if k != "llama_pretty_text"}
+                store.put("itinerary", rec["cache_key"], rec)
+
+            cold = CacheStore(path, **kwargs)
+            keys = [rec["cache_key"] for rec in records]
+            read_ms = timed(lambda k: cold.get("itinerary", k), keys)
+            started = time.perf_counter()
+            CacheStore(path, **kwargs).preload("itinerary")
+            results[label] = (db_size(path), read_ms, time.perf_counter() - started)
+
+        print(f"\n{len(records):,} records ({near_hit_share:.0%} near-hit copies)")
+        for label, (size, read_ms, preload_sec) in results.items():
+            print(f"  {label:18} {size / 1e6:8.1f} MB   cold get {read_ms:7.3f} ms   preload {preload_sec:6.2f} s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Cache store benchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+    lookup = sub.add_parser("lookup")
+    lookup.add_argument("--records", type=int, nargs="+", default=[10_000, 100_000])
+    lookup.add_argument("--lookups", type=int, default=200)
+    fmt = sub.add_parser("format")
+    fmt.add_argument("--records", type=int, nargs="+", default=[5_000])
+    fmt.add_argument("--near-hit-share", type=float, default=0.3)
+    args = parser.parse_args()
+
+    for n in args.records:
+        if args.bench == "lookup":
+            run_lookup(n, args.lookups)
+        else:
+            run_format(n, args.near_hit_share)
+
+
+if __name__ == "__main__":
+    main()
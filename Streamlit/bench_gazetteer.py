@@ -0,0 +1,154 @@
+"""
+Offline gazetteer lookup benchmark.
+
+    python bench_gazetteer.py --places 10000 100000
+        exact, prefix, fuzzy (misspelt) and missing-name lookups per query
+    python bench_gazetteer.py --extract gazetteer/paris.csv --queries "Louvre, Paris" "Musee d'Orsay, Paris"
+        load a real extract and show what each query resolves to
+    python bench_gazetteer.py --check
+        name-variant regression checks for ResolvedPlaces and the gazetteer; exits non-zero on a wrong answer
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+from gazetteer import Gazetteer, ResolvedPlaces, normalize_name
+
+KINDS = ["Market", "Garden", "Museum", "Tower", "Bridge", "Palace", "Harbor", "Chapel", "Gallery", "Square",
+         "Hall", "Park", "Library", "Theatre", "Fountain", "Church", "Cafe", "Gate", "Street", "Station"]
+SYLLABLES = ["ba", "ri", "lon", "ma", "ste", "vel", "cor", "an", "tis", "do", "mer", "gua", "shi", "ku", "pol",
+             "en", "ra", "tho", "zi", "fel", "nor", "sa", "que", "lu"]
+
+
+def make_name(rng: random.Random, i: int) -> str:
+    """Invented names shaped like real POIs: one or two proper names and a kind."""
+    words = ["".join(rng.choices(SYLLABLES, k=rng.randint(2, 3))).title() for _ in range(rng.randint(1, 2))]
+    return f"{' '.join(words)} {rng.choice(KINDS)} {i}"
+
+
+def misspell(rng: random.Random, name: str) -> str:
+    """Swaps two neighbouring letters inside a word, the way names get mistyped."""
+    pos = rng.choice([i for i in range(1, len(name) - 1) if name[i:i + 2].isalpha()])
+    return name[:pos] + name[pos + 1] + name[pos] + name[pos + 2:]
+
+
+def timed_us(gazetteer: Gazetteer, queries) -> tuple:
+    started = time.perf_counter()
+    found = sum(1 for q in queries if gazetteer.geocode(q))
+    return (time.perf_counter() - started) / len(queries) * 1e6, found
+
+
+def run_synthetic(n: int, lookups: int) -> None:
+    rng = random.Random(7)
+    gazetteer = Gazetteer()
+    names = [make_name(rng, i) for i in range(n)]
+    started = time.perf_counter()
+    for name in names:
+        gazetteer.add(name, 48.8 + rng.random() / 10, 2.3 + rng.random() / 10, "Benchville")
+    gazetteer.geocode("warm up, Benchville")
+    load_sec = time.perf_counter() - started
+
+    sample = rng.sample(names, lookups)
+    cases = {
+        "exact": [f"{name}, Benchville" for name in sample],
+        "prefix": [f"{name.rsplit(' ', 1)[0]}, Benchville" for name in sample],
+        "fuzzy": [f"{misspell(rng, name)}, Benchville" for name in sample],
+        "missing": [f"Nowhere Street {i}, Benchville" for i in range(lookups)],
+    }
+    print(f"\n{n:,} places indexed in {load_sec:.2f}s")
+    for label, queries in cases.items():
+        per_query, found = timed_us(gazetteer, queries)
+        print(f"  {label:8} {per_query:9.1f} µs/query   matched {found}/{len(queries)}")
+
+
+def run_extract(path: Path, queries) -> None:
+    gazetteer = Gazetteer()
+    loader = gazetteer.load_csv if path.suffix.lower() == ".csv" else gazetteer.load_geojson
+    started = time.perf_counter()
+    count = loader(path)
+    print(f"{count:,} places from {path} in {time.perf_counter() - started:.2f}s")
+    for query in queries:
+        started = time.perf_counter()
+        match = gazetteer.search(query)
+        elapsed_us = (time.perf_counter() - started) * 1e6
+        found = f"{match.place.name} ({match.how}, {match.score:.2f})" if match else "no match"
+        print(f"  {query:40} -> {found}   {elapsed_us:.0f} µs")
+
+
+RESOLVED_DC = {
+    "National Museum of American History": (38.8913, -77.0300),
+    "National Museum of African American History and Culture": (38.8911, -77.0326),
+    "National Air and Space Museum": (38.8882, -77.0199),
+    "Lincoln Memorial": (38.8893, -77.0502),
+    "Vietnam Veterans Memorial": (38.8912, -77.0477),
+    "Rock Creek Park": (38.9296, -77.0497),
+    "Smithsonian Castle": (38.8888, -77.0260),
+    "Smithsonian National Zoo": (38.9296, -77.0498),
+    "National Gallery of Art": (38.8913, -77.0199),
+}
+# Query -> known name it must reuse, or None when it is a different place and must go to the geocoder.
+RESOLVED_CHECKS = {
+    "Vietnam Memorial": "Vietnam Veterans Memorial",
+    "Rock Creek": "Rock Creek Park",
+    "Linclon Memorial": "Lincoln Memorial",
+    "Smithsonian Air and Space": "National Air and Space Museum",
+    "Museum of American History": "National Museum of American History",
+    "National Museum of the American Indian": None,
+    "National Museum of African American History and Culture": "National Museum of African American History and Culture",
+    "National Museum of African American History": "National Museum of African American History and Culture",
+    "National Portrait Gallery": None,
+}
+# Gazetteer query -> place it must resolve to, or None when the extract does not hold it.
+GAZETTEER_CHECKS = {
+    "Linclon Memorial, Washington DC": "Lincoln Memorial",
+    "Vietnam Veteran Memorial, Washington DC": "Vietnam Veterans Memorial",
+    "National Air and Space, Washington DC": "National Air and Space Museum",
+    "National Museum of the American Indian, Washington DC": None,
+    "National Portrait Gallery, Washington DC": None,
+    "Lincoln, Washington DC": None,
+}
+
+
+def run_checks() -> int:
+    resolved = ResolvedPlaces()
+    gazetteer = Gazetteer()
+    for name, coords in RESOLVED_DC.items():
+        resolved.add("Washington DC", name, coords)
+        gazetteer.add(name, coords[0], coords[1], "Washington DC")
+    gazetteer.add("Lincoln Park", 38.8897, -76.9904, "Washington DC")
+
+    cases = [(resolved.match, f"{query}, Washington DC", expected) for query, expected in RESOLVED_CHECKS.items()]
+    cases += [(gazetteer.search, query, expected) for query, expected in GAZETTEER_CHECKS.items()]
+    failures = 0
+    for lookup, query, expected in cases:
+        match = lookup(query)
+        got = normalize_name(match.place.name) if match else None
+        ok = got == (normalize_name(expected) if expected else None)
+        failures += not ok
+        print(f"  {'ok  ' if ok else 'FAIL'} {query:72} -> {got or 'no match'}")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline gazetteer lookup benchmark")
+    parser.add_argument("--places", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--extract", type=Path, help="CSV or GeoJSON extract to query instead")
+    parser.add_argument("--queries", nargs="+", default=[])
+    parser.add_argument("--check", action="store_true", help="run the name-matching regression checks")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(1 if run_checks() else 0)
+
+    if args.extract:
+        run_extract(args.extract, args.queries)
+        return
+    for n in args.places:
+        run_synthetic(n, args.lookups)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,564 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+BLOB_REF = "$blob"
+
+
+def read_jsonl_tolerant(path: Path) -> Iterator[dict]:
+    """
+    Yields the JSON objects of an append-only JSONL file written by several
+    processes without locking. A torn write leaves a partial record glued to
+    the front of the next one; such lines are scanned for complete objects,
+    so only the partial record is lost.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                obj = json.loads(line)
+            except ValueError:
+                obj = None
+                start = line.find("{", 1)
+                while start != -1:
+                    try:
+                        obj, end = decoder.raw_decode(line, start)
+                    except ValueError:
+                        start = line.find("{", start + 1)
+                        continue
+                    if isinstance(obj, dict):
+                        yield obj
+                    obj = None
+                    start = line.find("{", end)
+            if isinstance(obj, dict):
+                yield obj
+
+
+# ============================================================
+# INDEXED CACHE STORE
+# ============================================================
+class CacheStore:
+    """
+    SQLite-backed store for the itinerary and replan caches.
+
+    Records are zlib-compressed JSON payloads under a (cache, cache_key)
+    primary key, so a lookup is one index probe and a miss never parses a
+    payload. Large text fields listed in blob_fields (per cache) are stored
+    once per distinct content in a content-addressed blobs table and
+    referenced by hash; unreferenced blobs are collected on delete. Rows
+    written before compression existed stay readable as plain JSON. Several
+    named caches share one database file. Connections are per thread because
+    the store is shared by every Streamlit session and the worker pools.
+
+    Reads never write: hits are remembered in memory and their access times
+    are flushed by compact(), which also applies the TTL and LRU limits.
+
+    On top sits a process-wide hot tier of already-parsed records. preload()
+    fills it for a whole cache, after which misses skip SQLite entirely; writes
+    through this store update it in place. Every write bumps a generation
+    counter in the database, and a lookup that sees a generation this process
+    did not produce (another process wrote) drops the tier and refills it
+    lazily. Hot records are shared objects: callers must not mutate them.
+
+    Several server processes may share one file: SQLite's WAL locking
+    serialises writers (each waits up to busy_timeout_sec), every write is a
+    single transaction, and schema setup and the JSONL import run under
+    BEGIN IMMEDIATE so concurrent first starts do the work exactly once.
+    """
+
+    def __init__(
+            self,
+            db_path: Path,
+            compress: bool = True,
+            blob_fields: Optional[Dict[str, Tuple[str, ...]]] = None,
+            busy_timeout_sec: float = 30
+    ):
+        self.db_path = Path(db_path)
+        self.compress = compress
+        self.busy_timeout_sec = busy_timeout_sec
+        self.blob_fields = blob_fields or {}
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._touch_lock = threading.Lock()
+        self._touched: Dict[tuple, float] = {}
+        self._hot_lock = threading.Lock()
+        self._hot: Dict[str, Dict[str, dict]] = {}
+        self._hot_complete: Dict[str, bool] = {}
+        self._generation = None
+
+        conn = self._conn()
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            # Incremental auto-vacuum lets compaction hand pages back without a blocking VACUUM.
+            # Only possible while no other process holds the file; otherwise a later start retries.
+            try:
+                conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                conn.execute("VACUUM")
+            except sqlite3.OperationalError:
+                pass
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache_records (
+                cache TEXT NOT NULL,
+                cache_key TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                last_access REAL NOT NULL DEFAULT 0,
+                size_bytes INTEGER NOT NULL DEFAULT 0,
+                group_key TEXT,
+                PRIMARY KEY (cache, cache_key)
+            ) WITHOUT ROWID
+        """)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(cache_records)")}
+        if "last_access" not in columns:
+            conn.execute("ALTER TABLE cache_records ADD COLUMN last_access REAL NOT NULL DEFAULT 0")
+            conn.execute("ALTER TABLE cache_records ADD COLUMN size_bytes INTEGER NOT NULL DEFAULT 0")
+            conn.execute(
+                "UPDATE cache_records SET last_access = ?, size_bytes = length(CAST(payload AS BLOB))",
+                (time.time(),)
+            )
+        if "group_key" not in columns:
+            conn.execute("ALTER TABLE cache_records ADD COLUMN group_key TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_records_group ON cache_records (cache, group_key)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS migrations (
+                source TEXT PRIMARY KEY,
+                migrated_at TEXT NOT NULL,
+                records INTEGER NOT NULL
+            )
+        """)
+        conn.execute("CREATE TABLE IF NOT EXISTS store_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.execute("INSERT OR IGNORE INTO store_meta (name, value) VALUES ('generation', 0)")
+        conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS blobs (hash TEXT PRIMARY KEY, data BLOB NOT NULL) WITHOUT ROWID")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS record_blobs (
+                cache TEXT NOT NULL,
+                cache_key TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                PRIMARY KEY (cache, cache_key, hash)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_record_blobs_hash ON record_blobs (hash)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=self.busy_timeout_sec)
+            self._local.conn = conn
+        return conn
+
+    def _read_generation(self, conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT value FROM store_meta WHERE name = 'generation'").fetchone()[0]
+
+    def _bump_generation(self, conn: sqlite3.Connection) -> int:
+        """Called inside a write transaction; the UPDATE takes the write lock before the read."""
+        conn.execute("UPDATE store_meta SET value = value + 1 WHERE name = 'generation'")
+        return self._read_generation(conn)
+
+    def _drop_hot_locked(self) -> None:
+        self._hot = {}
+        self._hot_complete = {}
+
+    def _sync_generation(self) -> None:
+        generation = self._read_generation(self._conn())
+        if generation != self._generation:
+            with self._hot_lock:
+                if generation != self._generation:
+                    self._drop_hot_locked()
+                    self._generation = generation
+
+    def _after_write(self, new_generation: int) -> None:
+        """Call with _hot_lock held, after committing a write that bumped the generation."""
+        if self._generation not in (new_generation - 1, new_generation):
+            self._drop_hot_locked()
+        self._generation = new_generation
+
+    def _encode(self, cache: str, record: dict) -> Tuple[bytes, Dict[str, bytes]]:
+        """Returns the stored payload plus {hash: compressed text} for its blob fields."""
+        blobs = {}
+        stored = record
+        for field in self.blob_fields.get(cache, ()):
+            text = record.get(field)
+            if not isinstance(text, str) or not text:
+                continue
+            digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            blobs[digest] = zlib.compress(text.encode("utf-8"))
+            if stored is record:
+                stored = dict(record)
+            stored[field] = {BLOB_REF: digest}
+
+        payload = json.dumps(stored, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return (zlib.compress(payload) if self.compress else payload), blobs
+
+    def _decode(self, conn: sqlite3.Connection, payload, blob_memo: Optional[Dict[str, str]] = None) -> dict:
+        if isinstance(payload, bytes):
+            payload = zlib.decompress(payload) if payload[:1] == b"\x78" else payload
+        record = json.loads(payload)
+
+        for field, value in record.items():
+            if isinstance(value, dict) and set(value) == {BLOB_REF}:
+                digest = value[BLOB_REF]
+                text = blob_memo.get(digest) if blob_memo is not None else None
+                if text is None:
+                    row = conn.execute("SELECT data FROM blobs WHERE hash = ?", (digest,)).fetchone()
+                    text = zlib.decompress(row[0]).decode("utf-8") if row else ""
+                    if blob_memo is not None:
+                        blob_memo[digest] = text
+                record[field] = text
+        return record
+
+    def _write_record(
+            self,
+            conn: sqlite3.Connection,
+            cache: str,
+            cache_key: str,
+            record: dict,
+            group_key: Optional[str],
+            replace: bool = True
+    ) -> bool:
+        """Writes one record and its blobs inside the caller's transaction; False if it existed and replace=False."""
+        payload, blobs = self._encode(cache, record)
+        if replace:
+            self._unlink_blobs(conn, [(cache, cache_key)])
+        cursor = conn.execute(
+            ("INSERT OR REPLACE" if replace else "INSERT OR IGNORE") + " INTO cache_records "
+            "(cache, cache_key, created_at, payload, last_access, size_bytes, group_key) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                cache,
+                cache_key,
+                record.get("created_at") or datetime.now().isoformat(timespec="seconds"),
+                payload,
+                time.time(),
+                len(payload),
+                group_key,
+            )
+        )
+        if cursor.rowcount == 0:
+            return False
+        conn.executemany("INSERT OR IGNORE INTO blobs (hash, data) VALUES (?, ?)", list(blobs.items()))
+        conn.executemany(
+            "INSERT OR IGNORE INTO record_blobs (cache, cache_key, hash) VALUES (?, ?, ?)",
+            [(cache, cache_key, digest) for digest in blobs]
+        )
+        return True
+
+    def _unlink_blobs(self, conn: sqlite3.Connection, keys: Iterable[Tuple[str, str]]) -> None:
+        """Drops the records' blob links and any of their blobs nothing else references."""
+        hashes = set()
+        for cache, cache_key in keys:
+            hashes.update(h for (h,) in conn.execute(
+                "SELECT hash FROM record_blobs WHERE cache = ? AND cache_key = ?", (cache, cache_key)
+            ).fetchall())
+            conn.execute("DELETE FROM record_blobs WHERE cache = ? AND cache_key = ?", (cache, cache_key))
+        conn.executemany(
+            "DELETE FROM blobs WHERE hash = ? AND NOT EXISTS (SELECT 1 FROM record_blobs WHERE hash = ?)",
+            [(h, h) for h in hashes]
+        )
+
+    def _collect_blobs(self, conn: sqlite3.Connection) -> None:
+        conn.execute("DELETE FROM blobs WHERE hash NOT IN (SELECT hash FROM record_blobs)")
+
+    def preload(self, cache: str) -> int:
+        """Parse every record of a cache into the hot tier; later misses cost no I/O."""
+        conn = self._conn()
+        generation = self._read_generation(conn)
+        blob_memo: Dict[str, str] = {}
+        records = {
+            key: self._decode(conn, payload, blob_memo)
+            for key, payload in conn.execute(
+                "SELECT cache_key, payload FROM cache_records WHERE cache = ?", (cache,)
+            ).fetchall()
+        }
+        with self._hot_lock:
+            if self._generation not in (None, generation):
+                self._drop_hot_locked()
+            if self._generation is None or self._generation == generation:
+                self._generation = generation
+                self._hot[cache] = records
+                self._hot_complete[cache] = True
+        return len(records)
+
+    def get(self, cache: str, cache_key: str) -> Optional[dict]:
+        self._sync_generation()
+        with self._hot_lock:
+            hot = self._hot.get(cache)
+            rec = hot.get(cache_key) if hot is not None else None
+            complete = self._hot_complete.get(cache, False)
+
+        if rec is None and not complete:
+            conn = self._conn()
+            row = conn.execute(
+                "SELECT payload FROM cache_records WHERE cache = ? AND cache_key = ?",
+                (cache, cache_key)
+            ).fetchone()
+            if row:
+                rec = self._decode(conn, row[0])
+                with self._hot_lock:
+                    self._hot.setdefault(cache, {})[cache_key] = rec
+
+        if rec is None:
+            return None
+        with self._touch_lock:
+            self._touched[(cache, cache_key)] = time.time()
+        return rec
+
+    def put(self, cache: str, cache_key: str, record: dict, group_key: Optional[str] = None) -> None:
+        conn = self._conn()
+        with conn:
+            self._write_record(conn, cache, cache_key, record, group_key)
+            generation = self._bump_generation(conn)
+        with self._hot_lock:
+            self._after_write(generation)
+            self._hot.setdefault(cache, {})[cache_key] = record
+
+    def find_group(self, cache: str, group_key: str) -> List[dict]:
+        """All records sharing a group key (secondary index), parsed or taken from the hot tier."""
+        conn = self._conn()
+        rows = conn.execute(
+            "SELECT cache_key, payload FROM cache_records WHERE cache = ? AND group_key = ?",
+            (cache, group_key)
+        ).fetchall()
+        with self._hot_lock:
+            hot = dict(self._hot.get(cache, {}))
+        return [hot.get(key) or self._decode(conn, payload) for key, payload in rows]
+
+    def backfill_group_keys(self, cache: str, group_fn: Callable[[dict], Optional[str]]) -> int:
+        """Assign group keys to records written before they existed (e.g. migrated JSONL records)."""
+        conn = self._conn()
+        rows = conn.execute(
+            "SELECT cache_key, payload FROM cache_records WHERE cache = ? AND group_key IS NULL", (cache,)
+        ).fetchall()
+        updates = []
+        for key, payload in rows:
+            try:
+                group_key = group_fn(self._decode(conn, payload))
+            except Exception:
+                group_key = None
+            if group_key:
+                updates.append((group_key, cache, key))
+        with conn:
+            conn.executemany(
+                "UPDATE cache_records SET group_key = ? WHERE cache = ? AND cache_key = ?", updates
+            )
+        return len(updates)
+
+    def incr_counter(self, name: str, by: int = 1) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO counters (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                (name, by)
+            )
+
+    def counters(self) -> Dict[str, int]:
+        return dict(self._conn().execute("SELECT name, value FROM counters").fetchall())
+
+    def iter_records(self, cache: str) -> Iterator[dict]:
+        conn = self._conn()
+        blob_memo: Dict[str, str] = {}
+        for (payload,) in conn.execute("SELECT payload FROM cache_records WHERE cache = ?", (cache,)).fetchall():
+            yield self._decode(conn, payload, blob_memo)
+
+    def count(self, cache: str) -> int:
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM cache_records WHERE cache = ?", (cache,)
+        ).fetchone()[0]
+
+    def stats(self, cache: str) -> dict:
+        """Entry count and stored bytes, counting each blob the cache references once."""
+        conn = self._conn()
+        entries, size = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM cache_records WHERE cache = ?", (cache,)
+        ).fetchone()
+        return {"entries": entries, "bytes": size + self._blob_bytes(conn, cache)}
+
+    @staticmethod
+    def _blob_bytes(conn: sqlite3.Connection, cache: str) -> int:
+        return conn.execute(
+            "SELECT COALESCE(SUM(length(data)), 0) FROM blobs "
+            "WHERE hash IN (SELECT hash FROM record_blobs WHERE cache = ?)", (cache,)
+        ).fetchone()[0]
+
+    def _flush_touches(self, conn: sqlite3.Connection) -> None:
+        with self._touch_lock:
+            touched, self._touched = self._touched, {}
+        conn.executemany(
+            "UPDATE cache_records SET last_access = ? WHERE cache = ? AND cache_key = ?",
+            [(at, cache, key) for (cache, key), at in touched.items()]
+        )
+
+    def compact(
+            self,
+            cache: str,
+            max_entries: Optional[int] = None,
+            max_bytes: Optional[int] = None,
+            ttl_sec: Optional[float] = None
+    ) -> dict:
+        """
+        Drops records older than ttl_sec, then least-recently-used records until
+        the cache fits max_entries / max_bytes, and returns the freed pages to
+        the filesystem. Bytes are counted as in stats(): a blob weighs once and
+        is freed with the last record of the cache that references it. WAL mode
+        keeps readers going while this runs.
+        """
+        conn = self._conn()
+        expired = 0
+        evicted = 0
+        generation = None
+
+        with conn:
+            self._flush_touches(conn)
+
+            victims = []
+            if ttl_sec:
+                cutoff = (datetime.now() - timedelta(seconds=ttl_sec)).isoformat(timespec="seconds")
+                victims = conn.execute(
+                    "SELECT cache, cache_key FROM cache_records WHERE cache = ? AND created_at < ?", (cache, cutoff)
+                ).fetchall()
+                conn.executemany("DELETE FROM cache_records WHERE cache = ? AND cache_key = ?", victims)
+                self._unlink_blobs(conn, victims)
+                expired = len(victims)
+
+            stats = self.stats(cache)
+            entries, size = stats["entries"], stats["bytes"]
+            if (max_entries is not None and entries > max_entries) or (max_bytes is not None and size > max_bytes):
+                lru = conn.execute(
+                    "SELECT cache_key, size_bytes FROM cache_records WHERE cache = ? ORDER BY last_access ASC",
+                    (cache,)
+                ).fetchall()
+                key_blobs: Dict[str, List[str]] = {}
+                blob_refs: Dict[str, int] = {}
+                blob_sizes: Dict[str, int] = {}
+                for key, digest, blob_size in conn.execute(
+                        "SELECT rb.cache_key, rb.hash, length(b.data) FROM record_blobs rb "
+                        "JOIN blobs b ON b.hash = rb.hash WHERE rb.cache = ?", (cache,)
+                ):
+                    key_blobs.setdefault(key, []).append(digest)
+                    blob_refs[digest] = blob_refs.get(digest, 0) + 1
+                    blob_sizes[digest] = blob_size
+                for key, key_bytes in lru:
+                    if (max_entries is None or entries <= max_entries) and (max_bytes is None or size <= max_bytes):
+                        break
+                    victims.append((cache, key))
+                    entries -= 1
+                    size -= key_bytes
+                    for digest in key_blobs.get(key, ()):
+                        blob_refs[digest] -= 1
+                        if not blob_refs[digest]:
+                            size -= blob_sizes[digest]
+            if len(victims) > expired:
+                conn.executemany(
+                    "DELETE FROM cache_records WHERE cache = ? AND cache_key = ?", victims[expired:]
+                )
+                self._unlink_blobs(conn, victims[expired:])
+                evicted = len(victims) - expired
+
+            if victims:
+                generation = self._bump_generation(conn)
+
+        if generation is not None:
+            with self._hot_lock:
+                self._after_write(generation)
+                hot = self._hot.get(cache, {})
+                for _, key in victims:
+                    hot.pop(key, None)
+
+        conn.execute("PRAGMA incremental_vacuum").fetchall()
+        conn.commit()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        return {"expired": expired, "evicted": evicted}
+
+    def clear(self, cache: str) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM cache_records WHERE cache = ?", (cache,))
+            conn.execute("DELETE FROM record_blobs WHERE cache = ?", (cache,))
+            self._collect_blobs(conn)
+            generation = self._bump_generation(conn)
+        with self._hot_lock:
+            self._after_write(generation)
+            self._hot[cache] = {}
+            self._hot_complete[cache] = True
+
+    def backfill_counters(self, source: str, cache: str, count_record: Callable[[dict], Iterable[str]]) -> int:
+        """
+        One-time seeding of counters from the records already in cache:
+        count_record names the counters one record adds to. Runs once per
+        source across every process sharing the file (recorded like a JSONL
+        migration); blob fields are left unresolved. Returns the records
+        counted (0 once done).
+        """
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM migrations WHERE source = ?", (source,)).fetchone():
+            return 0
+
+        totals: Dict[str, int] = {}
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT 1 FROM migrations WHERE source = ?", (source,)).fetchone():
+                return 0
+            rows = conn.execute("SELECT payload FROM cache_records WHERE cache = ?", (cache,)).fetchall()
+            for (payload,) in rows:
+                if isinstance(payload, bytes):
+                    payload = zlib.decompress(payload) if payload[:1] == b"\x78" else payload
+                for name in count_record(json.loads(payload)):
+                    totals[name] = totals.get(name, 0) + 1
+            conn.executemany(
+                "INSERT INTO counters (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                list(totals.items())
+            )
+            conn.execute(
+                "INSERT INTO migrations (source, migrated_at, records) VALUES (?, ?, ?)",
+                (source, datetime.now().isoformat(timespec="seconds"), len(rows))
+            )
+        return len(rows)
+
+    def migrate_jsonl(self, cache: str, jsonl_path: Path) -> int:
+        """
+        One-time import of a legacy append-only JSONL cache. The first record
+        per key wins, matching the old first-match linear scan. Unreadable lines
+        are skipped. Returns the number of records imported (0 once done).
+        """
+        jsonl_path = Path(jsonl_path)
+        source = f"{cache}:{jsonl_path.resolve()}"
+        conn = self._conn()
+        if not jsonl_path.exists():
+            return 0
+        if conn.execute("SELECT 1 FROM migrations WHERE source = ?", (source,)).fetchone():
+            return 0
+
+        imported = 0
+        with conn:
+            # Re-check under the write lock: another process may have just finished the import.
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT 1 FROM migrations WHERE source = ?", (source,)).fetchone():
+                return 0
+
+            for rec in read_jsonl_tolerant(jsonl_path):
+                if not rec.get("cache_key"):
+                    continue
+                if self._write_record(conn, cache, rec["cache_key"], rec, None, replace=False):
+                    imported += 1
+
+            conn.execute(
+                "INSERT INTO migrations (source, migrated_at, records) VALUES (?, ?, ?)",
+                (source, datetime.now().isoformat(timespec="seconds"), imported)
+            )
+            generation = self._bump_generation(conn)
+        with self._hot_lock:
+            self._drop_hot_locked()
+            self._generation = generation
+        return imported
@@ -0,0 +1,438 @@
+import csv
+import json
+import math
+import os
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from difflib import SequenceMatcher
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# Per-city POI extracts (paris.csv, washington-dc.geojson, ...) unless GAZETTEER_DIR points elsewhere.
+DEFAULT_GAZETTEER_DIR = Path(
+    os.environ.get("GAZETTEER_DIR") or Path(__file__).resolve().parent / "gazetteer"
+)
+# Shortest query that may match by prefix ("national air and space" -> "national air and space museum")
+MIN_PREFIX_LEN = 4
+# A fuzzy match may only differ in words that are misspellings of the other
+# side's words ("linclon" ~ "lincoln"); "indian" or "portrait" name a different place
+TYPO_WORD_SIMILARITY = 0.8
+# Fuzzy candidates come from the postings of this many of the query's rarest trigrams
+RARE_TRIGRAMS = 4
+# Words that say nothing about which place is meant
+STOP_WORDS = frozenset({"a", "an", "and", "at", "de", "del", "du", "in", "la", "le", "of", "on", "st", "the"})
+
+
+class Place(NamedTuple):
+    name: str
+    lat: float
+    lon: float
+    city: str
+
+
+class Match(NamedTuple):
+    place: Place
+    score: float
+    how: str
+
+
+def normalize_name(text: str) -> str:
+    """Accent-, case- and punctuation-insensitive form; "The Louvre." and "louvre" agree."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+    text = re.sub(r"['’.]", "", text)
+    text = re.sub(r"[^\w]+", " ", text).strip()
+    return re.sub(r"^the ", "", text)
+
+
+def trigrams(norm: str) -> set:
+    padded = f"  {norm} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _centroid(geometry: dict) -> Optional[Tuple[float, float]]:
+    """(lat, lon) of a GeoJSON Point, or the mean vertex of a line or polygon."""
+    kind, coords = geometry.get("type"), geometry.get("coordinates")
+    if kind == "Point" and coords:
+        return float(coords[1]), float(coords[0])
+    depth = {"LineString": 1, "MultiPoint": 1, "Polygon": 2, "MultiLineString": 2, "MultiPolygon": 3}.get(kind)
+    if not depth or not coords:
+        return None
+    points = coords
+    for _ in range(depth - 1):
+        points = [p for part in points for p in part]
+    if not points:
+        return None
+    return sum(p[1] for p in points) / len(points), sum(p[0] for p in points) / len(points)
+
+
+# ============================================================
+# CITY INDEX
+# ============================================================
+class CityIndex:
+    """Exact, prefix and trigram lookup over one city's place names."""
+
+    def __init__(self, city: str):
+        self.city = city
+        self.places: List[Place] = []
+        self._exact: Dict[str, int] = {}
+        self._sorted: List[Tuple[str, int]] = []
+        self._grams: Dict[str, List[int]] = {}
+        self._gram_sets: List[set] = []
+        self._gram_places: List[int] = []
+        self._gram_words: List[set] = []
+        self._sort_lock = threading.Lock()
+        self._dirty = False
+
+    def add(self, name: str, lat: float, lon: float, aliases: Iterable[str] = ()) -> None:
+        idx = len(self.places)
+        self.places.append(Place(name, float(lat), float(lon), self.city))
+        for label in [name, *aliases]:
+            norm = normalize_name(label)
+            if not norm:
+                continue
+            # The first place with a name keeps it, so extracts can list the canonical entry first.
+            self._exact.setdefault(norm, idx)
+            self._sorted.append((norm, idx))
+            grams = trigrams(norm)
+            label_id = len(self._gram_sets)
+            self._gram_sets.append(grams)
+            self._gram_places.append(idx)
+            self._gram_words.append(set(norm.split()) - STOP_WORDS)
+            for gram in grams:
+                self._grams.setdefault(gram, []).append(label_id)
+        self._dirty = True
+
+    def center(self) -> Optional[Tuple[float, float]]:
+        """Where a bare city name points: its own entry if the extract has one, else the mean of its places."""
+        idx = self._exact.get(normalize_name(self.city))
+        if idx is not None:
+            return self.places[idx].lat, self.places[idx].lon
+        if not self.places:
+            return None
+        return (sum(p.lat for p in self.places) / len(self.places),
+                sum(p.lon for p in self.places) / len(self.places))
+
+    def search(self, name: str, min_similarity: float) -> Optional[Match]:
+        if self._dirty:
+            # Sorted once after loading; lookups run on several geocoding threads.
+            with self._sort_lock:
+                if self._dirty:
+                    self._sorted.sort()
+                    self._dirty = False
+        norm = normalize_name(name)
+        if not norm:
+            return None
+
+        idx = self._exact.get(norm)
+        if idx is not None:
+            return Match(self.places[idx], 1.0, "exact")
+
+        if len(norm) >= MIN_PREFIX_LEN:
+            # Shortest label that extends the query, at a word boundary ("louvre" -> "louvre museum").
+            best = None
+            pos = bisect_left(self._sorted, (norm, -1))
+            while pos < len(self._sorted) and self._sorted[pos][0].startswith(norm):
+                label, idx = self._sorted[pos]
+                if len(label) > len(norm) and label[len(norm)] == " " and (best is None or len(label) < len(best[0])):
+                    best = (label, idx)
+                pos += 1
+            if best and len(norm) / len(best[0]) >= min_similarity:
+                return Match(self.places[best[1]], round(len(norm) / len(best[0]), 3), "prefix")
+
+        grams = trigrams(norm)
+        rare = sorted((g for g in grams if g in self._grams), key=lambda g: len(self._grams[g]))[:RARE_TRIGRAMS]
+        # Dice >= min_similarity is impossible unless the sizes are within this band.
+        low = len(grams) * min_similarity / (2 - min_similarity)
+        high = len(grams) * (2 - min_similarity) / min_similarity
+        scored = []
+        for label_id in {label_id for g in rare for label_id in self._grams[g]}:
+            other = self._gram_sets[label_id]
+            if not low <= len(other) <= high:
+                continue
+            score = 2 * len(grams & other) / (len(grams) + len(other))
+            if score >= min_similarity:
+                scored.append((score, label_id))
+        words = set(norm.split()) - STOP_WORDS
+        for score, label_id in sorted(scored, reverse=True):
+            label_words = self._gram_words[label_id]
+            if _only_typos(words, label_words) and _only_typos(label_words, words):
+                return Match(self.places[self._gram_places[label_id]], round(score, 3), "trigram")
+        return None
+
+
+def _only_typos(words: set, label_words: set) -> bool:
+    """True when every word missing from label_words is a misspelling of one of them."""
+    def close(word: str, other: str) -> bool:
+        if len(word) == len(other):
+            diff = [i for i in range(len(word)) if word[i] != other[i]]
+            # Two swapped neighbours ("prak"), which ratio() scores low in short words.
+            if len(diff) == 2 and diff[1] == diff[0] + 1 and word[diff[0]] + word[diff[1]] == other[diff[1]] + other[diff[0]]:
+                return True
+        # The quick ratios are upper bounds of ratio(), so most non-matches stop early.
+        matcher = SequenceMatcher(None, word, other)
+        return (matcher.real_quick_ratio() >= TYPO_WORD_SIMILARITY
+                and matcher.quick_ratio() >= TYPO_WORD_SIMILARITY
+                and matcher.ratio() >= TYPO_WORD_SIMILARITY)
+
+    return all(any(close(word, other) for other in label_words) for word in words - label_words)
+
+
+# ============================================================
+# GAZETTEER
+# ============================================================
+class Gazetteer:
+    """
+    Offline geocoder over local POI extracts, one CityIndex per city.
+
+    geocode() takes the same "Place name, City[, Country]" queries as the
+    network geocoders and returns (lat, lon) or None, so it can stand in for
+    them. The city is picked from the query's trailing comma-separated parts,
+    alone or joined ("Washington, D.C." finds "washington dc").
+    A bare name searches every city; a query whose city is not loaded never
+    matches, since a same-named place elsewhere would be wrong. Lookups are
+    in-memory: exact and prefix matches take microseconds, fuzzy ones (trigram
+    Dice >= min_similarity) a little longer, as only the postings of the
+    query's rarest trigrams are scored. Prefix matches must also reach
+    min_similarity ("lincoln" is not "lincoln park"), and a fuzzy match may
+    differ from the place's name only by misspelt words, never by a word
+    either side lacks ("national portrait gallery" is not "national gallery
+    of art").
+
+    CSV extracts need name and lat/lon (or latitude/longitude) columns, with
+    optional city and alt_names (";"-separated). GeoJSON extracts use each
+    feature's name, name:en and alt_name properties. Without a city column
+    the file name is the city ("washington-dc.csv" -> "washington dc").
+    """
+
+    def __init__(self, min_similarity: float = 0.6):
+        self.min_similarity = min_similarity
+        self.cities: Dict[str, CityIndex] = {}
+
+    def __len__(self) -> int:
+        return sum(len(index.places) for index in self.cities.values())
+
+    def city(self, city: str) -> CityIndex:
+        key = normalize_name(city)
+        index = self.cities.get(key)
+        if index is None:
+            index = self.cities[key] = CityIndex(city)
+        return index
+
+    def add(self, name: str, lat: float, lon: float, city: str, aliases: Iterable[str] = ()) -> None:
+        self.city(city).add(name, lat, lon, aliases)
+
+    def load_csv(self, path: Path, city: Optional[str] = None) -> int:
+        count = 0
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            for row in csv.DictReader(f):
+                row = {(k or "").strip().lower(): (v or "").strip() for k, v in row.items()}
+                try:
+                    lat = float(row.get("lat") or row["latitude"])
+                    lon = float(row.get("lon") or row["longitude"])
+                except (KeyError, ValueError):
+                    continue
+                if not row.get("name"):
+                    continue
+                aliases = [a.strip() for a in row.get("alt_names", "").split(";") if a.strip()]
+                self.add(row["name"], lat, lon, row.get("city") or city or _city_from_path(path), aliases)
+                count += 1
+        return count
+
+    def load_geojson(self, path: Path, city: Optional[str] = None) -> int:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        count = 0
+        for feature in data.get("features", []):
+            props = feature.get("properties") or {}
+            names = [props.get("name"), props.get("name:en"), *str(props.get("alt_name") or "").split(";")]
+            names = [n.strip() for n in names if n and n.strip()]
+            point = _centroid(feature.get("geometry") or {})
+            if not names or not point:
+                continue
+            self.add(names[0], point[0], point[1], props.get("city") or city or _city_from_path(path), names[1:])
+            count += 1
+        return count
+
+    def load_dir(self, directory: Path) -> int:
+        count = 0
+        for path in sorted(Path(directory).glob("*")):
+            if path.suffix.lower() == ".csv":
+                count += self.load_csv(path)
+            elif path.suffix.lower() in (".geojson", ".json"):
+                count += self.load_geojson(path)
+        return count
+
+    def search(self, query: str) -> Optional[Match]:
+        parts = [p.strip() for p in (query or "").split(",") if p.strip()]
+        if not parts:
+            return None
+        # "Louvre, Paris, France": the first trailing parts naming a loaded city pick the index. A city
+        # may span parts ("Washington, D.C.", "Washington, DC, USA"); the whole query may be the city.
+        for i in [*range(1, len(parts)), 0]:
+            for j in range(len(parts), i, -1):
+                index = self.cities.get(normalize_name(", ".join(parts[i:j])))
+                if index is None:
+                    continue
+                if i == 0:
+                    center = index.center()
+                    return Match(Place(index.city, center[0], center[1], index.city), 1.0, "city") if center else None
+                return index.search(", ".join(parts[:i]), self.min_similarity)
+        if len(parts) > 1:
+            return None
+
+        best = None
+        for index in self.cities.values():
+            match = index.search(parts[0], self.min_similarity)
+            if match and (best is None or match.score > best.score):
+                best = match
+        return best
+
+    def geocode(self, query: str) -> Optional[Tuple[float, float]]:
+        match = self.search(query)
+        return (match.place.lat, match.place.lon) if match else None
+
+
+def _city_from_path(path: Path) -> str:
+    return re.sub(r"[-_]+", " ", Path(path).stem)
+
+
+# ============================================================
+# RESOLVED PLACES
+# ============================================================
+class ResolvedPlaces:
+    """
+    Per-destination fuzzy index over place names that already have
+    coordinates, so a new spelling of a known place ("Smithsonian Air and
+    Space" for "National Air and Space Museum") reuses them instead of
+    going to the network.
+
+    A name's score against each known name of its destination is the
+    IDF-weighted Dice overlap of their words (stop words dropped, weights
+    from that destination's names, so "museum" counts for less than
+    "space"). The trigram Dice of the full names takes over when it is higher,
+    at least typo_similarity and both names have as many words, which
+    catches misspellings ("Linclon Memorial"). Otherwise
+    at most max_extra_words of the query's words may be missing from the
+    known name, and only words found in at least extra_word_df other names of
+    the destination ("smithsonian", "national"): "National Museum of African
+    American History and Culture" and "National Museum of the American
+    Indian" are not "National Museum of American History". The best name must score
+    min_score or more. When the runner-up is within
+    ambiguity_margin but more than ambiguity_m away, the lookup declines
+    instead of guessing.
+    """
+
+    def __init__(
+            self,
+            min_score: float = 0.65,
+            typo_similarity: float = 0.75,
+            max_extra_words: int = 1,
+            extra_word_df: int = 2,
+            ambiguity_margin: float = 0.1,
+            ambiguity_m: float = 250
+    ):
+        self.min_score = min_score
+        self.typo_similarity = typo_similarity
+        self.max_extra_words = max_extra_words
+        self.extra_word_df = extra_word_df
+        self.ambiguity_margin = ambiguity_margin
+        self.ambiguity_m = ambiguity_m
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, dict] = {}
+
+    @staticmethod
+    def split_query(query: str) -> Tuple[str, str]:
+        """("Louvre", "Paris, France") from "Louvre, Paris, France": the name, then the destination."""
+        name, _, destination = (query or "").partition(",")
+        return name.strip(), destination.strip()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(bucket["names"]) for bucket in self._buckets.values())
+
+    def add(self, destination: str, name: str, coords: Tuple[float, float]) -> None:
+        norm = normalize_name(name)
+        if not norm:
+            return
+        with self._lock:
+            bucket = self._buckets.setdefault(
+                normalize_name(destination), {"names": {}, "entries": [], "df": {}}
+            )
+            if norm in bucket["names"]:
+                return
+            words = set(norm.split()) - STOP_WORDS
+            bucket["names"][norm] = len(bucket["entries"])
+            bucket["entries"].append((norm, words, trigrams(norm), (float(coords[0]), float(coords[1]))))
+            for word in words:
+                bucket["df"][word] = bucket["df"].get(word, 0) + 1
+
+    def add_query(self, query: str, coords: Tuple[float, float]) -> None:
+        name, destination = self.split_query(query)
+        if name and destination:
+            self.add(destination, name, coords)
+
+    def match(self, query: str) -> Optional[Match]:
+        name, destination = self.split_query(query)
+        norm = normalize_name(name)
+        if not norm or not destination:
+            return None
+        with self._lock:
+            bucket = self._buckets.get(normalize_name(destination))
+            if not bucket:
+                return None
+            if norm in bucket["names"]:
+                _, _, _, coords = bucket["entries"][bucket["names"][norm]]
+                return Match(Place(name, coords[0], coords[1], destination), 1.0, "exact")
+            entries, df = list(bucket["entries"]), dict(bucket["df"])
+
+        def weight(words: set) -> float:
+            return sum(math.log(1 + len(entries) / df.get(word, 1)) for word in words)
+
+        words, grams = set(norm.split()) - STOP_WORDS, trigrams(norm)
+        own_weight = weight(words)
+        scored = []
+        for other, other_words, other_grams, coords in entries:
+            shared = words & other_words
+            score = 2 * weight(shared) / (own_weight + weight(other_words)) if shared else 0.0
+            similarity = 2 * len(grams & other_grams) / (len(grams) + len(other_grams))
+            if similarity >= self.typo_similarity and similarity > score and len(words) == len(other_words):
+                score, how = similarity, "trigram"
+            else:
+                # A distinctive word the known name lacks ("indian") means a different place.
+                extra = words - other_words
+                if len(extra) > self.max_extra_words or any(df.get(w, 0) < self.extra_word_df for w in extra):
+                    continue
+                how = "words"
+            if score >= self.min_score - self.ambiguity_margin:
+                scored.append((score, how, other, coords))
+        if not scored:
+            return None
+
+        scored.sort(key=lambda item: item[0], reverse=True)
+        score, how, other, coords = scored[0]
+        if score < self.min_score:
+            return None
+        for runner_score, _, _, runner_coords in scored[1:]:
+            if score - runner_score > self.ambiguity_margin:
+                break
+            if _distance_m(coords, runner_coords) > self.ambiguity_m:
+                return None
+        return Match(Place(other, coords[0], coords[1], destination), round(score, 3), how)
+
+
+def _distance_m(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    """Equirectangular distance; plenty for telling places in one city apart."""
+    x = math.radians(b[1] - a[1]) * math.cos(math.radians((a[0] + b[0]) / 2))
+    y = math.radians(b[0] - a[0])
+    return 6371000 * math.hypot(x, y)
+
+
+def load_gazetteer(directory: Path = DEFAULT_GAZETTEER_DIR, min_similarity: float = 0.6) -> Gazetteer:
+    """Gazetteer over every extract in directory; empty (never matches) when the directory is missing."""
+    gazetteer = Gazetteer(min_similarity)
+    if Path(directory).is_dir():
+        gazetteer.load_dir(directory)
+    return gazetteer
@@ -0,0 +1,185 @@
+import atexit
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+# One file for every app (Streamlit, wiki draft, WebUI) unless GEOCODE_DB points elsewhere.
+DEFAULT_GEOCODE_DB = Path(
+    os.environ.get("GEOCODE_DB") or Path(__file__).resolve().parent / "itinerary_cache" / "geocode.sqlite3"
+)
+# Found coordinates barely move; "not found" is re-checked sooner in case OSM gains the place.
+DEFAULT_TTL_SEC = 90 * 24 * 3600
+DEFAULT_NEGATIVE_TTL_SEC = 7 * 24 * 3600
+# Each entry's lifetime is stretched by up to this fraction so a bulk warm-up does not expire at once.
+TTL_JITTER = 0.1
+
+STAT_NAMES = ("hits", "negative_hits", "misses", "expired")
+
+
+# ============================================================
+# PERSISTENT GEOCODE STORE
+# ============================================================
+class GeocodeStore:
+    """
+    On-disk geocode results shared by every app and server process, so a
+    restart or deploy starts warm instead of re-querying Nominatim.
+
+    Queries are normalised (Unicode form, case, whitespace, trailing
+    punctuation) before lookup, so "Louvre Museum, Paris" and "louvre museum,
+    paris " share one entry. Each entry carries its own expiry: found results
+    live for ttl_sec, "not found" results (often places the LLM invented) for
+    negative_ttl_sec. get() reports a not-found entry as known with coords
+    None; callers only put() answers the geocoder actually gave, never
+    request errors.
+
+    Hit/miss counts are kept in memory and added to a counters table every
+    flush_every lookups (and at exit), so reads stay read-only on the hot
+    path while stats() still covers every process sharing the file.
+    """
+
+    def __init__(
+            self,
+            db_path: Path = DEFAULT_GEOCODE_DB,
+            ttl_sec: float = DEFAULT_TTL_SEC,
+            negative_ttl_sec: float = DEFAULT_NEGATIVE_TTL_SEC,
+            flush_every: int = 50,
+            busy_timeout_sec: float = 30
+    ):
+        self.db_path = Path(db_path)
+        self.ttl_sec = ttl_sec
+        self.negative_ttl_sec = negative_ttl_sec
+        self.flush_every = flush_every
+        self.busy_timeout_sec = busy_timeout_sec
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._pending = dict.fromkeys(STAT_NAMES, 0)
+        self._session = dict.fromkeys(STAT_NAMES, 0)
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS geocodes (
+                query TEXT PRIMARY KEY,
+                lat REAL,
+                lon REAL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_geocodes_expires ON geocodes (expires_at)")
+        conn.execute("CREATE TABLE IF NOT EXISTS geocode_counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.commit()
+        atexit.register(self.flush_stats)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=self.busy_timeout_sec)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        text = unicodedata.normalize("NFKC", query or "").casefold()
+        text = re.sub(r"\s+", " ", text)
+        text = re.sub(r"\s*,\s*", ", ", text)
+        return text.strip(" ,.;")
+
+    def get(self, query: str) -> Tuple[bool, Optional[Tuple[float, float]]]:
+        """(known, coords): known is False on a miss or an expired entry; coords is None for "not found"."""
+        row = self._conn().execute(
+            "SELECT lat, lon, expires_at FROM geocodes WHERE query = ?", (self.normalize(query),)
+        ).fetchone()
+        if row is None:
+            self._count("misses")
+            return False, None
+        lat, lon, expires_at = row
+        if expires_at <= time.time():
+            self._count("misses", "expired")
+            return False, None
+        if lat is None:
+            self._count("hits", "negative_hits")
+            return True, None
+        self._count("hits")
+        return True, (lat, lon)
+
+    def put(self, query: str, coords: Optional[Tuple[float, float]], ttl_sec: Optional[float] = None) -> None:
+        """Stores a geocoder answer; coords None records "not found" (negative_ttl_sec unless ttl_sec is given)."""
+        if ttl_sec is None:
+            ttl_sec = self.ttl_sec if coords else self.negative_ttl_sec
+        now = time.time()
+        lat, lon = (float(coords[0]), float(coords[1])) if coords else (None, None)
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO geocodes (query, lat, lon, created_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (self.normalize(query), lat, lon, now, now + ttl_sec * (1 + random.uniform(0, TTL_JITTER)))
+            )
+
+    def purge_expired(self) -> int:
+        conn = self._conn()
+        with conn:
+            return conn.execute("DELETE FROM geocodes WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def found_entries(self) -> Iterator[Tuple[str, float, float]]:
+        """(normalised query, lat, lon) of every live entry that has coordinates."""
+        yield from self._conn().execute(
+            "SELECT query, lat, lon FROM geocodes WHERE lat IS NOT NULL AND expires_at > ?", (time.time(),)
+        )
+
+    def size(self) -> Dict[str, int]:
+        entries, not_found = self._conn().execute(
+            "SELECT COUNT(*), COUNT(*) - COUNT(lat) FROM geocodes WHERE expires_at > ?", (time.time(),)
+        ).fetchone()
+        return {"entries": entries, "not_found_entries": not_found}
+
+    def _count(self, *names: str) -> None:
+        with self._stats_lock:
+            for name in names:
+                self._pending[name] += 1
+                self._session[name] += 1
+            lookups = self._pending["hits"] + self._pending["misses"]
+        if lookups >= self.flush_every:
+            self.flush_stats()
+
+    def flush_stats(self) -> None:
+        with self._stats_lock:
+            pending = {k: v for k, v in self._pending.items() if v}
+            self._pending = dict.fromkeys(STAT_NAMES, 0)
+        if not pending:
+            return
+        conn = self._conn()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO geocode_counters (name, value) VALUES (?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                    list(pending.items())
+                )
+        except sqlite3.Error:
+            # Counts are advisory; put them back for the next flush rather than fail a lookup.
+            with self._stats_lock:
+                for name, value in pending.items():
+                    self._pending[name] += value
+
+    def stats(self) -> dict:
+        """Hit rate of this process and of every process sharing the file, plus live entry counts."""
+        self.flush_stats()
+        totals = dict.fromkeys(STAT_NAMES, 0)
+        totals.update(self._conn().execute("SELECT name, value FROM geocode_counters").fetchall())
+        with self._stats_lock:
+            session = dict(self._session)
+
+        def with_ratio(counts: dict) -> dict:
+            lookups = counts["hits"] + counts["misses"]
+            return {**counts, "hit_ratio": round(counts["hits"] / lookups, 4) if lookups else None}
+
+        return {"process": with_ratio(session), "all_time": with_ratio(totals), **self.size()}
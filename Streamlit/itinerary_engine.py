@@ -0,0 +1,1641 @@
+"""
+Headless itinerary engine shared by the Streamlit app and the offline tools:
+LLM routing, JSON extraction and validation, the itinerary cache and the
+blocking generation path. Nothing in here touches Streamlit, so scripts such
+as warm_cache.py can import it without starting a UI.
+"""
+from datetime import datetime
+from typing import List, Dict, Optional, Iterable, Iterator, Callable, Tuple
+from functools import lru_cache, wraps
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import deque
+from pathlib import Path
+import copy
+import hashlib
+import json
+import queue
+import re
+import threading
+import time
+import unicodedata
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from cache_store import CacheStore
+from gazetteer import DEFAULT_GAZETTEER_DIR, Gazetteer, ResolvedPlaces, load_gazetteer
+from geocode_store import DEFAULT_GEOCODE_DB, GeocodeStore
+
+# ============================================================
+# CONFIG
+# ============================================================
+OLLAMA_URL = "http://localhost:11434/api/generate"
+DEFAULT_MODEL = "llama3:latest"
+OLLAMA_TIMEOUT_SEC = 600
+# Constrained decoding for itinerary JSON: "schema" (JSON schema from the example),
+# "json" (any valid JSON) or "off" (free text + repair round-trip)
+OLLAMA_JSON_MODE = "schema"
+# How long Ollama keeps the model resident after a request
+OLLAMA_KEEP_ALIVE = "30m"
+# Output-token ceilings (Ollama num_predict) per call site. A reply that hits its
+# budget is cut off and the JSON extractor keeps what was completed. num_ctx is
+# fixed for every call (warm-up included) so Ollama never reloads the model.
+OLLAMA_NUM_CTX = 8192
+ITINERARY_TOKENS_BASE = 200
+ITINERARY_TOKENS_PER_DAY = {"Relaxed": 500, "Balanced": 650, "Fast-paced": 800}
+REPLAN_TOKENS_BASE = 120
+REPLAN_TOKENS_PER_OPTION = 90
+# Generate endpoints the LLM router picks from (fastest healthy first).
+# "ollama" speaks /api/generate; "openai" is any OpenAI-compatible server
+# (LM Studio, llama.cpp, vLLM, OpenRouter) and may pin its own "model"/"key".
+LLM_ENDPOINTS = [
+    {"name": "local-ollama", "provider": "ollama", "url": "http://localhost:11434"},
+]
+LLM_ROUTER_WINDOW = 50
+LLM_ROUTER_MIN_SAMPLES = 5
+LLM_ROUTER_MAX_ERROR_RATE = 0.5
+# Send a duplicate request to the next-best endpoint if the first has not
+# answered after this many seconds; None disables hedging
+LLM_HEDGE_AFTER_SEC = None
+
+CACHE_DIR = Path("itinerary_cache")
+CACHE_DB = CACHE_DIR / "cache.sqlite3"
+ITINERARY_CACHE = "itinerary"
+REPLAN_CACHE = "replan"
+# Cache metrics layers beyond the two store caches, and how many recent
+# lookups/miss costs each layer keeps for latency percentiles and means
+ITINERARY_NEAR_HIT_LAYER = "itinerary_near_hit"
+REPLAN_GEO_LAYER = "replan_geo"
+GEOCODE_STORE_LAYER = "geocode_store"
+GAZETTEER_LAYER = "gazetteer"
+RESOLVED_FUZZY_LAYER = "geocode_fuzzy"
+CACHE_METRICS_WINDOW = 500
+# Legacy append-only caches, imported into CACHE_DB once on first start
+CACHE_JSONL = CACHE_DIR / "ollama_itineraries.jsonl"
+REPLAN_CACHE_JSONL = CACHE_DIR / "replanned_itineraries.jsonl"
+# Per-JSON-mode generation/repair/parse-failure counters are kept as records are
+# written; records stored before that are counted once, under this migration name
+JSON_MODE_BACKFILL = "counters:json_mode"
+
+# Persistent geocode store shared with the other apps (see geocode_store.py);
+# found places are kept for GEOCODE_TTL_SEC, "not found" for GEOCODE_NEGATIVE_TTL_SEC
+GEOCODE_DB = DEFAULT_GEOCODE_DB
+GEOCODE_TTL_SEC = 90 * 24 * 3600
+GEOCODE_NEGATIVE_TTL_SEC = 7 * 24 * 3600
+# Nominatim usage policy: at most 1 request/s. The token bucket is process-wide
+# and only network lookups take a token; memo and store hits never wait.
+# GEOCODE_WORKERS bounds the lookups of one batch in flight at once.
+GEOCODE_RATE_PER_SEC = 1.0
+GEOCODE_BURST = 1
+GEOCODE_WORKERS = 4
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+# Offline gazetteer (see gazetteer.py): per-city POI extracts in GAZETTEER_DIR are
+# searched before the geocode store and Nominatim. With GEOCODE_NETWORK_FALLBACK
+# off, names the gazetteer cannot match are "not found" and nothing goes out.
+GAZETTEER_DIR = DEFAULT_GAZETTEER_DIR
+GAZETTEER_MIN_SIMILARITY = 0.6
+GEOCODE_NETWORK_FALLBACK = True
+# Before a network geocode, a stop name is matched against names already
+# resolved for the same destination (word/trigram similarity, see
+# gazetteer.ResolvedPlaces); matches scoring below this are not reused
+RESOLVED_FUZZY_MIN_SCORE = 0.65
+
+# Shared outbound HTTP pool (Nominatim + Ollama)
+HTTP_POOL_SIZE = 16
+HTTP_KEEP_ALIVE = True
+HTTP_MAX_RETRIES = 3
+HTTP_RETRY_BACKOFF_SEC = 0.5
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+# ============================================================
+# PROCESS SINGLETONS
+# ============================================================
+def process_singleton(fn: Callable[[], object]) -> Callable[[], object]:
+    """
+    Builds fn() once per process on first use, like st.cache_resource does for
+    the app. Modules are imported once per process, so the Streamlit sessions
+    and a headless script each share one instance.
+    """
+    lock = threading.Lock()
+    instance = []
+
+    @wraps(fn)
+    def get():
+        if not instance:
+            with lock:
+                if not instance:
+                    instance.append(fn())
+        return instance[0]
+
+    return get
+
+
+# ============================================================
+# CACHE METRICS
+# ============================================================
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+class CacheMetrics:
+    """
+    Process-wide counters per cache layer: hits, misses, evictions, lookup
+    latency and the cost of the work a miss triggers (LLM generation, network
+    geocode). Seconds saved adds up the known cost of each hit; hits of unknown
+    cost are estimated from the layer's mean miss cost, or from the layer named
+    in cost_aliases when the layer never pays that cost itself.
+    """
+
+    def __init__(self, window: int, cost_aliases: Optional[Dict[str, str]] = None):
+        self.window = window
+        self.cost_aliases = dict(cost_aliases or {})
+        self.since = datetime.now().isoformat(timespec="seconds")
+        self._lock = threading.Lock()
+        self._layers: Dict[str, dict] = {}
+        self._sizes: Dict[str, Callable[[], dict]] = {}
+
+    def _layer(self, name: str) -> dict:
+        layer = self._layers.get(name)
+        if layer is None:
+            layer = {
+                "hits": 0,
+                "misses": 0,
+                "evictions": 0,
+                "seconds_saved": 0.0,
+                "hits_without_cost": 0,
+                "lookup_sec": deque(maxlen=self.window),
+                "cost_sec": deque(maxlen=self.window),
+            }
+            self._layers[name] = layer
+        return layer
+
+    def record_hit(self, name: str, lookup_sec: float, saved_sec: Optional[float] = None) -> None:
+        with self._lock:
+            layer = self._layer(name)
+            layer["hits"] += 1
+            layer["lookup_sec"].append(lookup_sec)
+            if saved_sec is None:
+                layer["hits_without_cost"] += 1
+            else:
+                layer["seconds_saved"] += saved_sec
+
+    def record_miss(self, name: str, lookup_sec: float, cost_sec: Optional[float] = None) -> None:
+        with self._lock:
+            layer = self._layer(name)
+            layer["misses"] += 1
+            layer["lookup_sec"].append(lookup_sec)
+            if cost_sec is not None:
+                layer["cost_sec"].append(cost_sec)
+
+    def record_cost(self, name: str, cost_sec: float) -> None:
+        """Cost of work done after a miss that was recorded separately (e.g. a generation)."""
+        with self._lock:
+            self._layer(name)["cost_sec"].append(cost_sec)
+
+    def record_evictions(self, name: str, count: int) -> None:
+        with self._lock:
+            self._layer(name)["evictions"] += int(count)
+
+    def register_size(self, name: str, size_fn: Callable[[], dict]) -> None:
+        with self._lock:
+            self._layer(name)
+            self._sizes[name] = size_fn
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            layers = {
+                name: {**layer, "lookup_sec": list(layer["lookup_sec"]), "cost_sec": list(layer["cost_sec"])}
+                for name, layer in self._layers.items()
+            }
+            sizes = dict(self._sizes)
+
+        result = {}
+        for name, layer in layers.items():
+            costs = layer["cost_sec"] or layers.get(self.cost_aliases.get(name), {}).get("cost_sec", [])
+            mean_cost = sum(costs) / len(costs) if costs else None
+            lookups = layer["hits"] + layer["misses"]
+            p50, p95 = _percentile(layer["lookup_sec"], 50), _percentile(layer["lookup_sec"], 95)
+            entry = {
+                "hits": layer["hits"],
+                "misses": layer["misses"],
+                "hit_ratio": round(layer["hits"] / lookups, 4) if lookups else None,
+                "evictions": layer["evictions"],
+                "lookup_ms_p50": round(p50 * 1000, 3) if p50 is not None else None,
+                "lookup_ms_p95": round(p95 * 1000, 3) if p95 is not None else None,
+                "miss_cost_sec_mean": round(mean_cost, 3) if mean_cost is not None else None,
+                "seconds_saved": round(layer["seconds_saved"] + layer["hits_without_cost"] * (mean_cost or 0.0), 1),
+            }
+            if name in sizes:
+                try:
+                    entry.update(sizes[name]())
+                except Exception:
+                    pass
+            result[name] = entry
+        return {"since": self.since, "layers": result}
+
+
+@process_singleton
+def get_cache_metrics() -> CacheMetrics:
+    return CacheMetrics(
+        CACHE_METRICS_WINDOW,
+        {
+            ITINERARY_NEAR_HIT_LAYER: ITINERARY_CACHE,
+            REPLAN_GEO_LAYER: REPLAN_CACHE,
+            GAZETTEER_LAYER: GEOCODE_STORE_LAYER,
+            RESOLVED_FUZZY_LAYER: GEOCODE_STORE_LAYER,
+        }
+    )
+
+
+def metered_lru_cache(name: str, maxsize: int):
+    """lru_cache that reports each lookup to the cache metrics under `name`; a miss costs its own latency."""
+
+    def decorate(fn):
+        state = threading.local()
+
+        @lru_cache(maxsize=maxsize)
+        def cached(*args):
+            state.missed = True
+            return fn(*args)
+
+        @wraps(fn)
+        def lookup(*args):
+            state.missed = False
+            was_full = cached.cache_info().currsize >= maxsize
+            started = time.perf_counter()
+            metrics = get_cache_metrics()
+            try:
+                result = cached(*args)
+            except Exception:
+                metrics.record_miss(name, time.perf_counter() - started)
+                raise
+            elapsed = time.perf_counter() - started
+            if not state.missed:
+                metrics.record_hit(name, elapsed)
+                return result
+            metrics.record_miss(name, elapsed, cost_sec=elapsed)
+            # A miss that lands in a full cache pushed the least recently used entry out.
+            if was_full:
+                metrics.record_evictions(name, 1)
+            return result
+
+        lookup.cache_info = cached.cache_info
+        lookup.cache_clear = cached.cache_clear
+        get_cache_metrics().register_size(
+            name, lambda: {"entries": cached.cache_info().currsize, "max_entries": maxsize}
+        )
+        return lookup
+
+    return decorate
+
+
+# ============================================================
+# HTTP SESSION POOL
+# ============================================================
+@process_singleton
+def get_http_session() -> requests.Session:
+    """
+    One pooled keep-alive session per server process, shared by every Streamlit
+    session. Retries cover connection errors and idempotent (GET) requests only,
+    so a long Ollama generation is never silently re-submitted. Nominatim gets
+    no automatic retries: nominatim_search() retries itself so every attempt
+    takes a rate-limit token.
+    """
+    retry = Retry(
+        total=HTTP_MAX_RETRIES,
+        backoff_factor=HTTP_RETRY_BACKOFF_SEC,
+        status_forcelist=HTTP_RETRY_STATUSES,
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_SIZE,
+        pool_maxsize=HTTP_POOL_SIZE,
+        max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.mount(NOMINATIM_URL, HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE, max_retries=0))
+    session.headers["Connection"] = "keep-alive" if HTTP_KEEP_ALIVE else "close"
+    return session
+
+
+# ============================================================
+# IN-FLIGHT COALESCING
+# ============================================================
+class FlightCancelled(RuntimeError):
+    """The leader of a coalesced call was interrupted (rerun, closed tab) before it finished."""
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent work on the same key across all sessions in the
+    process: the first caller (leader) does the work, later callers wait for
+    its result instead of starting a duplicate Ollama generation. When the
+    leader is interrupted rather than failing, its followers get
+    FlightCancelled and one of them takes over as the new leader.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, dict] = {}
+
+    def begin(self, key: str) -> Tuple[dict, bool]:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                return call, False
+            call = {"done": threading.Event(), "result": None, "error": None}
+            self._calls[key] = call
+            return call, True
+
+    def finish(self, key: str, call: dict, result=None, error: Optional[BaseException] = None) -> None:
+        call["result"], call["error"] = result, error
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call["done"].set()
+
+    def wait(self, call: dict, timeout: Optional[float] = None):
+        if not call["done"].wait(timeout):
+            raise TimeoutError("Timed out waiting for an identical request that is already running.")
+        if call["error"] is not None:
+            raise call["error"]
+        # Followers get their own copy so one session's edits never leak into another's.
+        return copy.deepcopy(call["result"])
+
+    def do(self, key: str, fn: Callable[[], object]) -> Tuple[object, bool]:
+        """Run fn once per key at a time. Returns (result, shared) where shared means another caller ran it."""
+        while True:
+            call, is_leader = self.begin(key)
+            if is_leader:
+                break
+            try:
+                return self.wait(call, timeout=OLLAMA_TIMEOUT_SEC * 2), True
+            except FlightCancelled:
+                continue
+        try:
+            result = fn()
+        except Exception as e:
+            self.finish(key, call, error=e)
+            raise
+        except BaseException:
+            # Streamlit stops a rerun script with a BaseException: not a failure the followers share.
+            self.finish(key, call, error=FlightCancelled("The shared call was interrupted."))
+            raise
+        self.finish(key, call, result=result)
+        return result, False
+
+
+@process_singleton
+def get_single_flight() -> SingleFlight:
+    return SingleFlight()
+
+
+# ============================================================
+# ITINERARY CACHE
+# ============================================================
+def _normalize_interests(interests: List[str]) -> List[str]:
+    return sorted([i.strip() for i in interests if i and i.strip()])
+
+
+def _normalize_locations(locations: List[str]) -> List[str]:
+    return sorted([x.strip().lower() for x in locations if x and x.strip()])
+
+
+DESTINATION_ALIASES = {
+    "nyc": "new york city",
+    "new york": "new york city",
+    "new york ny": "new york city",
+    "la": "los angeles",
+    "sf": "san francisco",
+    "dc": "washington dc",
+    "washington district of columbia": "washington dc",
+}
+
+
+def canonical_destination(destination: str) -> str:
+    """'Washington, D.C.', 'washington dc' and 'DC' all map to 'washington dc'."""
+    text = unicodedata.normalize("NFKD", destination or "").encode("ascii", "ignore").decode("ascii").lower()
+    text = re.sub(r"[^a-z0-9 ]+", " ", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    text = re.sub(r"\b([a-z]) (?=[a-z]\b)", r"\1", text)
+    return DESTINATION_ALIASES.get(text, text)
+
+
+def itinerary_group_key(destination: str, model: str, pace: str, must_visit_locations: List[str]) -> str:
+    """Near-hit group: plans in one group differ only in day count and interests."""
+    base = {
+        "destination": canonical_destination(destination),
+        "model": model.strip().lower(),
+        "pace": pace.strip().lower(),
+        "must_visit_locations": _normalize_locations(must_visit_locations),
+    }
+    return hashlib.md5(json.dumps(base, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def itinerary_group_key_for_record(record: dict) -> Optional[str]:
+    if not record.get("destination") or not record.get("model"):
+        return None
+    return itinerary_group_key(
+        record["destination"],
+        record["model"],
+        record.get("pace", ""),
+        record.get("must_visit_locations") or []
+    )
+
+
+def make_cache_key(destination: str, days: int, interests: List[str], model: str, pace: str,
+                   must_visit_locations: List[str]) -> str:
+    base = {
+        "destination": destination.strip().lower(),
+        "days": int(days),
+        "interests": _normalize_interests(interests),
+        "model": model.strip().lower(),
+        "pace": pace.strip().lower(),
+        "must_visit_locations": _normalize_locations(must_visit_locations),
+        "schema_version": 4
+    }
+    s = json.dumps(base, sort_keys=True)
+    return hashlib.md5(s.encode("utf-8")).hexdigest()
+
+
+@process_singleton
+def get_cache_store() -> CacheStore:
+    """
+    Process-wide indexed cache store; imports the legacy JSONL caches on first
+    open and preloads both caches into its in-memory hot tier. Records it returns
+    are shared across sessions and must be treated as read-only.
+    """
+    # Raw LLM output is stored once per distinct text (near hits reuse their source's).
+    store = CacheStore(CACHE_DB, blob_fields={ITINERARY_CACHE: ("llama_raw_output",)})
+    store.migrate_jsonl(ITINERARY_CACHE, CACHE_JSONL)
+    store.migrate_jsonl(REPLAN_CACHE, REPLAN_CACHE_JSONL)
+    store.backfill_group_keys(ITINERARY_CACHE, itinerary_group_key_for_record)
+    for cache in (ITINERARY_CACHE, REPLAN_CACHE):
+        store.preload(cache)
+        get_cache_metrics().register_size(cache, lambda cache=cache: store.stats(cache))
+    return store
+
+
+def cache_metrics_report() -> dict:
+    """Machine-readable dump: per-layer cache metrics plus the store's persistent counters."""
+    report = get_cache_metrics().snapshot()
+    report["generated_at"] = datetime.now().isoformat(timespec="seconds")
+    try:
+        report["counters"] = get_cache_store().counters()
+    except Exception:
+        report["counters"] = {}
+    try:
+        report["geocode_store"] = get_geocode_store().stats()
+    except Exception:
+        report["geocode_store"] = {}
+    return report
+
+
+def json_mode_counters(record: dict) -> List[str]:
+    """
+    Counter names an itinerary record adds to: generations, repairs and parse
+    failures per JSON mode. Near-hit copies were not generated and add none;
+    records from before repair tracking count under "untracked", and before
+    parse_failed was recorded every parse failure was repaired.
+    """
+    if record.get("near_hit_of"):
+        return []
+    prefix = f"json_mode:{record.get('json_mode', 'untracked')}:"
+    names = [prefix + "generations"]
+    if record.get("repair_used"):
+        names.append(prefix + "repairs")
+    if record.get("parse_failed", record.get("repair_used")):
+        names.append(prefix + "parse_failures")
+    return names
+
+
+def summarize_json_modes() -> Dict[str, dict]:
+    """Generations, repairs and parse failures per JSON mode, from the store's counters."""
+    store = get_cache_store()
+    store.backfill_counters(JSON_MODE_BACKFILL, ITINERARY_CACHE, json_mode_counters)
+    summary: Dict[str, dict] = {}
+    for name, value in store.counters().items():
+        parts = name.split(":")
+        if len(parts) == 3 and parts[0] == "json_mode":
+            bucket = summary.setdefault(parts[1], {"generations": 0, "repairs": 0, "parse_failures": 0})
+            bucket[parts[2]] = value
+    return summary
+
+
+def load_cached_record(cache_key: str) -> Optional[dict]:
+    try:
+        return get_cache_store().get(ITINERARY_CACHE, cache_key)
+    except Exception:
+        return None
+
+
+def append_cache_record(record: dict) -> None:
+    try:
+        get_cache_store().put(ITINERARY_CACHE, record["cache_key"], record, itinerary_group_key_for_record(record))
+    except Exception:
+        pass
+
+
+# ============================================================
+# GEOCODING
+# ============================================================
+class TokenBucket:
+    """
+    Thread-safe token bucket: refills at `rate` tokens per second up to
+    `burst`. acquire() takes one token, sleeping outside the lock until one is
+    due, so waiting threads are served in turn at the configured rate.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def acquire(self) -> float:
+        """Blocks until a token is available; returns the seconds waited."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Going negative reserves a future token, so later callers queue behind this one.
+            self._tokens -= 1
+            wait_sec = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait_sec:
+            time.sleep(wait_sec)
+        return wait_sec
+
+
+@process_singleton
+def get_geocode_limiter() -> TokenBucket:
+    return TokenBucket(GEOCODE_RATE_PER_SEC, GEOCODE_BURST)
+
+
+@process_singleton
+def get_geocode_store() -> GeocodeStore:
+    store = GeocodeStore(GEOCODE_DB, ttl_sec=GEOCODE_TTL_SEC, negative_ttl_sec=GEOCODE_NEGATIVE_TTL_SEC)
+    get_cache_metrics().register_size(GEOCODE_STORE_LAYER, store.size)
+    return store
+
+
+def _retry_after_sec(r: requests.Response, attempt: int) -> float:
+    """Retry-After (seconds form) when the server sent one, else exponential backoff."""
+    try:
+        return max(0.0, float(r.headers.get("Retry-After", "")))
+    except ValueError:
+        return HTTP_RETRY_BACKOFF_SEC * 2 ** attempt
+
+
+def nominatim_search(query: str) -> Optional[Tuple[float, float]]:
+    """
+    One Nominatim search behind the process-wide rate limit; None when nothing
+    matches, request errors raise. Connection errors and HTTP_RETRY_STATUSES
+    are retried up to HTTP_MAX_RETRIES times, each attempt taking its own
+    token and a 429/503 waiting out Retry-After first.
+    """
+    params = {"q": query, "format": "json", "limit": 1}
+    headers = {"User-Agent": "ai-travel-planner-streamlit/6.0"}
+    for attempt in range(HTTP_MAX_RETRIES + 1):
+        get_geocode_limiter().acquire()
+        try:
+            r = get_http_session().get(NOMINATIM_URL, params=params, headers=headers, timeout=30)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == HTTP_MAX_RETRIES:
+                raise
+            time.sleep(HTTP_RETRY_BACKOFF_SEC * 2 ** attempt)
+            continue
+        if r.status_code not in HTTP_RETRY_STATUSES or attempt == HTTP_MAX_RETRIES:
+            break
+        time.sleep(_retry_after_sec(r, attempt))
+    r.raise_for_status()
+    data = r.json()
+    if not data:
+        return None
+    return float(data[0]["lat"]), float(data[0]["lon"])
+
+
+@process_singleton
+def get_resolved_places() -> ResolvedPlaces:
+    """Fuzzy index seeded from every place the geocode store has coordinates for."""
+    resolved = ResolvedPlaces(min_score=RESOLVED_FUZZY_MIN_SCORE)
+    for query, lat, lon in get_geocode_store().found_entries():
+        resolved.add_query(query, (lat, lon))
+    get_cache_metrics().register_size(RESOLVED_FUZZY_LAYER, lambda: {"entries": len(resolved)})
+    return resolved
+
+
+def match_resolved_place(query: str, avoids_network: bool) -> Optional[Tuple[float, float]]:
+    """
+    Coordinates of an already resolved place whose name is close enough to
+    the query's. avoids_network says whether a match saves a Nominatim
+    request (counted as "geocode_fuzzy_avoided") or replaces a cached "not
+    found" (counted as "geocode_fuzzy_rescued").
+    """
+    started = time.perf_counter()
+    match = get_resolved_places().match(query)
+    elapsed = time.perf_counter() - started
+    if not match:
+        get_cache_metrics().record_miss(RESOLVED_FUZZY_LAYER, elapsed)
+        return None
+    get_cache_metrics().record_hit(RESOLVED_FUZZY_LAYER, elapsed)
+    try:
+        get_cache_store().incr_counter("geocode_fuzzy_avoided" if avoids_network else "geocode_fuzzy_rescued")
+    except Exception:
+        pass
+    return match.place.lat, match.place.lon
+
+
+def geocode_persistent(query: str) -> Optional[Tuple[float, float]]:
+    """
+    Geocode through the on-disk store; Nominatim is only asked on a miss or an
+    expired entry. Both found and "not found" answers are stored, request
+    errors propagate and store nothing. Names the store has no coordinates
+    for are first matched against places already resolved for the same
+    destination; fuzzy matches are not stored, so the store stays exact.
+    """
+    store = get_geocode_store()
+    metrics = get_cache_metrics()
+    started = time.perf_counter()
+    known, coords = store.get(query)
+    lookup_sec = time.perf_counter() - started
+    if known:
+        metrics.record_hit(GEOCODE_STORE_LAYER, lookup_sec)
+        return coords or match_resolved_place(query, avoids_network=False)
+    coords = match_resolved_place(query, avoids_network=True)
+    if coords:
+        metrics.record_miss(GEOCODE_STORE_LAYER, lookup_sec)
+        return coords
+    try:
+        coords = nominatim_search(query)
+    except Exception:
+        metrics.record_miss(GEOCODE_STORE_LAYER, lookup_sec)
+        raise
+    metrics.record_miss(GEOCODE_STORE_LAYER, lookup_sec, cost_sec=time.perf_counter() - started - lookup_sec)
+    store.put(query, coords)
+    if coords:
+        get_resolved_places().add_query(query, coords)
+    return coords
+
+
+@process_singleton
+def get_gazetteer() -> Gazetteer:
+    gazetteer = load_gazetteer(GAZETTEER_DIR, GAZETTEER_MIN_SIMILARITY)
+    get_cache_metrics().register_size(
+        GAZETTEER_LAYER, lambda: {"entries": len(gazetteer), "cities": len(gazetteer.cities)}
+    )
+    return gazetteer
+
+
+def geocode_query(query: str) -> Optional[Tuple[float, float]]:
+    """
+    Local gazetteer first; then, with GEOCODE_NETWORK_FALLBACK, the persistent
+    store and Nominatim. Without the fallback an unmatched name is not found.
+    """
+    gazetteer = get_gazetteer()
+    if gazetteer.cities:
+        started = time.perf_counter()
+        coords = gazetteer.geocode(query)
+        if coords:
+            get_cache_metrics().record_hit(GAZETTEER_LAYER, time.perf_counter() - started)
+            return coords
+        get_cache_metrics().record_miss(GAZETTEER_LAYER, time.perf_counter() - started)
+    if not GEOCODE_NETWORK_FALLBACK:
+        return None
+    return geocode_persistent(query)
+
+
+@metered_lru_cache("geocode_destination", maxsize=256)
+def geocode_destination(destination: str):
+    return geocode_query(destination)
+
+
+@metered_lru_cache("geocode_place", maxsize=4096)
+def geocode_place(place_query: str):
+    return geocode_query(place_query)
+
+
+def geocode_batch(
+        queries: Iterable[str],
+        lookup: Callable[[str], Optional[Tuple[float, float]]] = geocode_place,
+        workers: int = GEOCODE_WORKERS
+) -> Dict[str, Optional[Tuple[float, float]]]:
+    """
+    Resolves the distinct queries concurrently. Cached answers come back at
+    once and only network lookups queue on the rate limiter, so a batch takes
+    about (network lookups / GEOCODE_RATE_PER_SEC) rather than the sum of
+    their latencies. Queries whose lookup fails are left out of the result.
+    """
+    pending = list(dict.fromkeys(q for q in queries if q))
+    results: Dict[str, Optional[Tuple[float, float]]] = {}
+    if not pending:
+        return results
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(pending))), thread_name_prefix="geocode") as pool:
+        futures = {pool.submit(lookup, query): query for query in pending}
+        for future in as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception:
+                continue
+    return results
+
+
+# ============================================================
+# LLM ROUTING / OLLAMA
+# ============================================================
+def build_ollama_payload(
+        prompt: str,
+        model_name: str,
+        stream: bool,
+        output_format=None,
+        num_predict: Optional[int] = None
+) -> dict:
+    payload = {
+        "model": model_name,
+        "prompt": prompt,
+        "stream": stream,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": {"num_ctx": OLLAMA_NUM_CTX},
+    }
+    if output_format:
+        payload["format"] = output_format
+    if num_predict:
+        payload["options"]["num_predict"] = int(num_predict)
+    return payload
+
+
+def itinerary_token_budget(days: int, pace: Optional[str] = None) -> int:
+    """Output budget for `days` full itinerary days; pace=None takes the most generous pace."""
+    per_day = ITINERARY_TOKENS_PER_DAY.get(pace, max(ITINERARY_TOKENS_PER_DAY.values()))
+    return min(OLLAMA_NUM_CTX * 3 // 4, ITINERARY_TOKENS_BASE + per_day * max(1, int(days)))
+
+
+def replan_token_budget(n: int) -> int:
+    return REPLAN_TOKENS_BASE + REPLAN_TOKENS_PER_OPTION * max(1, int(n))
+
+
+class LLMRouter:
+    """
+    Sends each request to the fastest healthy endpoint by rolling p50 latency
+    (time to the complete answer, streamed or not).
+    Endpoints whose recent error rate exceeds max_error_rate drop to the back;
+    endpoints never called go first so they get measured, endpoints that have
+    only failed go after every endpoint that has answered. Failed calls fall
+    through to the next endpoint. With hedge_after_sec set, a duplicate goes to
+    the runner-up once the leader is slow and whichever answers first wins;
+    each attempt gets its own thread, so the hedge delay runs from the moment
+    the leader's request actually starts.
+    """
+
+    def __init__(
+            self,
+            endpoints: List[dict],
+            window: int,
+            min_samples: int,
+            max_error_rate: float,
+            hedge_after_sec: Optional[float]
+    ):
+        self.endpoints = list(endpoints)
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.hedge_after_sec = hedge_after_sec
+        self._lock = threading.Lock()
+        self._latency = {e["name"]: deque(maxlen=window) for e in self.endpoints}
+        self._outcomes = {e["name"]: deque(maxlen=window) for e in self.endpoints}
+
+    def record(self, name: str, latency_sec: float, ok: bool) -> None:
+        with self._lock:
+            if ok:
+                self._latency[name].append(latency_sec)
+            self._outcomes[name].append(ok)
+
+    def stats(self) -> Dict[str, dict]:
+        with self._lock:
+            snapshot = {
+                name: (list(self._latency[name]), list(self._outcomes[name]))
+                for name in self._latency
+            }
+
+        result = {}
+        for name, (latencies, outcomes) in snapshot.items():
+            errors = outcomes.count(False)
+            result[name] = {
+                "calls": len(outcomes),
+                "p50": _percentile(latencies, 50),
+                "p95": _percentile(latencies, 95),
+                "error_rate": errors / len(outcomes) if outcomes else 0.0,
+            }
+        return result
+
+    def ranked(self, providers: Optional[Tuple[str, ...]] = None) -> List[dict]:
+        stats = self.stats()
+        candidates = [e for e in self.endpoints if providers is None or e["provider"] in providers]
+
+        def sort_key(endpoint: dict):
+            s = stats[endpoint["name"]]
+            unhealthy = s["calls"] >= self.min_samples and s["error_rate"] > self.max_error_rate
+            if s["p50"] is not None:
+                return unhealthy, 1, s["p50"]
+            # No latency yet: untried endpoints first, ones that have only failed after all that answered.
+            return unhealthy, 2 if s["calls"] else 0, s["calls"]
+
+        return sorted(candidates, key=sort_key)
+
+    def _timed(self, endpoint: dict, fn: Callable[[dict], dict]) -> dict:
+        started = time.perf_counter()
+        try:
+            result = fn(endpoint)
+        except Exception:
+            self.record(endpoint["name"], time.perf_counter() - started, False)
+            raise
+        self.record(endpoint["name"], time.perf_counter() - started, True)
+        return result
+
+    def call(self, fn: Callable[[dict], dict], providers: Optional[Tuple[str, ...]] = None) -> dict:
+        candidates = self.ranked(providers)
+        if not candidates:
+            raise RuntimeError("No LLM endpoint configured for this request.")
+
+        if self.hedge_after_sec is None or len(candidates) < 2:
+            last_error = None
+            for endpoint in candidates:
+                try:
+                    return self._timed(endpoint, fn)
+                except Exception as e:
+                    last_error = e
+            raise last_error
+
+        answers = queue.Queue()
+
+        def attempt(endpoint: dict) -> None:
+            try:
+                answers.put((self._timed(endpoint, fn), None))
+            except Exception as e:
+                answers.put((None, e))
+
+        def launch() -> None:
+            threading.Thread(target=attempt, args=(remaining.pop(0),), name="llm-hedge", daemon=True).start()
+
+        remaining = list(candidates)
+        launch()
+        in_flight, hedged, last_error = 1, False, None
+        while in_flight:
+            try:
+                result, error = answers.get(timeout=None if hedged or not remaining else self.hedge_after_sec)
+            except queue.Empty:
+                launch()
+                in_flight, hedged = in_flight + 1, True
+                continue
+            in_flight -= 1
+            if error is None:
+                return result
+            last_error = error
+            # Both hedged attempts may fail: keep falling through the remaining endpoints.
+            if remaining and not in_flight:
+                launch()
+                in_flight += 1
+        raise last_error
+
+    def stream(
+            self,
+            open_stream: Callable[[dict], Iterator[str]],
+            providers: Optional[Tuple[str, ...]] = None
+    ) -> Iterator[str]:
+        """
+        Streams text pieces from the best endpoint. An endpoint that fails before
+        its first piece is recorded and the next one is tried; once text has
+        arrived the stream stays on that endpoint. Records time to completion,
+        or the error; an abandoned stream records nothing.
+        """
+        candidates = self.ranked(providers)
+        if not candidates:
+            raise RuntimeError("No LLM endpoint configured for this request.")
+
+        last_error = None
+        for endpoint in candidates:
+            started = time.perf_counter()
+            pieces = open_stream(endpoint)
+            try:
+                first = next(pieces, None)
+            except Exception as e:
+                self.record(endpoint["name"], time.perf_counter() - started, False)
+                last_error = e
+                continue
+            break
+        else:
+            raise last_error
+
+        try:
+            if first is not None:
+                yield first
+            yield from pieces
+        except Exception:
+            self.record(endpoint["name"], time.perf_counter() - started, False)
+            raise
+        finally:
+            pieces.close()
+        self.record(endpoint["name"], time.perf_counter() - started, True)
+
+
+@process_singleton
+def get_llm_router() -> LLMRouter:
+    return LLMRouter(
+        LLM_ENDPOINTS,
+        LLM_ROUTER_WINDOW,
+        LLM_ROUTER_MIN_SAMPLES,
+        LLM_ROUTER_MAX_ERROR_RATE,
+        LLM_HEDGE_AFTER_SEC
+    )
+
+
+def generate_on_endpoint(
+        endpoint: dict,
+        prompt: str,
+        model_name: str,
+        output_format=None,
+        context: Optional[List[int]] = None,
+        num_predict: Optional[int] = None
+) -> dict:
+    """One non-streaming call against a single endpoint, returned in Ollama's /api/generate shape."""
+    url = endpoint["url"].rstrip("/")
+
+    if endpoint["provider"] == "ollama":
+        payload = build_ollama_payload(prompt, model_name, False, output_format, num_predict)
+        if context:
+            payload["context"] = context
+        r = get_http_session().post(url + "/api/generate", json=payload, timeout=OLLAMA_TIMEOUT_SEC)
+        if r.status_code != 200:
+            raise RuntimeError(f"Ollama error: {r.status_code} - {r.text}")
+        return r.json()
+
+    headers = {"Content-Type": "application/json"}
+    if endpoint.get("key"):
+        headers["Authorization"] = f"Bearer {endpoint['key']}"
+    body = {"model": endpoint.get("model", model_name), "messages": [{"role": "user", "content": prompt}]}
+    if num_predict:
+        body["max_tokens"] = int(num_predict)
+    # Ollama's format ("json" or a JSON schema) in OpenAI's response_format terms.
+    if output_format == "json":
+        body["response_format"] = {"type": "json_object"}
+    elif isinstance(output_format, dict):
+        body["response_format"] = {
+            "type": "json_schema",
+            "json_schema": {"name": "response", "schema": output_format, "strict": False},
+        }
+    r = get_http_session().post(
+        url + "/v1/chat/completions",
+        headers=headers,
+        json=body,
+        timeout=OLLAMA_TIMEOUT_SEC
+    )
+    if r.status_code != 200:
+        raise RuntimeError(f"{endpoint['name']} error: {r.status_code} - {r.text}")
+    return {"response": r.json()["choices"][0]["message"]["content"]}
+
+
+def ollama_generate(
+        prompt: str,
+        model_name: str,
+        output_format=None,
+        context: Optional[List[int]] = None,
+        num_predict: Optional[int] = None
+) -> dict:
+    """Non-streaming generate call routed to the best endpoint; returns the full response (text, context, eval stats)."""
+    # A trip context is Ollama token state, so only Ollama endpoints can continue it.
+    providers = ("ollama",) if context else None
+    return get_llm_router().call(
+        lambda endpoint: generate_on_endpoint(endpoint, prompt, model_name, output_format, context, num_predict),
+        providers
+    )
+
+
+def call_ollama(prompt: str, model_name: str, output_format=None, num_predict: Optional[int] = None) -> str:
+    return ollama_generate(prompt, model_name, output_format, num_predict=num_predict).get("response", "")
+
+
+def stream_ollama(
+        prompt: str,
+        model_name: str,
+        output_format=None,
+        num_predict: Optional[int] = None
+) -> Iterator[str]:
+    """
+    Yield response text pieces from Ollama's NDJSON stream as they arrive,
+    routed like ollama_generate: an endpoint that fails before the first
+    piece falls through to the next.
+    """
+    yield from get_llm_router().stream(
+        lambda endpoint: stream_on_endpoint(endpoint, prompt, model_name, output_format, num_predict),
+        ("ollama",)
+    )
+
+
+def stream_on_endpoint(
+        endpoint: dict,
+        prompt: str,
+        model_name: str,
+        output_format=None,
+        num_predict: Optional[int] = None
+) -> Iterator[str]:
+    """One streaming /api/generate call against a single Ollama endpoint."""
+    with get_http_session().post(
+        endpoint["url"].rstrip("/") + "/api/generate",
+        json=build_ollama_payload(prompt, model_name, True, output_format, num_predict),
+        timeout=OLLAMA_TIMEOUT_SEC,
+        stream=True
+    ) as r:
+        if r.status_code != 200:
+            raise RuntimeError(f"Ollama error: {r.status_code} - {r.text}")
+        for line in r.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get("error"):
+                raise RuntimeError(f"Ollama error: {chunk['error']}")
+            piece = chunk.get("response", "")
+            if piece:
+                yield piece
+            if chunk.get("done"):
+                break
+
+
+# ============================================================
+# JSON EXTRACTION / VALIDATION
+# ============================================================
+SLOT_ORDER = ["Morning", "Lunch", "Afternoon", "Evening", "Dinner"]
+
+
+DEFAULT_SLOT_WINDOWS = {
+    "Morning": ("08:30", "12:00"),
+    "Lunch": ("12:30", "13:30"),
+    "Afternoon": ("13:45", "17:30"),
+    "Evening": ("18:00", "20:00"),
+    "Dinner": ("20:00", "21:30"),
+}
+
+
+def safe_hhmm(s: str, fallback: str) -> str:
+    if isinstance(s, str) and re.match(r"^\d{2}:\d{2}$", s):
+        return s
+    return fallback
+
+
+def _extract_json_block(text: str) -> Optional[str]:
+    if not text:
+        return None
+
+    m = re.search(r"```json\s*(\{.*?\}|\[.*?\])\s*```", text, flags=re.S)
+    if m:
+        return m.group(1)
+
+    first_brace = text.find("{")
+    first_bracket = text.find("[")
+    if first_brace == -1 and first_bracket == -1:
+        return None
+
+    start = first_brace if first_bracket == -1 else (
+        first_bracket if first_brace == -1 else min(first_brace, first_bracket)
+    )
+    candidate = text[start:].strip()
+    last_curly = candidate.rfind("}")
+    last_square = candidate.rfind("]")
+    cut = max(last_curly, last_square)
+    if cut != -1:
+        candidate = candidate[:cut + 1]
+
+    try:
+        json.loads(candidate)
+    except ValueError:
+        salvaged = _close_truncated_json(text[start:])
+        if salvaged:
+            return salvaged
+    return candidate.strip()
+
+
+def _close_truncated_json(text: str) -> Optional[str]:
+    """
+    Salvage for replies cut off by num_predict: drop the unfinished tail after
+    the last complete value and close the brackets still open. Returns None
+    when the text is not a truncated document (balanced or mismatched brackets).
+    """
+    stack = []
+    in_string = False
+    escape = False
+    cut = None
+
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append(ch)
+        elif ch in "}]":
+            if not stack or (ch == "}") != (stack[-1] == "{"):
+                return None
+            stack.pop()
+            if not stack:
+                return None
+            cut = (i + 1, list(stack))
+        elif ch == "," and stack:
+            cut = (i, list(stack))
+
+    if not stack or cut is None:
+        return None
+
+    end, still_open = cut
+    closers = "".join("}" if c == "{" else "]" for c in reversed(still_open))
+    return text[:end] + closers
+
+
+def validate_and_normalize_itinerary_json(plan: dict, requested_days: int) -> dict:
+    normalized = {"overview": "", "days": []}
+    if not isinstance(plan, dict):
+        raise ValueError("Plan is not a dictionary.")
+
+    overview = plan.get("overview", "")
+    normalized["overview"] = overview if isinstance(overview, str) else ""
+
+    days_list = plan.get("days", [])
+    if not isinstance(days_list, list):
+        raise ValueError("Plan 'days' must be a list.")
+
+    day_map = {}
+    for day_obj in days_list:
+        if not isinstance(day_obj, dict):
+            continue
+
+        try:
+            day_num = int(day_obj.get("day"))
+        except Exception:
+            continue
+
+        if day_num < 1 or day_num > requested_days:
+            continue
+
+        slots = day_obj.get("slots", [])
+        if not isinstance(slots, list):
+            slots = []
+
+        normalized_slots = []
+        seen_names = set()
+
+        for slot in slots:
+            if not isinstance(slot, dict):
+                continue
+
+            slot_name = slot.get("slot", "Morning")
+            if slot_name not in SLOT_ORDER:
+                slot_name = "Morning"
+
+            default_start, default_end = DEFAULT_SLOT_WINDOWS[slot_name]
+            start = safe_hhmm(slot.get("start"), default_start)
+            end = safe_hhmm(slot.get("end"), default_end)
+
+            stops = slot.get("stops", [])
+            if not isinstance(stops, list):
+                stops = []
+
+            cleaned_stops = []
+            for s in stops:
+                if not isinstance(s, dict):
+                    continue
+
+                name = str(s.get("name", "")).strip()
+                if not name or name.lower() in seen_names:
+                    continue
+                seen_names.add(name.lower())
+
+                category = str(s.get("category", "City Highlights")).strip() or "City Highlights"
+                description = str(s.get("description", "")).strip()
+                dur = s.get("duration_min", 60)
+                try:
+                    dur = int(dur)
+                except Exception:
+                    dur = 60
+                dur = max(15, min(dur, 240))
+
+                cleaned_stops.append({
+                    "name": name,
+                    "category": category,
+                    "duration_min": dur,
+                    "description": description
+                })
+
+            normalized_slots.append({
+                "slot": slot_name,
+                "start": start,
+                "end": end,
+                "stops": cleaned_stops
+            })
+
+        slot_map = {s["slot"]: s for s in normalized_slots}
+        ordered_slots = [slot_map[s] for s in SLOT_ORDER if s in slot_map]
+        day_map[day_num] = {"day": day_num, "slots": ordered_slots}
+
+    for d in range(1, requested_days + 1):
+        normalized["days"].append(day_map.get(d, {"day": d, "slots": []}))
+
+    return normalized
+
+
+def parse_and_validate_json_from_llm(raw_text: str, requested_days: int) -> dict:
+    json_text = _extract_json_block(raw_text)
+    if not json_text:
+        raise ValueError("LLM did not return JSON.")
+    plan = json.loads(json_text)
+    return validate_and_normalize_itinerary_json(plan, requested_days)
+
+
+# ============================================================
+# ITINERARY GENERATION
+# ============================================================
+ITINERARY_SCHEMA_EXAMPLE = {
+    "overview": "1-2 sentences about geographic clustering, pacing, and priorities",
+    "days": [
+        {
+            "day": 1,
+            "slots": [
+                {
+                    "slot": "Morning",
+                    "start": "08:30",
+                    "end": "12:00",
+                    "stops": [
+                        {
+                            "name": "Place name",
+                            "category": "City Highlights",
+                            "duration_min": 90,
+                            "description": "Why this stop fits the traveler"
+                        }
+                    ]
+                }
+            ]
+        }
+    ]
+}
+
+
+def json_schema_from_example(example):
+    """Derive a strict JSON schema (every key required) from an example value."""
+    if isinstance(example, dict):
+        return {
+            "type": "object",
+            "properties": {k: json_schema_from_example(v) for k, v in example.items()},
+            "required": list(example.keys())
+        }
+    if isinstance(example, list):
+        return {"type": "array", "items": json_schema_from_example(example[0]) if example else {}}
+    if isinstance(example, bool):
+        return {"type": "boolean"}
+    if isinstance(example, int):
+        return {"type": "integer"}
+    if isinstance(example, float):
+        return {"type": "number"}
+    return {"type": "string"}
+
+
+def itinerary_output_format(schema_example: Optional[dict] = None):
+    if OLLAMA_JSON_MODE == "schema":
+        return json_schema_from_example(schema_example or ITINERARY_SCHEMA_EXAMPLE)
+    if OLLAMA_JSON_MODE == "json":
+        return "json"
+    return None
+
+
+def build_itinerary_prompt(
+        destination: str,
+        days: int,
+        interests: List[str],
+        pace: str,
+        must_visit_locations: List[str]
+) -> str:
+    interest_text = ", ".join(interests) if interests else "General sightseeing"
+    must_visit_text = ", ".join(must_visit_locations) if must_visit_locations else "None"
+
+    return f"""
+You are an expert local travel planner for {destination}.
+
+Create a realistic, high-quality itinerary.
+
+USER PROFILE
+- Destination: {destination}
+- Days: {days}
+- Interests: {interest_text}
+- Pace: {pace}
+- Specific locations the user wants included: {must_visit_text}
+
+MANDATORY RULES
+1) Generate EXACTLY {days} days.
+2) Use real places likely to exist in {destination}.
+3) Do NOT repeat attractions.
+4) Group nearby places together to reduce travel time.
+5) Respect the pace:
+   - Relaxed = fewer stops, longer visits
+   - Balanced = moderate number of stops
+   - Fast-paced = more stops, shorter visits
+6) Include iconic landmarks early unless clearly irrelevant.
+7) Strongly prioritize all user-requested specific locations if provided.
+8) If a user-requested location seems valid, include it whenever geographically and logically feasible.
+9) Lunch and dinner should be realistic food areas or restaurants.
+
+TIME STRUCTURE
+- Morning: 08:30–12:00
+- Lunch: 12:30–13:30
+- Afternoon: 13:45–17:30
+- Evening: 18:00–20:00
+- Dinner: 20:00–21:30
+
+OUTPUT
+- Return ONLY valid JSON
+- No markdown
+- No explanation
+- Follow this schema exactly:
+{json.dumps(ITINERARY_SCHEMA_EXAMPLE, indent=2)}
+""".strip()
+
+
+def repair_itinerary_json_with_ollama(raw: str, days: int, model_name: str) -> Tuple[dict, str]:
+    repair_prompt = f"""
+Return ONLY valid JSON.
+No markdown.
+No explanation.
+
+Fix this travel itinerary into exactly {days} days and this schema:
+{json.dumps(ITINERARY_SCHEMA_EXAMPLE, indent=2)}
+
+Input:
+{raw}
+""".strip()
+    repaired_raw = call_ollama(repair_prompt, model_name, itinerary_output_format(), itinerary_token_budget(days))
+    return parse_and_validate_json_from_llm(repaired_raw, days), repaired_raw
+
+
+def find_near_hit_itinerary(
+        destination: str,
+        days: int,
+        interests: List[str],
+        model_name: str,
+        pace: str,
+        must_visit_locations: List[str]
+) -> Optional[Tuple[dict, dict]]:
+    """
+    Looks for a cached plan in the same near-hit group that can stand in for
+    this request: at least as many days (extra days are cut off) and a superset
+    of the requested interests. With must-visit locations the day count has to
+    match, since cutting days could drop them. Prefers the fewest extra
+    interests, then the fewest extra days. Returns (source record, adapted plan).
+    """
+    group_key = itinerary_group_key(destination, model_name, pace, must_visit_locations)
+    wanted = {i.lower() for i in _normalize_interests(interests)}
+    candidates = []
+
+    for rec in get_cache_store().find_group(ITINERARY_CACHE, group_key):
+        if rec.get("near_hit_of") or not isinstance(rec.get("itinerary_json"), dict):
+            continue
+        cached_days = int(rec.get("days", 0) or 0)
+        if cached_days < days or (must_visit_locations and cached_days != days):
+            continue
+        have = {i.lower() for i in rec.get("interests", [])}
+        if not wanted <= have:
+            continue
+        candidates.append((len(have - wanted), cached_days - days, rec))
+
+    if not candidates:
+        return None
+
+    _, _, source = min(candidates, key=lambda c: (c[0], c[1]))
+    return source, validate_and_normalize_itinerary_json(source["itinerary_json"], days)
+
+
+def save_itinerary_to_cache(
+        cache_key: str,
+        destination: str,
+        days: int,
+        interests: List[str],
+        model_name: str,
+        pace: str,
+        must_visit_locations: List[str],
+        itinerary_json: dict,
+        raw_output: str,
+        repair_used: bool,
+        near_hit_of: Optional[str] = None,
+        generation_sec: Optional[float] = None,
+        geocoded: Optional[dict] = None,
+        parse_failed: Optional[bool] = None
+) -> dict:
+    """
+    Writes a generated itinerary to the cache and counts it under its JSON
+    mode. parse_failed defaults to repair_used: a repair only follows a reply
+    that did not parse, but a streamed reply can fail to parse and still be
+    rebuilt from its days without one.
+    """
+    record = {
+        "cache_key": cache_key,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "destination": destination,
+        "days": int(days),
+        "interests": _normalize_interests(interests),
+        "pace": pace,
+        "must_visit_locations": must_visit_locations,
+        "model": model_name,
+        "llama_raw_output": raw_output,
+        "itinerary_json": itinerary_json,
+        "json_mode": OLLAMA_JSON_MODE,
+        "repair_used": repair_used,
+        "parse_failed": repair_used if parse_failed is None else parse_failed,
+    }
+    if near_hit_of:
+        record["near_hit_of"] = near_hit_of
+    if geocoded:
+        record["geocoded"] = geocoded
+    if generation_sec is not None:
+        # What a later hit on this record saves; also feeds the layer's mean miss cost.
+        record["generation_sec"] = round(generation_sec, 3)
+        get_cache_metrics().record_cost(ITINERARY_CACHE, generation_sec)
+    try:
+        # Seed from the records stored so far before this one is written, so it is counted once.
+        get_cache_store().backfill_counters(JSON_MODE_BACKFILL, ITINERARY_CACHE, json_mode_counters)
+    except Exception:
+        pass
+    append_cache_record(record)
+    try:
+        for name in json_mode_counters(record):
+            get_cache_store().incr_counter(name)
+    except Exception:
+        pass
+    return record
+
+
+def lookup_itinerary_record(
+        cache_key: str,
+        destination: str,
+        days: int,
+        interests: List[str],
+        model_name: str,
+        pace: str,
+        must_visit_locations: List[str],
+        allow_near_hit: bool = True
+) -> Optional[dict]:
+    metrics = get_cache_metrics()
+    started = time.perf_counter()
+    cached = load_cached_record(cache_key)
+    if cached:
+        metrics.record_hit(ITINERARY_CACHE, time.perf_counter() - started, cached.get("generation_sec"))
+        return cached
+    metrics.record_miss(ITINERARY_CACHE, time.perf_counter() - started)
+    if not allow_near_hit:
+        return None
+
+    started = time.perf_counter()
+    try:
+        near_hit = find_near_hit_itinerary(destination, days, interests, model_name, pace, must_visit_locations)
+    except Exception:
+        near_hit = None
+    if not near_hit:
+        metrics.record_miss(ITINERARY_NEAR_HIT_LAYER, time.perf_counter() - started)
+        return None
+
+    source, plan = near_hit
+    metrics.record_hit(ITINERARY_NEAR_HIT_LAYER, time.perf_counter() - started, source.get("generation_sec"))
+    # Saved under the exact key so the next identical request is a plain hit.
+    record = save_itinerary_to_cache(
+        cache_key, destination, days, interests, model_name, pace, must_visit_locations,
+        plan, source.get("llama_raw_output", ""), False, near_hit_of=source["cache_key"],
+        geocoded=source.get("geocoded")
+    )
+    try:
+        get_cache_store().incr_counter("itinerary_near_hits")
+    except Exception:
+        pass
+    return record
+
+
+def generate_itinerary_record(
+        destination: str,
+        days: int,
+        interests: List[str],
+        model_name: str,
+        pace: str,
+        must_visit_locations: List[str],
+        allow_near_hit: bool = True
+) -> Tuple[dict, bool]:
+    """
+    Blocking generation path: cache lookup, then one coalesced Ollama call (plus
+    a repair round-trip when the reply does not validate). Returns
+    (record, from_cache); from_cache is also True when an identical request
+    already in flight produced the record.
+    """
+    cache_key = make_cache_key(destination, days, interests, model_name, pace, must_visit_locations)
+    cached = lookup_itinerary_record(
+        cache_key, destination, days, interests, model_name, pace, must_visit_locations, allow_near_hit
+    )
+    if cached:
+        return cached, True
+
+    def generate() -> dict:
+        # A leader that raced a just-finished identical request reuses its record.
+        existing = load_cached_record(cache_key)
+        if existing:
+            return existing
+
+        started = time.perf_counter()
+        prompt = build_itinerary_prompt(destination, days, interests, pace, must_visit_locations)
+        raw = call_ollama(prompt, model_name, itinerary_output_format(), itinerary_token_budget(days, pace))
+        repair_used = False
+
+        try:
+            itinerary_json = parse_and_validate_json_from_llm(raw, days)
+        except Exception:
+            itinerary_json, raw = repair_itinerary_json_with_ollama(raw, days, model_name)
+            repair_used = True
+
+        return save_itinerary_to_cache(
+            cache_key, destination, days, interests, model_name, pace, must_visit_locations,
+            itinerary_json, raw, repair_used, generation_sec=time.perf_counter() - started
+        )
+
+    return get_single_flight().do(f"itinerary:{cache_key}", generate)
+
+
+def load_itinerary_geocodes(cache_key: str) -> dict:
+    """
+    Coordinates saved with a cached itinerary: {"center": [lat, lon] | None,
+    "stops": {name: [lat, lon] | None}}. None means Nominatim had no match, so
+    the stop is placed approximately; names not in the map were never resolved.
+    """
+    record = load_cached_record(cache_key)
+    return copy.deepcopy(record.get("geocoded") or {}) if record else {}
+
+
+def save_itinerary_geocodes(cache_key: str, geocoded: dict) -> bool:
+    """Merges newly resolved coordinates into the cached record; False when there is no record yet."""
+    record = load_cached_record(cache_key)
+    if not record:
+        return False
+    known = record.get("geocoded") or {}
+    merged = {**known, **geocoded, "stops": {**(known.get("stops") or {}), **(geocoded.get("stops") or {})}}
+    # Records from the store are shared with its hot tier, so save a copy.
+    append_cache_record({**record, "geocoded": merged})
+    return True
+
+
+def itinerary_stop_names(plan: dict) -> List[str]:
+    return [
+        stop["name"]
+        for day in plan.get("days", [])
+        for slot in day.get("slots", [])
+        for stop in slot.get("stops", [])
+        if stop.get("name")
+    ]
+
+
+def geocode_itinerary_stops(
+        destination: str,
+        plan: dict,
+        known: Optional[dict] = None,
+        lookup: Callable[[str], Optional[Tuple[float, float]]] = geocode_place
+) -> dict:
+    """
+    Resolves the destination and every stop with the queries build_day_itinerary
+    uses, keeping entries already in `known`. The stop names are deduplicated
+    and looked up as one geocode_batch. Not found is stored as None (the app
+    places the stop approximately); lookups that fail are left out so a later
+    run retries them.
+    """
+    known = known or {}
+    geocoded = {"stops": dict(known.get("stops") or {})}
+    if "center" in known:
+        geocoded["center"] = known["center"]
+
+    queries = {
+        name: f"{name}, {destination}"
+        for name in itinerary_stop_names(plan)
+        if name not in geocoded["stops"]
+    }
+    center_query = [] if "center" in geocoded else [destination]
+    resolved = geocode_batch(center_query + list(queries.values()), lookup)
+
+    if center_query and destination in resolved:
+        coords = resolved[destination]
+        geocoded["center"] = list(coords) if coords else None
+    for name, query in queries.items():
+        if query in resolved:
+            coords = resolved[query]
+            geocoded["stops"][name] = list(coords) if coords else None
+
+    return geocoded
@@ -0,0 +1,159 @@
+"""
+Multi-process stress check for the cache store.
+
+    python stress_cache_store.py --procs 8 --records 300
+
+1. Builds a legacy JSONL file from unlocked concurrent appends (torn lines
+   included), then has every process open a fresh store and migrate it at
+   the same time: the import must happen exactly once and keep every intact
+   record.
+2. Every process writes overlapping keys (shared raw-output blobs) while
+   reading and compacting; afterwards every key must decode to the content
+   its last writer stored and no blob may be missing or orphaned.
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from cache_store import CacheStore, read_jsonl_tolerant
+
+BLOB_FIELDS = {"itinerary": ("llama_raw_output",)}
+
+
+def make_record(key: str, writer: int) -> dict:
+    raw = f"raw output for {key} " * 40
+    return {"cache_key": key, "writer": writer, "llama_raw_output": raw, "days": [1, 2, 3]}
+
+
+def key_for(i: int) -> str:
+    return hashlib.md5(f"key-{i}".encode("utf-8")).hexdigest()
+
+
+def torn_appender(path: str, writer: int, records: int) -> None:
+    """Appends like the old append_cache_record, but in two write() calls to provoke tearing."""
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+    try:
+        for i in range(records):
+            line = (json.dumps(make_record(f"legacy-{writer}-{i}", writer)) + "\n").encode("utf-8")
+            cut = random.randint(1, len(line) - 1)
+            os.write(fd, line[:cut])
+            time.sleep(0.0002)
+            os.write(fd, line[cut:])
+    finally:
+        os.close(fd)
+
+
+def migrator(db: str, jsonl: str, results) -> None:
+    store = CacheStore(Path(db), blob_fields=BLOB_FIELDS)
+    results.put(store.migrate_jsonl("itinerary", Path(jsonl)))
+
+
+def writer(db: str, writer_id: int, records: int, shared_keys: int, errors) -> None:
+    store = CacheStore(Path(db), blob_fields=BLOB_FIELDS)
+    rng = random.Random(writer_id)
+    try:
+        for i in range(records):
+            # Half the writes hit keys every process writes too.
+            idx = rng.randrange(shared_keys) if i % 2 else shared_keys + writer_id * records + i
+            store.put("itinerary", key_for(idx), make_record(key_for(idx), writer_id))
+            probe = store.get("itinerary", key_for(rng.randrange(shared_keys)))
+            if probe is not None and not probe["llama_raw_output"].startswith("raw output for "):
+                errors.put(f"writer {writer_id}: bad read {probe}")
+            if i % 50 == 0:
+                store.compact("itinerary")
+    except Exception as e:
+        errors.put(f"writer {writer_id}: {type(e).__name__}: {e}")
+
+
+def run_processes(target, args_list) -> None:
+    procs = [mp.Process(target=target, args=args) for args in args_list]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+
+
+def check_migration(tmp: Path, procs: int, records: int) -> bool:
+    jsonl = tmp / "legacy.jsonl"
+    run_processes(torn_appender, [(str(jsonl), w, records) for w in range(procs)])
+    expected = {rec["cache_key"] for rec in read_jsonl_tolerant(jsonl) if rec.get("cache_key")}
+    torn = 0
+    with open(jsonl, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                json.loads(line)
+            except ValueError:
+                torn += 1
+
+    db = tmp / "migrate.sqlite3"
+    results = mp.Queue()
+    run_processes(migrator, [(str(db), str(jsonl), results) for _ in range(procs)])
+    imported = sorted(results.get() for _ in range(procs))
+
+    conn = sqlite3.connect(str(db))
+    migrations = conn.execute("SELECT COUNT(*) FROM migrations").fetchone()[0]
+    stored = {k for (k,) in conn.execute("SELECT cache_key FROM cache_records")}
+    ok = migrations == 1 and stored == expected and imported[-1] == len(expected) and sum(imported) == len(expected)
+    print(f"migration: {procs * records} appends, {torn} torn lines, {len(expected)} intact records recovered, "
+          f"imports per process {imported}, migrations rows {migrations} -> {'OK' if ok else 'FAIL'}")
+    return ok
+
+
+def check_writers(tmp: Path, procs: int, records: int) -> bool:
+    db = tmp / "writers.sqlite3"
+    CacheStore(db, blob_fields=BLOB_FIELDS)
+    errors = mp.Queue()
+    shared_keys = max(1, records // 4)
+
+    started = time.perf_counter()
+    run_processes(writer, [(str(db), w, records, shared_keys, errors) for w in range(procs)])
+    elapsed = time.perf_counter() - started
+
+    problems = []
+    while not errors.empty():
+        problems.append(errors.get())
+
+    store = CacheStore(db, blob_fields=BLOB_FIELDS)
+    decoded = 0
+    for rec in store.iter_records("itinerary"):
+        if rec["llama_raw_output"] != make_record(rec["cache_key"], 0)["llama_raw_output"]:
+            problems.append(f"content mismatch for {rec['cache_key']}")
+        decoded += 1
+
+    conn = sqlite3.connect(str(db))
+    missing = conn.execute("SELECT COUNT(*) FROM record_blobs WHERE hash NOT IN (SELECT hash FROM blobs)").fetchone()[0]
+    orphans = conn.execute("SELECT COUNT(*) FROM blobs WHERE hash NOT IN (SELECT hash FROM record_blobs)").fetchone()[0]
+    integrity = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    if missing or orphans or integrity != "ok":
+        problems.append(f"blobs missing={missing} orphaned={orphans} integrity={integrity}")
+
+    ok = not problems
+    print(f"writers: {procs} processes x {records} puts in {elapsed:.1f}s, {decoded} records decoded "
+          f"-> {'OK' if ok else 'FAIL'}")
+    for problem in problems[:10]:
+        print(f"  {problem}")
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Multi-process stress check for the cache store")
+    parser.add_argument("--procs", type=int, default=8)
+    parser.add_argument("--records", type=int, default=300)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ok = check_migration(Path(tmp), args.procs, args.records)
+        ok = check_writers(Path(tmp), args.procs, args.records) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
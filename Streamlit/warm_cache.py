@@ -0,0 +1,132 @@
+"""
+Offline itinerary cache warm-up.
+
+    python warm_cache.py --destinations "Washington DC" Paris Rome --days 1 2 3 \
+        --pace Relaxed Balanced --interests "City Highlights,Museums" "Food & Drink,Nature & Outdoors"
+
+Each destination x days x pace x interest preset goes through the app's
+blocking generation path (itinerary_engine.generate_itinerary_record) and the
+saved record also gets the coordinates of its destination and stops. Run it
+from the app's directory so it fills the same itinerary_cache/.
+
+--workers bounds the concurrent Ollama generations. The cache is the
+checkpoint: re-running the same command after an interruption skips finished
+plans and only looks up the coordinates that are still missing.
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import product
+from typing import List, Tuple
+
+from itinerary_engine import (
+    DEFAULT_MODEL,
+    append_cache_record,
+    generate_itinerary_record,
+    geocode_itinerary_stops,
+    get_geocode_limiter,
+    itinerary_stop_names,
+    load_cached_record,
+    make_cache_key,
+)
+
+PACES = ["Relaxed", "Balanced", "Fast-paced"]
+DEFAULT_INTERESTS = "City Highlights,Museums"
+# Nominatim's usage policy allows at most one request per second
+MIN_GEOCODE_INTERVAL_SEC = 1.0
+
+
+def parse_presets(values: List[str]) -> List[List[str]]:
+    return [[i.strip() for i in value.split(",") if i.strip()] for value in values]
+
+
+def needs_geocoding(record: dict) -> bool:
+    geocoded = record.get("geocoded") or {}
+    if "center" not in geocoded:
+        return True
+    stops = geocoded.get("stops") or {}
+    return any(name not in stops for name in itinerary_stop_names(record["itinerary_json"]))
+
+
+def warm_one(job: Tuple[str, int, str, List[str]], model_name: str) -> str:
+    destination, days, pace, interests = job
+    cache_key = make_cache_key(destination, days, interests, model_name, pace, [])
+    existing = load_cached_record(cache_key)
+    if existing and not needs_geocoding(existing):
+        return "cached"
+
+    # Warm-up stores real generations, never trimmed copies of other cached plans.
+    record, from_cache = generate_itinerary_record(
+        destination, days, interests, model_name, pace, [], allow_near_hit=False
+    )
+
+    geocoded = geocode_itinerary_stops(destination, record["itinerary_json"], record.get("geocoded"))
+    # Cached records are shared with the store's hot tier, so save a copy.
+    append_cache_record({**record, "geocoded": geocoded})
+    return "geocoded" if from_cache else "generated"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Pre-populate the itinerary cache")
+    parser.add_argument("--destinations", nargs="+", default=[])
+    parser.add_argument("--destinations-file", help="one destination per line")
+    parser.add_argument("--days", type=int, nargs="+", default=[1, 2, 3])
+    parser.add_argument("--pace", nargs="+", choices=PACES, default=["Balanced"])
+    parser.add_argument("--interests", nargs="+", default=[DEFAULT_INTERESTS],
+                        help="comma-separated interest presets")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--workers", type=int, default=2, help="concurrent Ollama generations")
+    parser.add_argument("--geocode-interval", type=float, default=MIN_GEOCODE_INTERVAL_SEC,
+                        help=f"seconds between Nominatim requests (at least {MIN_GEOCODE_INTERVAL_SEC:g})")
+    parser.add_argument("--dry-run", action="store_true", help="list the jobs and whether they are cached")
+    args = parser.parse_args()
+
+    destinations = list(args.destinations)
+    if args.destinations_file:
+        with open(args.destinations_file, "r", encoding="utf-8") as f:
+            destinations += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    if not destinations:
+        parser.error("no destinations given")
+    if args.geocode_interval < MIN_GEOCODE_INTERVAL_SEC:
+        parser.error(f"--geocode-interval must be at least {MIN_GEOCODE_INTERVAL_SEC:g}s (Nominatim usage policy)")
+
+    jobs = list(product(destinations, args.days, args.pace, parse_presets(args.interests)))
+    if args.dry_run:
+        for destination, days, pace, interests in jobs:
+            record = load_cached_record(make_cache_key(destination, days, interests, args.model, pace, []))
+            state = "missing" if not record else ("needs geocoding" if needs_geocoding(record) else "cached")
+            print(f"{state:16} {destination} / {days}d / {pace} / {', '.join(interests)}")
+        return
+
+    # Network geocodes from every worker share the engine's rate limiter; cached answers skip it.
+    get_geocode_limiter().rate = 1.0 / args.geocode_interval
+    counts = {"cached": 0, "generated": 0, "geocoded": 0, "failed": 0}
+    started = time.perf_counter()
+    pool = ThreadPoolExecutor(max_workers=max(1, args.workers), thread_name_prefix="warm-cache")
+    futures = {pool.submit(warm_one, job, args.model): job for job in jobs}
+
+    try:
+        for n, future in enumerate(as_completed(futures), start=1):
+            destination, days, pace, interests = futures[future]
+            try:
+                outcome = future.result()
+            except Exception as e:
+                outcome = "failed"
+                print(f"[{n}/{len(jobs)}] failed     {destination} / {days}d / {pace}: {e}", file=sys.stderr)
+            else:
+                print(f"[{n}/{len(jobs)}] {outcome:10} {destination} / {days}d / {pace} / {', '.join(interests)}")
+            counts[outcome] += 1
+    except KeyboardInterrupt:
+        print("\nInterrupted: finishing in-flight jobs. Re-run the same command to resume.", file=sys.stderr)
+        pool.shutdown(wait=True, cancel_futures=True)
+        sys.exit(130)
+    pool.shutdown()
+
+    summary = ", ".join(f"{k} {v}" for k, v in counts.items())
+    print(f"\n{len(jobs)} jobs in {time.perf_counter() - started:.0f}s: {summary}")
+    sys.exit(1 if counts["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,16 +2,58 @@
 Ollama service — calls local llama3 (or any model) to generate
 a structured JSON travel itinerary, then geocodes every stop.
 """
+import asyncio
+import copy
+import hashlib
 import json
 import re
+import time
 import uuid
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
 
 import httpx
 
 from backend.config import OLLAMA_BASE, OLLAMA_MODEL, OLLAMA_TIMEOUT
-from backend.services.geocoding import geocode
+# Geocoding is the Streamlit engine's (../Streamlit, on the path via run.py):
+# offline gazetteer, the persistent store shared by every app, fuzzy reuse of
+# resolved places and rate-limited Nominatim, each opened on first lookup
+from itinerary_engine import (
+    GAZETTEER_LAYER,
+    GEOCODE_STORE_LAYER,
+    GEOCODE_WORKERS,
+    RESOLVED_FUZZY_LAYER,
+    geocode_query,
+    get_cache_metrics,
+    get_geocode_store,
+)
+
+# Keep the model resident between requests; refresh it during business hours.
+OLLAMA_KEEP_ALIVE = "30m"
+KEEP_WARM_HOURS = (8, 22)          # local time, [start, end)
+KEEP_WARM_INTERVAL_SEC = 600
+
+# Background /api/tags poller state shared by every request
+HEALTH_POLL_SEC = 15
+HEALTH_TTL_SEC = 60
+HEALTH_TIMEOUT_SEC = 3
+health: Dict[str, Any] = {"reachable": False, "models": [], "checked_at": 0.0, "error": ""}
+
+# In-flight generate_itinerary calls, keyed like the Streamlit cache key
+_inflight: Dict[str, "asyncio.Future[Dict[str, Any]]"] = {}
+
+
+class _LeaderCancelled(Exception):
+    """The request generating a shared plan was cancelled; a waiting request takes over."""
+
+# Geocode lookups one plan build keeps in flight at once; only those that reach
+# Nominatim queue on the engine's process-wide rate limit (1 request/sec)
+GEOCODE_CONCURRENCY = GEOCODE_WORKERS
+
+# Cold start (first load at server start) vs warm refresh latency, for /health-style reporting
+warm_stats: Dict[str, Any] = {"model": OLLAMA_MODEL, "cold": None, "warm": [], "error": ""}
+# keep_model_warm / monitor_ollama_health of this serving process (see ensure_background_tasks)
+_background_tasks: List["asyncio.Task[None]"] = []
 
 
 # ── Time helpers ───────────────────────────────────────────────
@@ -47,13 +89,87 @@ def _reschedule(stops: List[Dict], start_str: str = "08:00") -> List[Dict]:
 
 # ── Ollama call ────────────────────────────────────────────────
 
-async def check_ollama() -> bool:
+async def warm_up_model() -> Dict[str, Any]:
+    """Empty generate: loads OLLAMA_MODEL (or refreshes keep_alive) without generating."""
+    started = time.perf_counter()
+    async with httpx.AsyncClient(timeout=OLLAMA_TIMEOUT) as c:
+        r = await c.post(
+            f"{OLLAMA_BASE}/api/generate",
+            json={"model": OLLAMA_MODEL, "prompt": "", "stream": False, "keep_alive": OLLAMA_KEEP_ALIVE},
+        )
+        r.raise_for_status()
+        load_ns = r.json().get("load_duration", 0)
+    result = {
+        "at": datetime.now().isoformat(timespec="seconds"),
+        "latency_sec": round(time.perf_counter() - started, 3),
+        "load_sec": round(load_ns / 1e9, 3),
+    }
+    if warm_stats["cold"] is None:
+        warm_stats["cold"] = result
+    else:
+        warm_stats["warm"] = (warm_stats["warm"] + [result])[-20:]
+    return result
+
+
+async def keep_model_warm() -> None:
+    """
+    Background task (see ensure_background_tasks). Warms up immediately, then
+    re-pings every KEEP_WARM_INTERVAL_SEC while inside KEEP_WARM_HOURS.
+    """
+    while True:
+        start_hour, end_hour = KEEP_WARM_HOURS
+        if warm_stats["cold"] is None or start_hour <= datetime.now().hour < end_hour:
+            try:
+                await warm_up_model()
+                warm_stats["error"] = ""
+            except Exception as e:
+                warm_stats["error"] = str(e)
+        await asyncio.sleep(KEEP_WARM_INTERVAL_SEC if warm_stats["cold"] else 30)
+
+
+async def _probe_ollama() -> None:
     try:
-        async with httpx.AsyncClient(timeout=5) as c:
+        async with httpx.AsyncClient(timeout=HEALTH_TIMEOUT_SEC) as c:
             r = await c.get(f"{OLLAMA_BASE}/api/tags")
-            return r.status_code == 200
-    except Exception:
-        return False
+        reachable = r.status_code == 200
+        models = [m.get("name") for m in r.json().get("models", [])] if reachable else []
+        error = "" if reachable else f"HTTP {r.status_code}"
+    except Exception as e:
+        reachable, models, error = False, [], str(e)
+    health.update(reachable=reachable, models=models, checked_at=time.time(), error=error)
+
+
+async def monitor_ollama_health() -> None:
+    """Background task (see ensure_background_tasks): refreshes `health` every HEALTH_POLL_SEC."""
+    while True:
+        await _probe_ollama()
+        await asyncio.sleep(HEALTH_POLL_SEC)
+
+
+def ensure_background_tasks() -> None:
+    """
+    Starts keep_model_warm() and monitor_ollama_health() in the serving
+    process, from the first request that reaches this service (and again if
+    they have died), so the model stays warm and warm_stats/health describe
+    the process answering requests without any app startup hook.
+    """
+    if _background_tasks and not any(task.done() for task in _background_tasks):
+        return
+    for task in _background_tasks:
+        task.cancel()
+    loop = asyncio.get_running_loop()
+    _background_tasks[:] = [loop.create_task(keep_model_warm()), loop.create_task(monitor_ollama_health())]
+
+
+async def check_ollama() -> bool:
+    """
+    Reads the health monitor's cached state. Only probes inline when the
+    snapshot is older than HEALTH_TTL_SEC (e.g. the monitor task isn't running).
+    """
+    ensure_background_tasks()
+    if time.time() - health["checked_at"] > HEALTH_TTL_SEC:
+        await _probe_ollama()
+    return bool(health["reachable"])
 
 
 def _extract_json(text: str) -> Optional[str]:
@@ -66,15 +182,90 @@ def _extract_json(text: str) -> Optional[str]:
     return text[start:]
 
 
-async def generate_itinerary(
+class _StreamingDayParser:
+    """Returns each object of the top-level "days" array as soon as it closes."""
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        self._stack: List[tuple] = []
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text: str) -> List[Dict]:
+        self.buffer += text
+        buf = self.buffer
+        done: List[Dict] = []
+        for i in range(self._pos, len(buf)):
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"':
+                self._in_string = bool(self._stack)
+            elif ch in "{[":
+                self._stack.append((ch, i))
+            elif ch in "}]" and self._stack:
+                opener, start = self._stack.pop()
+                if ch != "}" or opener != "{" or [c for c, _ in self._stack] != ["{", "["]:
+                    continue
+                try:
+                    obj = json.loads(buf[start : i + 1])
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(obj, dict) and "slots" in obj:
+                    done.append(obj)
+        self._pos = len(buf)
+        return done
+
+
+async def _stream_ollama(prompt: str) -> AsyncIterator[str]:
+    """Yield response pieces from Ollama's NDJSON stream."""
+    async with httpx.AsyncClient(timeout=OLLAMA_TIMEOUT) as client:
+        async with client.stream(
+            "POST",
+            f"{OLLAMA_BASE}/api/generate",
+            json={"model": OLLAMA_MODEL, "prompt": prompt, "stream": True, "keep_alive": OLLAMA_KEEP_ALIVE},
+        ) as r:
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise ValueError(f"Ollama error: {chunk['error']}")
+                if chunk.get("response"):
+                    yield chunk["response"]
+                if chunk.get("done"):
+                    break
+
+
+def _parse_plan(raw: str) -> Dict:
+    json_str = _extract_json(raw)
+    if not json_str:
+        raise ValueError("Ollama returned no JSON. Try regenerating.")
+
+    try:
+        return json.loads(json_str)
+    except json.JSONDecodeError:
+        # trim to last valid brace
+        cut = max(json_str.rfind("}"), json_str.rfind("]"))
+        if cut != -1:
+            return json.loads(json_str[: cut + 1])
+        raise
+
+
+def _build_prompt(
     destination: str,
     days: int,
     interests: List[str],
     manual_places: List[str],
-) -> Dict[str, Any]:
-    """
-    Call Ollama → parse JSON → geocode stops → return structured plan dict.
-    """
+) -> str:
     interest_str = ", ".join(interests) if interests else "General sightseeing"
     manual_block = ""
     if manual_places:
@@ -111,7 +302,7 @@ MANDATORY USER-REQUESTED PLACES (must appear, distribute naturally across days):
         ],
     }
 
-    prompt = f"""You are an expert local travel curator for {destination}.
+    return f"""You are an expert local travel curator for {destination}.
 Create a premium, realistic {days}-day itinerary.
 
 RULES:
@@ -133,164 +324,360 @@ TIME SLOTS:
 OUTPUT: ONLY valid JSON matching this schema exactly, no markdown, no commentary:
 {json.dumps(schema, indent=2)}"""
 
+
+def _request_key(destination: str, days: int, interests: List[str], manual_places: List[str]) -> str:
+    base = {
+        "destination": destination.strip().lower(),
+        "days": int(days),
+        "interests": sorted(i.strip() for i in interests if i and i.strip()),
+        "manual_places": sorted(p.strip().lower() for p in manual_places if p and p.strip()),
+        "model": OLLAMA_MODEL.strip().lower(),
+    }
+    return hashlib.md5(json.dumps(base, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+async def generate_itinerary(
+    destination: str,
+    days: int,
+    interests: List[str],
+    manual_places: List[str],
+) -> Dict[str, Any]:
+    """
+    Call Ollama → parse JSON → geocode stops → return structured plan dict.
+    Identical concurrent requests share one in-flight generation; if the
+    generating request is cancelled (client gone), a waiting one starts over.
+    """
+    ensure_background_tasks()
+    key = _request_key(destination, days, interests, manual_places)
+    pending = _inflight.get(key)
+    while pending is not None:
+        try:
+            return copy.deepcopy(await asyncio.shield(pending))
+        except _LeaderCancelled:
+            pending = _inflight.get(key)
+
+    fut: "asyncio.Future[Dict[str, Any]]" = asyncio.get_running_loop().create_future()
+    _inflight[key] = fut
+    try:
+        result = await _generate_itinerary(destination, days, interests, manual_places)
+    except BaseException as e:
+        fut.set_exception(e if isinstance(e, Exception) else _LeaderCancelled())
+        fut.exception()  # mark retrieved so an unobserved failure doesn't log a warning
+        raise
+    else:
+        fut.set_result(result)
+        return copy.deepcopy(result)
+    finally:
+        _inflight.pop(key, None)
+
+
+async def _generate_itinerary(
+    destination: str,
+    days: int,
+    interests: List[str],
+    manual_places: List[str],
+) -> Dict[str, Any]:
+    prompt = _build_prompt(destination, days, interests, manual_places)
+
     async with httpx.AsyncClient(timeout=OLLAMA_TIMEOUT) as client:
         r = await client.post(
             f"{OLLAMA_BASE}/api/generate",
-            json={"model": OLLAMA_MODEL, "prompt": prompt, "stream": False},
+            json={"model": OLLAMA_MODEL, "prompt": prompt, "stream": False, "keep_alive": OLLAMA_KEEP_ALIVE},
         )
         r.raise_for_status()
         raw = r.json().get("response", "")
 
-    json_str = _extract_json(raw)
-    if not json_str:
-        raise ValueError("Ollama returned no JSON. Try regenerating.")
+    plan = _parse_plan(raw)
+    return await _build_stop_list(plan, destination, days, manual_places)
+
+
+async def stream_itinerary(
+    destination: str,
+    days: int,
+    interests: List[str],
+    manual_places: List[str],
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Streaming variant of generate_itinerary. Yields {"event": "day", "day": {...}}
+    as soon as each day is generated and geocoded, then {"event": "done", "plan": {...}}
+    with the same shape generate_itinerary returns.
+    """
+    ensure_background_tasks()
+    prompt = _build_prompt(destination, days, interests, manual_places)
+    dest_lat, dest_lon = await _resolve_destination(destination)
+
+    parser = _StreamingDayParser()
+    built: Dict[int, Dict] = {}
+    stop_id = 1
+
+    async for piece in _stream_ollama(prompt):
+        for day_obj in parser.feed(piece):
+            try:
+                d = int(day_obj.get("day", 0))
+            except (TypeError, ValueError):
+                continue
+            if d < 1 or d > days or d in built:
+                continue
+            coords_by_query = await _geocode_all(_day_queries(day_obj, d, destination, manual_places))
+            built[d], stop_id = await _build_day(
+                day_obj, d, destination, dest_lat, dest_lon, manual_places, stop_id, coords_by_query
+            )
+            yield {"event": "day", "day": built[d]}
 
     try:
-        plan = json.loads(json_str)
-    except json.JSONDecodeError:
-        # trim to last valid brace
-        cut = max(json_str.rfind("}"), json_str.rfind("]"))
-        if cut != -1:
-            plan = json.loads(json_str[: cut + 1])
-        else:
-            raise
+        overview = _parse_plan(parser.buffer).get("overview", "")
+    except ValueError:
+        overview = ""
 
-    return await _build_stop_list(plan, destination, days, manual_places)
+    for d in range(1, days + 1):
+        if d not in built:
+            built[d] = {"day": d, "stops": [], "total_duration_min": 0, "overview": ""}
+            yield {"event": "day", "day": built[d]}
+
+    yield {
+        "event": "done",
+        "plan": _assemble_plan(destination, days, overview, [built[d] for d in range(1, days + 1)]),
+    }
+
+
+# ── Geocoding ──────────────────────────────────────────────────
+
+async def geocode(query: str) -> Optional[Tuple[float, float]]:
+    """
+    The engine's lookup chain (itinerary_engine.geocode_query), run off the
+    event loop since the store is SQLite and Nominatim is asked with requests.
+    Failed requests are None to the caller and store nothing.
+    """
+    try:
+        return await asyncio.to_thread(geocode_query, query)
+    except Exception:
+        return None
+
+
+def _day_queries(day_obj: Dict, d: int, destination: str, manual_places: List[str]) -> List[str]:
+    """The geocode queries _build_day issues for one day (stops, then day 1's manual places)."""
+    names = [
+        (raw_stop.get("name") or "").strip()
+        for slot in day_obj.get("slots", []) if isinstance(slot, dict)
+        for raw_stop in slot.get("stops", []) if isinstance(raw_stop, dict)
+    ]
+    names = [n for n in names if n]
+    if d == 1 and manual_places:
+        existing = {n.lower() for n in names}
+        names += [mp.strip() for mp in manual_places if mp.strip() and mp.strip().lower() not in existing]
+    return [f"{name}, {destination}" for name in names]
+
+
+async def _geocode_all(queries: List[str]) -> Dict[str, Optional[Tuple[float, float]]]:
+    """
+    Geocodes the distinct queries concurrently, at most GEOCODE_CONCURRENCY at
+    a time; store and gazetteer hits return at once while network lookups
+    wait their turn on the engine's Nominatim rate limit.
+    """
+    unique = list(dict.fromkeys(queries))
+    sem = asyncio.Semaphore(GEOCODE_CONCURRENCY)
+
+    async def one(query: str) -> Optional[Tuple[float, float]]:
+        async with sem:
+            return await geocode(query)
+
+    results = await asyncio.gather(*(one(q) for q in unique))
+    return dict(zip(unique, results))
+
+
+def geocode_cache_stats() -> Dict[str, Any]:
+    """
+    Hit rate and entry counts of the persistent geocode store, plus this
+    process's gazetteer, store and fuzzy-reuse layers, for /health-style reporting.
+    """
+    layers = get_cache_metrics().snapshot()["layers"]
+    return {
+        **get_geocode_store().stats(),
+        "layers": {
+            name: layers[name] for name in (GAZETTEER_LAYER, GEOCODE_STORE_LAYER, RESOLVED_FUZZY_LAYER)
+            if name in layers
+        },
+    }
 
 
 # ── Convert LLM JSON → structured stop list ────────────────────
 
-async def _build_stop_list(
-    plan: Dict,
-    destination: str,
-    days: int,
-    manual_places: List[str],
-) -> Dict[str, Any]:
-    from backend.services.geocoding import jitter as _jitter
+async def _resolve_destination(destination: str) -> Tuple[float, float]:
     dest_coord = await geocode(destination)
     if not dest_coord:
         city = destination.split(",")[0].strip()
         dest_coord = await geocode(city)
     if not dest_coord:
         raise ValueError(f"Could not geocode destination '{destination}'. Check the spelling.")
-    dest_lat, dest_lon = dest_coord
+    return dest_coord[0], dest_coord[1]
 
-    days_out: List[Dict] = []
-    stop_id   = 1
-    days_list = sorted(plan.get("days", []), key=lambda d: int(d.get("day", 0)))
 
-    for d in range(1, days + 1):
-        day_obj = next((x for x in days_list if int(x.get("day", 0)) == d), None)
-        if not day_obj:
-            days_out.append({"day": d, "stops": [], "total_duration_min": 0, "overview": ""})
-            continue
-
-        stops: List[Dict] = []
-        order = 1
-
-        for slot_name in SLOT_ORDER:
-            slot_map = {s["slot"]: s for s in day_obj.get("slots", []) if isinstance(s, dict)}
-            slot = slot_map.get(slot_name, {})
-            win_start, win_end = SLOT_WINDOWS[slot_name]
-            t          = _parse(slot.get("start", win_start))
-            window_end = _parse(slot.get("end",   win_end))
-
-            for raw_stop in slot.get("stops", []):
-                if not isinstance(raw_stop, dict):
-                    continue
-                name = (raw_stop.get("name") or "").strip()
-                if not name:
-                    continue
+async def _build_day(
+    day_obj: Dict,
+    d: int,
+    destination: str,
+    dest_lat: float,
+    dest_lon: float,
+    manual_places: List[str],
+    stop_id: int,
+    coords_by_query: Optional[Dict[str, Optional[Tuple[float, float]]]] = None,
+) -> Tuple[Dict[str, Any], int]:
+    """
+    Schedule one LLM day object. Returns the day dict and the next stop id.
+    Coordinates come from coords_by_query (see _geocode_all); any query it
+    lacks is geocoded inline.
+    """
+    from backend.services.geocoding import jitter as _jitter
 
-                dur = raw_stop.get("duration_min", 75)
-                try:
-                    dur = int(dur)
-                except Exception:
-                    dur = 75
-
-                planned_start  = _fmt(t)
-                end_dt         = t + timedelta(minutes=dur)
-                if end_dt > window_end:
-                    dur    = max(15, int((window_end - t).total_seconds() // 60))
-                    end_dt = t + timedelta(minutes=dur)
-
-                coords = await geocode(f"{name}, {destination}")
-                if coords:
-                    lat, lon = coords[0], coords[1]
-                else:
-                    lat, lon = _jitter(dest_lat, dest_lon, stop_id)
-
-                stops.append({
-                    "id":            f"stop_{stop_id}",
-                    "name":          name,
-                    "lat":           lat,
-                    "lon":           lon,
-                    "category":      (raw_stop.get("category") or "Sightseeing").strip(),
-                    "description":   (raw_stop.get("description") or "").strip(),
-                    "duration_min":  dur,
-                    "planned_start": planned_start,
-                    "planned_end":   _fmt(end_dt),
-                    "day":           d,
-                    "visit_order":   order,
-                    "priority":      int(raw_stop.get("priority", 4)),
-                    "rating":        float(raw_stop.get("rating", 4.5)),
-                    "is_manual":     False,
-                    "status":        "pending",
-                    "checked_in":    False,
-                })
-                stop_id += 1
-                order   += 1
-                t        = end_dt + timedelta(minutes=12)
-                if t >= window_end:
-                    break
+    async def locate(query: str) -> Optional[Tuple[float, float]]:
+        if coords_by_query is not None and query in coords_by_query:
+            return coords_by_query[query]
+        return await geocode(query)
+
+    stops: List[Dict] = []
+    order = 1
+
+    for slot_name in SLOT_ORDER:
+        slot_map = {s["slot"]: s for s in day_obj.get("slots", []) if isinstance(s, dict)}
+        slot = slot_map.get(slot_name, {})
+        win_start, win_end = SLOT_WINDOWS[slot_name]
+        t          = _parse(slot.get("start", win_start))
+        window_end = _parse(slot.get("end",   win_end))
+
+        for raw_stop in slot.get("stops", []):
+            if not isinstance(raw_stop, dict):
+                continue
+            name = (raw_stop.get("name") or "").strip()
+            if not name:
+                continue
+
+            dur = raw_stop.get("duration_min", 75)
+            try:
+                dur = int(dur)
+            except Exception:
+                dur = 75
+
+            planned_start  = _fmt(t)
+            end_dt         = t + timedelta(minutes=dur)
+            if end_dt > window_end:
+                dur    = max(15, int((window_end - t).total_seconds() // 60))
+                end_dt = t + timedelta(minutes=dur)
+
+            coords = await locate(f"{name}, {destination}")
+            if coords:
+                lat, lon = coords[0], coords[1]
+            else:
+                lat, lon = _jitter(dest_lat, dest_lon, stop_id)
+
+            stops.append({
+                "id":            f"stop_{stop_id}",
+                "name":          name,
+                "lat":           lat,
+                "lon":           lon,
+                "category":      (raw_stop.get("category") or "Sightseeing").strip(),
+                "description":   (raw_stop.get("description") or "").strip(),
+                "duration_min":  dur,
+                "planned_start": planned_start,
+                "planned_end":   _fmt(end_dt),
+                "day":           d,
+                "visit_order":   order,
+                "priority":      int(raw_stop.get("priority", 4)),
+                "rating":        float(raw_stop.get("rating", 4.5)),
+                "is_manual":     False,
+                "status":        "pending",
+                "checked_in":    False,
+            })
+            stop_id += 1
+            order   += 1
+            t        = end_dt + timedelta(minutes=12)
+            if t >= window_end:
+                break
+
+    # Inject manual places on day 1 if not already present
+    if d == 1 and manual_places:
+        existing = {s["name"].lower() for s in stops}
+        for mp in manual_places:
+            mp = mp.strip()
+            if not mp or mp.lower() in existing:
+                continue
+            coords = await locate(f"{mp}, {destination}")
+            if coords:
+                lat, lon = coords[0], coords[1]
+            else:
+                lat, lon = _jitter(dest_lat, dest_lon, stop_id)
+            stops.append({
+                "id":            f"stop_{stop_id}",
+                "name":          mp,
+                "lat":           lat,
+                "lon":           lon,
+                "category":      "Your Pick",
+                "description":   "Hand-picked by you — must visit!",
+                "duration_min":  60,
+                "planned_start": "17:30",
+                "planned_end":   "18:30",
+                "day":           1,
+                "visit_order":   order,
+                "priority":      5,
+                "rating":        5.0,
+                "is_manual":     True,
+                "status":        "pending",
+                "checked_in":    False,
+            })
+            stop_id += 1
+            order   += 1
+
+    total = sum(s["duration_min"] for s in stops)
+    day_out = {
+        "day":               d,
+        "day_theme":         day_obj.get("day_theme", f"Day {d}"),
+        "stops":             stops,
+        "total_duration_min": total,
+        "overview":          day_obj.get("day_theme", ""),
+    }
+    return day_out, stop_id
 
-        # Inject manual places on day 1 if not already present
-        if d == 1 and manual_places:
-            existing = {s["name"].lower() for s in stops}
-            for mp in manual_places:
-                mp = mp.strip()
-                if not mp or mp.lower() in existing:
-                    continue
-                coords = await geocode(f"{mp}, {destination}")
-                if coords:
-                    lat, lon = coords[0], coords[1]
-                else:
-                    lat, lon = _jitter(dest_lat, dest_lon, stop_id)
-                stops.append({
-                    "id":            f"stop_{stop_id}",
-                    "name":          mp,
-                    "lat":           lat,
-                    "lon":           lon,
-                    "category":      "Your Pick",
-                    "description":   "Hand-picked by you — must visit!",
-                    "duration_min":  60,
-                    "planned_start": "17:30",
-                    "planned_end":   "18:30",
-                    "day":           1,
-                    "visit_order":   order,
-                    "priority":      5,
-                    "rating":        5.0,
-                    "is_manual":     True,
-                    "status":        "pending",
-                    "checked_in":    False,
-                })
-                stop_id += 1
-                order   += 1
-
-        total = sum(s["duration_min"] for s in stops)
-        days_out.append({
-            "day":               d,
-            "day_theme":         day_obj.get("day_theme", f"Day {d}"),
-            "stops":             stops,
-            "total_duration_min": total,
-            "overview":          day_obj.get("day_theme", ""),
-        })
 
+def _assemble_plan(destination: str, days: int, overview: str, days_out: List[Dict]) -> Dict[str, Any]:
     return {
         "destination": destination,
         "days":        days,
-        "overview":    plan.get("overview", ""),
+        "overview":    overview,
         "plan":        days_out,
         "generated_at": datetime.utcnow().isoformat(),
         "cached":      False,
     }
+
+
+async def _build_stop_list(
+    plan: Dict,
+    destination: str,
+    days: int,
+    manual_places: List[str],
+) -> Dict[str, Any]:
+    days_list = sorted(plan.get("days", []), key=lambda d: int(d.get("day", 0)))
+    day_objs = {d: next((x for x in days_list if int(x.get("day", 0)) == d), None) for d in range(1, days + 1)}
+
+    # Every stop and manual place of the plan is geocoded up front, alongside the destination.
+    queries = [
+        q for d, day_obj in day_objs.items() if day_obj
+        for q in _day_queries(day_obj, d, destination, manual_places)
+    ]
+    (dest_lat, dest_lon), coords_by_query = await asyncio.gather(
+        _resolve_destination(destination), _geocode_all(queries)
+    )
+
+    days_out: List[Dict] = []
+    stop_id   = 1
+
+    for d in range(1, days + 1):
+        day_obj = day_objs[d]
+        if not day_obj:
+            days_out.append({"day": d, "stops": [], "total_duration_min": 0, "overview": ""})
+            continue
+
+        day_out, stop_id = await _build_day(
+            day_obj, d, destination, dest_lat, dest_lon, manual_places, stop_id, coords_by_query
+        )
+        days_out.append(day_out)
+
+    return _assemble_plan(destination, days, plan.get("overview", ""), days_out)
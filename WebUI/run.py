@@ -5,9 +5,21 @@ Run: python run.py
 Then: cd client && pnpm install && pnpm dev   (opens http://localhost:5173)
 Or build: cd client && pnpm build            (serves from http://localhost:8000)
 """
+import asyncio
+import os
+import sys
+from pathlib import Path
+
 import uvicorn
 
+# Geocoding (gazetteer, shared geocode store, Nominatim) comes from the Streamlit
+# app's itinerary_engine; this process and the server it starts import it from here
+STREAMLIT_DIR = str(Path(__file__).resolve().parent.parent / "Streamlit")
+
 if __name__ == "__main__":
+    sys.path.insert(0, STREAMLIT_DIR)
+    os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, [STREAMLIT_DIR, os.environ.get("PYTHONPATH")]))
+
     print("\n🧭  WanderAI — AI Travel Planner")
     print("    API  → http://localhost:8000/docs")
     print("\n    Prerequisites:")
@@ -15,4 +27,13 @@ if __name__ == "__main__":
     print("    $ ollama pull llama3")
     print("\n    Frontend (separate terminal):")
     print("    $ cd client && pnpm install && pnpm dev\n")
+
+    # Load the model before the first request instead of during it; the serving
+    # process keeps it warm from its first request on (ensure_background_tasks)
+    from backend.services.ollama import warm_up_model, OLLAMA_MODEL
+    try:
+        cold = asyncio.run(warm_up_model())
+        print(f"    Model {OLLAMA_MODEL} warm (cold start {cold['latency_sec']:.1f}s)\n")
+    except Exception as e:
+        print(f"    Model warm-up skipped: {e}\n")
     uvicorn.run("backend.main:app", host="0.0.0.0", port=8000, reload=True, log_level="info")